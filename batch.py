@@ -0,0 +1,180 @@
+import io
+import os
+import json
+import time
+import argparse
+import contextlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+import interface
+import pre_processing
+import processing
+import post_processing
+import export
+
+'''
+Batch mode runs many conversations through the same pipeline as vmd.py, one conversation per worker process.
+Workers return compact per-utterance results instead of figures, so nothing blocks on a plot window and
+the parent only has to collect plain lists. With --plot_dir, the parent hands each result to a pool of
+plot renderers as soon as it arrives, so plotting overlaps with the conversations still being analysed;
+with --export_dir, results are likewise appended to the export tables as they arrive.
+'''
+
+def analyse_conversation(conversation_id, args):
+    '''
+    Run one conversation end to end: decode, extract features, build conversations and analyse them.
+
+    Args:
+    conversation_id (str): Label used to identify the conversation in the results.
+    args (argparse.Namespace): Parsed command-line arguments, with 'audio_list' pointing to the conversation.
+
+    Returns:
+    result (dict): Compact results per feature, the error message if the conversation failed,
+    and the wall-clock and CPU time spent by the worker.
+    '''
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    result = {'conversation_id': conversation_id, 'audio_list': args.audio_list, 'error': None,
+              'analyses': [], 'features': {}}
+    try:
+        # Keep the per-stage progress messages of each worker from interleaving on the terminal
+        with contextlib.redirect_stdout(io.StringIO()):
+            options = interface.construct_analysis_options(args)
+            feature_matrices = pre_processing.get_features(options)
+            feature_matrices = pre_processing.clean_up(options, feature_matrices)
+            utterance_matrices = pre_processing.get_utterance_matrices(options, feature_matrices)
+            if options.joint_on:
+                joint_conversation = pre_processing.get_joint_conversation(options, utterance_matrices)
+                processing.analyse_joint(options, joint_conversation)
+                rich_conversations = joint_conversation.conversations()
+            else:
+                conversations = pre_processing.get_conversations(options, utterance_matrices)
+                rich_conversations = pre_processing.enrich_conversations(conversations)
+                processing.extract_analyses(options, rich_conversations)
+        result['analyses'] = [a for a, is_on in options.requested_analyses.items() if is_on]
+        # Conversations come out in the same order as the feature matrices they were built from
+        for feature, c in zip(feature_matrices.keys(), rich_conversations):
+            result['features'][feature] = summarize_conversation(c)
+    except (Exception, SystemExit) as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['wall_time'] = time.perf_counter() - start_wall
+    result['cpu_time'] = time.process_time() - start_cpu
+    return result
+
+def summarize_conversation(conversation):
+    '''
+    Reduce an analysed Conversation to plain columns that are cheap to send back from a worker.
+    '''
+    u = conversation.utterances
+    return {'speaker_id': u.speaker_ids.tolist(), 'start_time': u.start_times.tolist(),
+            'end_time': u.end_times.tolist(), 'value': u.values.tolist(),
+            'p2r': [None if np.isnan(x) else x for x in u.p2r.tolist()],
+            'r2r': [None if np.isnan(x) else x for x in u.r2r.tolist()]}
+
+def submit_plots(renderer, result):
+    '''
+    Queue the plots of one conversation's results on a post_processing.PlotRenderer.
+    '''
+    for feature, columns in result['features'].items():
+        for analysis in result['analyses']:
+            series = processing.split_by_speaker(columns['speaker_id'], columns['start_time'], columns[analysis])
+            renderer.submit(series, analysis, f"{result['conversation_id']}_{feature}")
+
+def export_result(exporter, result):
+    '''
+    Append one conversation's results to the tables of an export.ResultsExporter.
+    '''
+    for feature, columns in result['features'].items():
+        exporter.add(result['conversation_id'], feature, columns, result['analyses'])
+
+def run_batch(entries, args, jobs, on_result=None):
+    '''
+    Analyse every conversation in the manifest, fanning them out over a pool of worker processes.
+
+    Args:
+    entries (list): (conversation_id, audio_list) tuples.
+    args (argparse.Namespace): Parsed command-line arguments shared by every conversation.
+    jobs (int): Number of worker processes; 1 runs everything in this process.
+    on_result (function): If given, called with each result as soon as it is collected.
+
+    Returns:
+    results (list): One result per entry, in manifest order.
+    '''
+    conversation_args = []
+    for conversation_id, audio_list in entries:
+        c_args = argparse.Namespace(**vars(args))
+        c_args.audio_list = audio_list
+        conversation_args.append((conversation_id, c_args))
+    results = []
+    if jobs == 1:
+        for a in conversation_args:
+            results.append(analyse_conversation(*a))
+            if on_result is not None:
+                on_result(results[-1])
+        return results
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(analyse_conversation, *a) for a in conversation_args]
+        # Collect in submission order so the output does not depend on scheduling
+        for (conversation_id, c_args), future in zip(conversation_args, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # A worker that dies outright only loses its own conversation
+                results.append({'conversation_id': conversation_id, 'audio_list': c_args.audio_list,
+                                'error': f"{type(e).__name__}: {e}", 'analyses': [], 'features': {},
+                                'wall_time': 0.0, 'cpu_time': 0.0})
+            if on_result is not None:
+                on_result(results[-1])
+    return results
+
+def print_summary(results, wall_time, jobs):
+    failed = 0
+    for r in results:
+        if r['error'] is not None:
+            failed += 1
+            print(f"❌ {r['conversation_id']}: {r['error']}")
+        else:
+            turns = sum(len(f['speaker_id']) for f in r['features'].values())
+            print(f"✅ {r['conversation_id']}: {turns} utterances in {r['wall_time']:.2f}s")
+    cpu_time = sum(r['cpu_time'] for r in results)
+    print("----------------------------")
+    print(f"Conversations: {len(results)} ({failed} failed) on {jobs} worker(s)")
+    print(f"Wall-clock time: {wall_time:.2f}s")
+    print(f"CPU time: {cpu_time:.2f}s")
+    if wall_time > 0:
+        speedup = cpu_time/wall_time
+        print(f"Speed-up: {speedup:.2f}x ({100*speedup/jobs:.0f}% of {jobs} worker(s))")
+
+if __name__ == '__main__':
+    args = interface.setup_batch_parser()
+    entries = interface.parse_manifest(args.manifest)
+    jobs = args.jobs if args.jobs else os.cpu_count()
+    jobs = max(1, min(jobs, len(entries)))
+
+    print(f"⏳ Analysing {len(entries)} conversations...")
+    start = time.perf_counter()
+    renderer = None
+    exporter = None
+    if args.plot_dir:
+        renderer = post_processing.PlotRenderer(args.plot_dir, args.plot_format if args.plot_format else interface.PLOT_FORMATS[0])
+    if args.export_dir:
+        exporter = export.ResultsExporter(args.export_dir, args.export_format if args.export_format else interface.EXPORT_FORMATS[0],
+                                          args.rolling_turns, args.rolling_seconds, args.pairwise)
+    def on_result(result):
+        if renderer is not None:
+            submit_plots(renderer, result)
+        if exporter is not None:
+            export_result(exporter, result)
+    results = run_batch(entries, args, jobs, on_result)
+    if renderer is not None:
+        print(f"Saved {len(renderer.close())} plots to {args.plot_dir}")
+    if exporter is not None:
+        exporter.close()
+        print(f"Exported results to {args.export_dir}")
+    wall_time = time.perf_counter() - start
+
+    print_summary(results, wall_time, jobs)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f)
@@ -0,0 +1,863 @@
+import io
+import os
+import sys
+import json
+import platform
+import tempfile
+import contextlib
+import subprocess
+import timeit
+import argparse
+import tracemalloc
+import pickle
+import numpy as np
+import librosa
+import soundfile as sf
+
+import interface
+import incremental
+import pre_processing
+import processing
+import overlay
+import profiling
+import shared_store
+import rolling
+import voice_activity
+from conversation_model import Utterance, UtteranceMatrix, Conversation
+from concurrent.futures import ProcessPoolExecutor
+
+'''
+Micro-benchmarks for the pipeline stages. Run all of them with `python benchmark.py`,
+or pick some by name, e.g. `python benchmark.py downsample`. The 'stages' benchmark times every
+stage of the pipeline on a synthetic conversation and can write its results as JSON, e.g.
+`python benchmark.py stages --speakers 4 --duration 600 --json stages.json`, to compare commits.
+'''
+
+# Frames per speaker for a 4-minute track at 22050 Hz with HOP_LENGTH 256
+FRAMES_PER_TRACK = 240*22050//pre_processing.HOP_LENGTH + 1
+
+# Reference implementations, kept as they were before being vectorized
+
+def downsample_loop(data, window_size):
+    downsampled = []
+    for i in range(0, len(data), window_size):
+        chunk = data[i:i+window_size]
+        non_zero_chunk = [i for i in chunk if i > 0]
+        if len(non_zero_chunk) > 0:
+            downsampled.append(sum(non_zero_chunk) / len(non_zero_chunk))
+        else:
+            downsampled.append(0)
+    return downsampled
+
+def prompt_to_response_loop(conversation):
+    for i, u in enumerate(conversation.utterances):
+        if (u.speaker_id == -1) or (i == 0): continue
+        prev_nz_value = -1
+        for j in range(i-1, 0, -1):
+            jth_value = conversation.utterances[j].value
+            if (jth_value > 0):
+                prev_nz_value = jth_value
+                break
+        if (prev_nz_value == -1): continue
+        conversation.utterances[i].p2r = prev_nz_value/u.value
+    return conversation
+
+def response_to_response_loop(conversation):
+    for i, u in enumerate(conversation.utterances):
+        if (i < 3): continue
+        sid = u.speaker_id
+        curr_value_0 = u.value
+        prev_value_0 = -1
+        for j in range(i-1, 0, -1):
+            if (conversation.utterances[j].speaker_id == sid):
+                prev_value_0 = conversation.utterances[j].value
+                break
+        if (prev_value_0 == -1.0): continue
+        prompt_utterance = conversation.utterances[i-1]
+        sid = prompt_utterance.speaker_id
+        curr_value_1 = prompt_utterance.value
+        prev_value_1 = -1
+        for j in range(i-2, 0, -1):
+            if (conversation.utterances[j].speaker_id == sid):
+                prev_value_1 = conversation.utterances[j].value
+                break
+        if (prev_value_1 == -1.0): continue
+        conversation.utterances[i].r2r = (curr_value_0/prev_value_0)/(curr_value_1/prev_value_1)
+    return conversation
+
+def utterance_matrix_objects(feature_matrix, window_size):
+    utterance_matrix = []
+    for i, features in enumerate(feature_matrix):
+        utterances = []
+        for j, value in enumerate(features):
+            start_time = j*window_size
+            utterances.append(Utterance(value, i, start_time, start_time + window_size))
+        utterance_matrix.append(utterances)
+    return utterance_matrix
+
+def summarize_speakers_objects(utterances, window_size):
+    summarized_utterances = []
+    s_utterance = utterances[0]
+    for utterance in utterances[1:]:
+        if utterance.speaker_id != s_utterance.speaker_id:
+            summarized_utterances.append(s_utterance)
+            s_utterance = utterance
+        else:
+            n = s_utterance.length/window_size
+            new_value = (s_utterance.value*n + utterance.value)/(n+1)
+            s_utterance = Utterance(new_value, s_utterance.speaker_id, s_utterance.start_time,
+                                    s_utterance.end_time + window_size)
+    return summarized_utterances
+
+def get_conversations_loop(options, utterance_matrices):
+    conversations = []
+    for key, matrix_object in utterance_matrices.items():
+        matrix = matrix_object.utterance_matrix
+        max_length = max(len(list) for list in matrix)
+        for list in matrix:
+            if len(list) == max_length:
+                loudest_utterances = list.copy()
+                break
+        for list in matrix:
+            for i, u in enumerate(list):
+                if loudest_utterances[i].value < u.value:
+                    loudest_utterances[i] = u
+                elif loudest_utterances[i].value == u.value == 0:
+                    loudest_utterances[i] = Utterance(0, -1, loudest_utterances[i].start_time, loudest_utterances[i].end_time)
+        conversation_length = len(loudest_utterances)*options.u_length
+        conversation = Conversation(conversation_length, loudest_utterances, options.u_length)
+        conversation.summarize_speakers()
+        conversations.append(conversation)
+    return conversations
+
+def gate_silence_loop(data):
+    return np.array([x if x >= pre_processing.RMS_THRESHOLD else 0 for x in data])
+
+def separate_passes(y, sr):
+    # volume, pitch and cadence each framing the signal on their own
+    volume = pre_processing.gate_silence(librosa.feature.rms(y=y, frame_length=pre_processing.FRAME_LENGTH,
+                                                             hop_length=pre_processing.HOP_LENGTH)[0])
+    pitch = pre_processing.autocorrelation_pitch_frames(y, sr)
+    rms = librosa.feature.rms(y=y, frame_length=pre_processing.FRAME_LENGTH, hop_length=pre_processing.HOP_LENGTH)[0]
+    cadence = pre_processing.cadence_frames(rms, sr)
+    return {'volume': volume, 'pitch': pitch, 'cadence': cadence}
+
+def whole_track_mixdown(paths, output_path):
+    '''
+    Mixdown that decodes every track whole before summing, like overlaying AudioSegments.
+    '''
+    tracks = [sf.read(path, dtype='float32', always_2d=True)[0] for path in paths]
+    mix = tracks[0].copy()
+    for track in tracks[1:]:
+        n = min(len(mix), len(track))
+        mix[:n] += track[:n]
+    sf.write(output_path, np.clip(mix, -1, 1), sf.info(paths[0]).samplerate, subtype=sf.info(paths[0]).subtype)
+
+def rolling_refit(speaker_ids, start_times, values, turns):
+    '''
+    Rolling p2r statistics per speaker pair, refitting each window from scratch after every turn.
+    '''
+    prompters = np.concatenate(([-1], speaker_ids[:-1]))
+    statistics = []
+    for i in range(len(values)):
+        if np.isnan(values[i]):
+            continue
+        pair = np.flatnonzero((prompters[:i+1] == prompters[i]) & (speaker_ids[:i+1] == speaker_ids[i])
+                              & ~np.isnan(values[:i+1]))[-turns:]
+        y = values[pair]
+        slope = np.polyfit(start_times[pair], y, 1)[0] if len(pair) > 1 else np.nan
+        statistics.append((len(pair), y.mean(), y.var(), slope))
+    return statistics
+
+def pairwise_loop(speaker_ids, values):
+    '''
+    Mean p2r per (prompter, responder) pair, masking the utterances of each pair in turn.
+    '''
+    p2r = processing.prompt_to_response_ratios(speaker_ids, values)
+    prompters = speaker_ids[np.maximum(processing.prompt_indices(values), 0)]
+    ids = processing.ordered_unique(speaker_ids[speaker_ids != -1])
+    means = np.full((len(ids), len(ids)), np.nan)
+    for i, prompter in enumerate(sorted(ids)):
+        for j, responder in enumerate(sorted(ids)):
+            mask = (prompters == prompter) & (speaker_ids == responder) & np.isfinite(p2r)
+            if mask.any():
+                means[i, j] = p2r[mask].mean()
+    return means
+
+# Helpers
+
+def synthetic_frames(n_frames, silence_ratio=0.4, seed=0):
+    '''
+    Build an RMS-like float32 frame series where roughly 'silence_ratio' of the frames are zero.
+    '''
+    rng = np.random.default_rng(seed)
+    data = rng.uniform(0.1, 0.6, n_frames).astype(np.float32)
+    data[rng.random(n_frames) < silence_ratio] = 0
+    return data
+
+def synthetic_turns(n_turns, n_speakers=3, seed=0):
+    '''
+    Build (speaker_ids, values) for 'n_turns' turns where no speaker takes two turns in a row.
+    '''
+    rng = np.random.default_rng(seed)
+    # Adding 1..n_speakers-1 modulo n_speakers always moves to a different speaker
+    steps = rng.integers(1, n_speakers, n_turns)
+    steps[0] = 0
+    speaker_ids = np.cumsum(steps) % n_speakers
+    values = rng.uniform(0.1, 0.6, n_turns)
+    return speaker_ids, values
+
+def synthetic_conversation(speaker_ids, values, window_size=3):
+    utterances = [Utterance(float(v), int(s), i*window_size, (i+1)*window_size)
+                  for i, (s, v) in enumerate(zip(speaker_ids, values))]
+    return Conversation(len(utterances)*window_size, utterances, window_size)
+
+def synthetic_recording(path, minutes, sampling_rate=44100, seed=0):
+    '''
+    Write a 16-bit WAV of noisy tone bursts, one second on and one second off, written in blocks.
+    '''
+    rng = np.random.default_rng(seed)
+    t = np.arange(sampling_rate)/sampling_rate
+    tone = (0.4*np.sin(2*np.pi*150*t)).astype(np.float32)
+    with sf.SoundFile(path, "w", sampling_rate, 1, subtype='PCM_16') as f:
+        for second in range(int(minutes*60)):
+            noise = 0.005*rng.standard_normal(sampling_rate).astype(np.float32)
+            f.write(noise + tone if second % 2 == 0 else noise)
+
+def synthetic_voice(seconds, sampling_rate=22050, voiced_ratio=0.75, seed=0):
+    '''
+    Harmonic, voice-like signal whose fundamental glides between 100 and 250 Hz, voiced for 'voiced_ratio'
+    of every 4 seconds.
+
+    Returns:
+    y (np.ndarray): The signal.
+    f0 (function): True fundamental frequency at given times in seconds, 0 during pauses.
+    '''
+    rng = np.random.default_rng(seed)
+    def f0(t):
+        voiced = (t % 4) < 4*voiced_ratio
+        return np.where(voiced, 175 + 75*np.sin(2*np.pi*t/7), 0)
+    t = np.arange(int(seconds*sampling_rate))/sampling_rate
+    phase = 2*np.pi*np.cumsum(175 + 75*np.sin(2*np.pi*t/7))/sampling_rate
+    harmonics = sum(0.5**k*np.sin((k + 1)*phase) for k in range(5))
+    y = 0.3*harmonics*(f0(t) > 0) + 0.005*rng.standard_normal(len(t))
+    return y.astype(np.float32), f0
+
+def synthetic_turn_taking(n_speakers, duration, mean_turn=3.0, silence_ratio=0.3, turn_taking='random', seed=0):
+    '''
+    Timeline of a conversation: turns of exponentially distributed length, separated by pauses sized so
+    that roughly 'silence_ratio' of the time nobody speaks.
+
+    Args:
+    turn_taking (str): 'random' hands the turn to any other speaker, 'round_robin' to the next one.
+
+    Returns:
+    turns (np.ndarray): (speaker_id, start_time, end_time) rows, in time order.
+    '''
+    rng = np.random.default_rng(seed)
+    mean_pause = mean_turn*silence_ratio/(1 - silence_ratio) if silence_ratio < 1 else duration
+    turns = []
+    t = rng.exponential(mean_pause) if mean_pause > 0 else 0.0
+    speaker_id = int(rng.integers(n_speakers))
+    while t < duration:
+        length = max(0.2, rng.exponential(mean_turn))
+        turns.append((speaker_id, t, min(t + length, duration)))
+        t += length + (rng.exponential(mean_pause) if mean_pause > 0 else 0.0)
+        if n_speakers > 1:
+            step = 1 if turn_taking == 'round_robin' else int(rng.integers(1, n_speakers))
+            speaker_id = (speaker_id + step) % n_speakers
+    return np.array(turns, dtype=np.float64).reshape(-1, 3)
+
+def synthetic_conversation_audio(directory, n_speakers=3, duration=240, mean_turn=3.0, silence_ratio=0.3,
+                                 turn_taking='random', sampling_rate=44100, seed=0, levels=0.3, bleed=0.1, noise=0.003):
+    '''
+    Write one 16-bit WAV per speaker of a synthetic conversation, plus an audio list of them. Each track
+    holds its own speaker's voice at full level and the other speakers' bleed at a tenth of it, over a
+    noise floor; voices are harmonic with their own pitch and a 4 Hz syllable rhythm.
+
+    Args:
+    levels (float or list): Level of each speaker's voice on their own track.
+    bleed (float): Level of the other speakers on a track, relative to their own level.
+    noise (float or list): Standard deviation of the noise on each track.
+
+    Returns:
+    audio_list (str): Path of the audio list, one track per line.
+    turns (np.ndarray): The timeline, from synthetic_turn_taking.
+    '''
+    rng = np.random.default_rng(seed)
+    turns = synthetic_turn_taking(n_speakers, duration, mean_turn, silence_ratio, turn_taking, seed)
+    f0 = np.linspace(110, 240, n_speakers)
+    levels = np.broadcast_to(np.asarray(levels, dtype=np.float64), n_speakers)
+    noise = np.broadcast_to(np.asarray(noise, dtype=np.float64), n_speakers)
+    gains = np.where(np.eye(n_speakers, dtype=bool), levels, bleed*levels)
+    paths = [os.path.join(directory, f"speaker_{i}.wav") for i in range(n_speakers)]
+    tracks = [sf.SoundFile(path, "w", sampling_rate, 1, subtype='PCM_16') for path in paths]
+    for second in range(int(np.ceil(duration))):
+        t = np.arange(second*sampling_rate, min(second + 1, duration)*sampling_rate)/sampling_rate
+        turn = np.searchsorted(turns[:, 1], t, side='right') - 1
+        in_turn = (turn >= 0) & (t < turns[np.maximum(turn, 0), 2])
+        speaking = np.where(in_turn, turns[np.maximum(turn, 0), 0], -1)
+        syllables = 0.6 + 0.4*np.sin(4*np.pi*t)**2
+        voices = np.zeros((n_speakers, len(t)))
+        for i in range(n_speakers):
+            phase = 2*np.pi*f0[i]*t + 2*np.sin(2*np.pi*0.3*t)
+            harmonics = sum(0.5**k*np.sin((k + 1)*phase) for k in range(5))
+            voices[i] = harmonics*syllables*(speaking == i)
+        mix = gains @ voices
+        for i, track in enumerate(tracks):
+            track.write((mix[i] + noise[i]*rng.standard_normal(len(t))).astype(np.float32))
+    for track in tracks:
+        track.close()
+    audio_list = os.path.join(directory, "conversation.txt")
+    with open(audio_list, "w") as f:
+        f.write("\n".join(paths))
+    return audio_list, turns
+
+def peak_memory(function, *args):
+    '''
+    Peak traced allocation, in bytes, while calling 'function' and holding on to its result.
+    '''
+    tracemalloc.start()
+    result = function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+def git_commit():
+    '''
+    Commit the benchmarked tree is at, so results can be compared between commits.
+    '''
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def time_call(function, *args, repeat=5):
+    '''
+    Best-of-'repeat' wall-clock time of a single call, in seconds.
+    '''
+    timer = timeit.Timer(lambda: function(*args))
+    return min(timer.repeat(repeat=repeat, number=1))
+
+# Benchmarks
+
+def bench_downsample(args):
+    print("downsample: loop vs vectorized, 4-minute track")
+    data = synthetic_frames(FRAMES_PER_TRACK)
+    for u_length in [1, 3, 10]:
+        window_size = int(len(data)*u_length/240)
+        expected = np.array(downsample_loop(data, window_size), dtype=np.float32)
+        actual = pre_processing.downsample(data, window_size)
+        identical = np.array_equal(expected.view(np.uint32), actual.view(np.uint32))
+        loop_time = time_call(downsample_loop, data, window_size)
+        vector_time = time_call(pre_processing.downsample, data, window_size)
+        print(f"  u_length {u_length:>2}s (window {window_size:>4}): loop {1000*loop_time:8.2f} ms, "
+              f"vectorized {1000*vector_time:6.2f} ms, {loop_time/vector_time:6.1f}x, "
+              f"bit-identical: {identical}")
+
+def bench_p2r_r2r(args):
+    print("prompt_to_response / response_to_response: backward scans vs single pass")
+    speaker_ids, values = synthetic_turns(1000)
+    loop = synthetic_conversation(speaker_ids, values)
+    prompt_to_response_loop(loop)
+    response_to_response_loop(loop)
+    vector = synthetic_conversation(speaker_ids, values)
+    processing.prompt_to_response(vector)
+    processing.response_to_response(vector)
+    identical = all(a.p2r == b.p2r and a.r2r == b.r2r for a, b in zip(loop.utterances, vector.utterances))
+    print(f"  identical to the backward scans on 1k turns: {identical}")
+    for n_turns in [1000, 10000]:
+        speaker_ids, values = synthetic_turns(n_turns)
+        conversation = synthetic_conversation(speaker_ids, values)
+        p2r_time = time_call(prompt_to_response_loop, conversation, repeat=1)
+        r2r_time = time_call(response_to_response_loop, conversation, repeat=1)
+        print(f"  backward scans, {n_turns:>9} turns: p2r {1000*p2r_time:9.2f} ms, r2r {1000*r2r_time:9.2f} ms")
+    for n_turns in [1000, 100000, 1000000]:
+        speaker_ids, values = synthetic_turns(n_turns)
+        p2r_time = time_call(processing.prompt_to_response_ratios, speaker_ids, values)
+        r2r_time = time_call(processing.response_to_response_ratios, speaker_ids, values)
+        print(f"  single pass,    {n_turns:>9} turns: p2r {1000*p2r_time:9.2f} ms, r2r {1000*r2r_time:9.2f} ms")
+
+def bench_utterance_matrix(args):
+    print("UtteranceMatrix / summarize_speakers: Utterance objects vs columns, 3 speakers")
+    for n_windows in [10000, 100000]:
+        feature_matrix = [synthetic_frames(n_windows, seed=i) for i in range(3)]
+        scale = 10000/n_windows
+        objects_memory = peak_memory(utterance_matrix_objects, feature_matrix, 1)
+        columns_memory = peak_memory(UtteranceMatrix, feature_matrix, 1)
+        objects_time = time_call(utterance_matrix_objects, feature_matrix, 1, repeat=1)
+        columns_time = time_call(UtteranceMatrix, feature_matrix, 1, repeat=1)
+        print(f"  build {n_windows:>6} windows: objects {objects_memory*scale/1024:8.1f} KiB per 10k windows "
+              f"in {1000*objects_time:7.2f} ms, columns {columns_memory*scale/1024:6.1f} KiB per 10k windows "
+              f"in {1000*columns_time:5.2f} ms")
+        speaker_ids, _ = synthetic_turns(n_windows)
+        # Runs of up to three windows by the same speaker
+        speaker_ids = np.repeat(speaker_ids, 3)[:n_windows]
+        values = feature_matrix[0]
+        objects = [Utterance(float(v), int(s), j, j + 1) for j, (s, v) in enumerate(zip(speaker_ids, values))]
+        columns = synthetic_conversation(speaker_ids, values, window_size=1)
+        objects_time = time_call(summarize_speakers_objects, objects, 1, repeat=1)
+        columns_time = time_call(lambda: Conversation(columns.length, columns.utterances.copy(), 1).summarize_speakers())
+        print(f"  summarize {n_windows:>6} windows: objects {1000*objects_time:7.2f} ms, columns {1000*columns_time:5.2f} ms")
+
+def bench_streaming(args):
+    print("get_features: whole-file decoding vs block streaming, one 44.1 kHz track")
+    with tempfile.TemporaryDirectory() as tmp:
+        for minutes in [5, 20]:
+            path = os.path.join(tmp, f"{minutes}.wav")
+            synthetic_recording(path, minutes)
+            for stream_on in [False, True]:
+                options = argparse.Namespace(start_time=0, duration=None, stream_on=stream_on, pitch_backend='piptrack',
+                                             denoise_on=False, native_rate_on=False)
+                memory = peak_memory(pre_processing.compute_features, options, path, ['volume', 'pitch'])
+                label = "streaming" if stream_on else "whole file"
+                print(f"  {minutes:>2} minutes, {label:<10}: peak {memory/1024/1024:7.1f} MiB")
+
+def pitch_accuracy(estimate, truth):
+    '''
+    Share of voiced frames that got an estimate, share of those more than 20% off, and median error in cents.
+    '''
+    voiced = truth > 0
+    estimated = voiced & (estimate > 0)
+    ratio = estimate[estimated]/truth[estimated]
+    gross = np.abs(ratio - 1) > 0.2
+    cents = np.abs(1200*np.log2(ratio[~gross])) if np.any(~gross) else np.array([np.nan])
+    return estimated.sum()/max(voiced.sum(), 1), gross.mean() if len(gross) else np.nan, np.median(cents)
+
+def bench_pitch(args):
+    print("extract_pitch: piptrack vs autocorrelation, 60s synthetic voice with known f0")
+    sr = pre_processing.SAMPLING_RATE
+    # A speaker's own track in a three-way conversation is voiced roughly a third of the time
+    for voiced_ratio in [0.75, 0.25]:
+        y, f0 = synthetic_voice(60, sr, voiced_ratio)
+        for backend, (_, hop_length) in pre_processing.PITCH_FRAMING.items():
+            pitch_frames = pre_processing.PITCH_BACKENDS[backend]
+            estimate = pitch_frames(y, sr)
+            truth = f0(np.arange(len(estimate))*hop_length/sr)
+            coverage, gross, cents = pitch_accuracy(estimate, truth)
+            elapsed = time_call(pitch_frames, y, sr, repeat=3)
+            memory = peak_memory(pitch_frames, y, sr)
+            print(f"  {100*voiced_ratio:.0f}% voiced, {backend:<15}: {1000*elapsed:6.1f} ms, peak {memory/1024/1024:5.1f} MiB, "
+                  f"{100*coverage:5.1f}% voiced frames estimated, {100*gross:5.1f}% gross errors, "
+                  f"median error {cents:4.1f} cents")
+    # Real conversations have no ground truth, so report how often the two backends agree
+    paths = [path for path in open("sample_data.txt").read().splitlines() if os.path.isfile(path)]
+    for path in paths:
+        options = argparse.Namespace(start_time=0, duration=None, stream_on=False, pitch_backend='piptrack', denoise_on=False, native_rate_on=False)
+        recording = pre_processing.load_recording(path, options)
+        timings = {}
+        estimates = {}
+        for backend in pre_processing.PITCH_BACKENDS:
+            pitch_frames = pre_processing.PITCH_BACKENDS[backend]
+            timings[backend] = time_call(pitch_frames, recording.y, recording.sampling_rate, repeat=1)
+            estimates[backend] = pitch_frames(recording.y, recording.sampling_rate)
+        # Compare at the autocorrelation frames, which are twice as dense as piptrack's
+        reference = np.repeat(estimates['piptrack'], 2)[:len(estimates['autocorrelation'])]
+        both = (reference > 0) & (estimates['autocorrelation'] > 0)
+        agree = np.mean(np.abs(estimates['autocorrelation'][both]/reference[both] - 1) < 0.2) if both.any() else np.nan
+        print(f"  {os.path.basename(path)}: piptrack {timings['piptrack']:.2f}s, "
+              f"autocorrelation {timings['autocorrelation']:.2f}s, agree within 20% on {100*agree:.1f}% of frames")
+
+def bench_frame_features(args):
+    print("extract_frame_features: one pass per feature vs one shared framing pass, 4-minute synthetic voice")
+    sr = pre_processing.SAMPLING_RATE
+    y, _ = synthetic_voice(240, sr, voiced_ratio=0.33)
+    features = ['volume', 'pitch', 'cadence']
+    expected = separate_passes(y, sr)
+    actual = pre_processing.extract_frame_features(y, sr, features, 'autocorrelation')
+    identical = all(np.array_equal(expected[f], actual[f]) for f in features)
+    separate_time = time_call(separate_passes, y, sr, repeat=3)
+    shared_time = time_call(pre_processing.extract_frame_features, y, sr, features, 'autocorrelation', repeat=3)
+    print(f"  volume + pitch + cadence: separate passes {1000*separate_time:7.1f} ms, "
+          f"shared pass {1000*shared_time:7.1f} ms, identical: {identical}")
+    for feature in features:
+        elapsed = time_call(pre_processing.extract_frame_features, y, sr, [feature], 'autocorrelation', repeat=3)
+        print(f"  {feature} alone: {1000*elapsed:7.1f} ms")
+
+def bench_mixdown(args):
+    print("overlay: whole-track sum vs block mixdown, 3 speakers at 44.1 kHz")
+    with tempfile.TemporaryDirectory() as tmp:
+        for minutes in [5, 20]:
+            paths = [os.path.join(tmp, f"{minutes}_{i}.wav") for i in range(3)]
+            for i, path in enumerate(paths):
+                synthetic_recording(path, minutes, seed=i)
+            whole_path = os.path.join(tmp, "whole.wav")
+            block_path = os.path.join(tmp, "block.wav")
+            whole_memory = peak_memory(whole_track_mixdown, paths, whole_path)
+            block_memory = peak_memory(overlay.mixdown, paths, block_path)
+            whole_time = time_call(whole_track_mixdown, paths, whole_path, repeat=1)
+            block_time = time_call(overlay.mixdown, paths, block_path, repeat=1)
+            identical = np.array_equal(sf.read(whole_path)[0], sf.read(block_path)[0])
+            print(f"  {minutes:>2} minutes: whole tracks {whole_time:5.2f}s, peak {whole_memory/1024/1024:7.1f} MiB; "
+                  f"blocks {block_time:5.2f}s, peak {block_memory/1024/1024:5.1f} MiB; identical: {identical}")
+
+def time_stages(options, repeat=3):
+    '''
+    Run the volume pipeline stage by stage on options.file_paths, timing each stage on the previous
+    stage's output.
+
+    Returns:
+    stages (dict): stage name -> {'time': best-of-'repeat' seconds, 'peak_memory': bytes}.
+    '''
+    stages = {}
+    def stage(name, function, *args):
+        elapsed = time_call(function, *args, repeat=repeat)
+        memory = peak_memory(function, *args)
+        stages[name] = {'time': elapsed, 'peak_memory': memory}
+        print(f"  {name:<24} {1000*elapsed:9.2f} ms, peak {memory/1024/1024:7.1f} MiB")
+        return function(*args)
+    recordings = stage('get_recordings', pre_processing.get_recordings, options)
+    rmse_matrix = stage('extract_rmse', pre_processing.extract_rmse, recordings)
+    stage('extract_pitch', pre_processing.extract_pitch, recordings, options.pitch_backend)
+    # clean_up replaces the matrices it is given, so each call gets its own copy
+    feature_matrices = stage('clean_up', lambda: pre_processing.clean_up(options, {'volume': list(rmse_matrix)}))
+    utterance_matrices = stage('get_utterance_matrices', pre_processing.get_utterance_matrices, options, feature_matrices)
+    conversations = stage('get_conversations', pre_processing.get_conversations, options, utterance_matrices)
+    rich_conversations = stage('enrich_conversations', pre_processing.enrich_conversations, conversations)
+    stage('prompt_to_response', lambda: [processing.prompt_to_response(c) for c in rich_conversations])
+    stage('response_to_response', lambda: [processing.response_to_response(c) for c in rich_conversations])
+    return stages
+
+def bench_stages(args):
+    print(f"pipeline stages: {args.speakers} speakers, {args.duration}s, {args.turn}s mean turns, "
+          f"{100*args.silence:.0f}% silence, {args.turn_taking} turn-taking")
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_list, turns = synthetic_conversation_audio(tmp, args.speakers, args.duration, args.turn, args.silence,
+                                                         args.turn_taking, seed=args.seed)
+        paths = interface.parse_audio_paths(audio_list, interface.AUDIO_EXTENSIONS)
+        options = interface.AnalysisOptions(paths, args.u_length, 0, args.duration, {'volume': True}, False,
+                                            {'p2r': True, 'r2r': True}, cache_on=False)
+        stages = time_stages(options, args.repeat)
+    results = {'commit': git_commit(), 'python': platform.python_version(), 'numpy': np.__version__,
+               'librosa': librosa.__version__,
+               'conversation': {'speakers': args.speakers, 'duration': args.duration, 'mean_turn': args.turn,
+                                'silence_ratio': args.silence, 'turn_taking': args.turn_taking, 'seed': args.seed,
+                                'turns': len(turns)},
+               'u_length': args.u_length, 'repeat': args.repeat, 'stages': stages}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"  results written to {args.json}")
+    return results
+
+def analyse_volume(options):
+    '''
+    Volume conversations of options.file_paths, analysed for p2r and r2r, without any progress messages.
+    '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        feature_matrices = pre_processing.clean_up(options, pre_processing.get_features(options))
+        conversations = pre_processing.get_conversations(options, pre_processing.get_utterance_matrices(options, feature_matrices))
+        return processing.extract_analyses(options, pre_processing.enrich_conversations(conversations))[0].utterances
+
+def bench_native_rate(args):
+    print(f"decoding {args.speakers} speakers x {args.duration}s: resampling to {pre_processing.SAMPLING_RATE} Hz "
+          "vs native rate with scaled frames, and the volume p2r/r2r they lead to")
+    for sampling_rate in [44100, 48000]:
+        with tempfile.TemporaryDirectory() as tmp:
+            audio_list, _ = synthetic_conversation_audio(tmp, args.speakers, args.duration, args.turn, args.silence,
+                                                         args.turn_taking, sampling_rate, args.seed)
+            paths = interface.parse_audio_paths(audio_list, interface.AUDIO_EXTENSIONS)
+            results = {}
+            for native_rate_on in [False, True]:
+                options = interface.AnalysisOptions(paths, args.u_length, 0, args.duration, {'volume': True}, False,
+                                                    {'p2r': True, 'r2r': True}, cache_on=False, native_rate_on=native_rate_on)
+                decode_time = time_call(pre_processing.get_recordings, options, repeat=args.repeat)
+                results[native_rate_on] = (decode_time, analyse_volume(options))
+        (resampled_time, expected), (native_time, actual) = results[False], results[True]
+        same_turns = np.array_equal(expected.speaker_ids, actual.speaker_ids)
+        line = (f"  {sampling_rate} Hz: decode {1000*resampled_time:8.1f} ms resampled, {1000*native_time:8.1f} ms native "
+                f"({resampled_time/native_time:.1f}x), {len(expected)} vs {len(actual)} turns, same turns: {same_turns}")
+        if same_turns:
+            with np.errstate(invalid='ignore'):
+                errors = [np.nanmax(np.abs(getattr(actual, a)/getattr(expected, a) - 1)) for a in ['p2r', 'r2r']]
+            line += f", max relative p2r/r2r difference {max(errors):.1e}"
+        print(line)
+
+def bench_incremental(args):
+    segment = 10
+    print(f"{args.speakers} growing 44100 Hz tracks of {args.duration}s, {segment}s added at a time: volume p2r/r2r "
+          "updated incrementally vs analysed again from the start (--native_rate)")
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source")
+        os.makedirs(source)
+        audio_list, _ = synthetic_conversation_audio(source, args.speakers, args.duration, args.turn, args.silence,
+                                                     args.turn_taking, 44100, args.seed)
+        tracks = [sf.read(path, dtype='int16') for path in interface.parse_audio_paths(audio_list, interface.AUDIO_EXTENSIONS)]
+        paths = [os.path.join(tmp, f"speaker_{i}.wav") for i in range(args.speakers)]
+        state_dir = os.path.join(tmp, "state")
+        for end in range(segment, args.duration + 1, segment):
+            for path, (data, sr) in zip(paths, tracks):
+                sf.write(path, data[:end*sr], sr, subtype='PCM_16')
+            options = interface.AnalysisOptions(paths, args.u_length, 0, interface.get_duration(paths[0]), {'volume': True},
+                                                False, {'p2r': True, 'r2r': True}, cache_on=False, native_rate_on=True)
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = timeit.default_timer()
+                actual = incremental.update(options, state_dir)[0][0].utterances
+                update_time = timeit.default_timer() - start
+            if end % (4*segment) and end != args.duration:
+                continue
+            full_time = time_call(analyse_volume, options, repeat=1)
+            expected = analyse_volume(options)
+            identical = all(np.array_equal(getattr(actual, c), getattr(expected, c), equal_nan=True)
+                            for c in ['speaker_ids', 'start_times', 'end_times', 'values', 'p2r', 'r2r'])
+            print(f"  {end:>5}s: update {1000*update_time:7.1f} ms, full {1000*full_time:8.1f} ms "
+                  f"({full_time/update_time:5.1f}x), {len(actual):>4} turns, identical: {identical}")
+
+def truth_speakers(turns, duration, resolution=0.01):
+    '''
+    Who speaks every 'resolution' seconds of a synthetic_turn_taking timeline, -1 in pauses.
+    '''
+    t = np.arange(0, duration, resolution)
+    turn = np.searchsorted(turns[:, 1], t, side='right') - 1
+    in_turn = (turn >= 0) & (t < turns[np.maximum(turn, 0), 2])
+    return np.where(in_turn, turns[np.maximum(turn, 0), 0], -1).astype(np.int64)
+
+def score_turns(utterances, truth, resolution=0.01):
+    '''
+    Turns whose speaker hardly speaks during them (less than a tenth of the turn), and the share of the
+    speech covered by turns of the right speaker.
+    '''
+    detected = np.full(len(truth), -1)
+    spurious = 0
+    for speaker_id, start, end in zip(utterances.speaker_ids, utterances.start_times, utterances.end_times):
+        span = slice(int(round(start/resolution)), int(round(end/resolution)))
+        detected[span] = speaker_id
+        if np.mean(truth[span] == speaker_id) < 0.1:
+            spurious += 1
+    speech = truth != -1
+    return spurious, np.mean(detected[speech] == truth[speech])
+
+def bench_voice_activity(args):
+    print(f"volume gating of {args.speakers} tracks: fixed {pre_processing.RMS_THRESHOLD} RMS threshold "
+          "(list comprehension, vectorized) vs speaker activity detection")
+    frame_rate = pre_processing.SAMPLING_RATE/pre_processing.HOP_LENGTH
+    for minutes in [4, 60]:
+        rms_matrix = [synthetic_frames(int(minutes*60*frame_rate), seed=i) for i in range(args.speakers)]
+        loop_time = time_call(lambda: [gate_silence_loop(rms) for rms in rms_matrix], repeat=1)
+        gate_time = time_call(lambda: [pre_processing.gate_silence(rms) for rms in rms_matrix])
+        activity_time = time_call(voice_activity.gate_activity, rms_matrix, frame_rate)
+        identical = all(np.array_equal(gate_silence_loop(rms), pre_processing.gate_silence(rms)) for rms in rms_matrix)
+        print(f"  {minutes:>2} minutes: comprehension {1000*loop_time:8.1f} ms, vectorized {1000*gate_time:6.2f} ms "
+              f"(identical: {identical}), activity detection {1000*activity_time:6.2f} ms")
+    print(f"turns on synthetic conversations, {args.speakers} speakers x {args.duration}s: spurious turns are turns "
+          "whose speaker hardly speaks during them, coverage is the speech held by the right speaker")
+    conditions = {'default (bleed -20 dB)': {},
+                  'close mics (bleed -6 dB)': {'bleed': 0.5},
+                  'one quiet speaker': {'levels': [0.3]*(args.speakers - 1) + [0.08]},
+                  'one noisy track': {'noise': [0.003]*(args.speakers - 1) + [0.06]}}
+    for label, condition in conditions.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            audio_list, turns = synthetic_conversation_audio(tmp, args.speakers, args.duration, args.turn, args.silence,
+                                                             args.turn_taking, seed=args.seed, **condition)
+            paths = interface.parse_audio_paths(audio_list, interface.AUDIO_EXTENSIONS)
+            truth = truth_speakers(turns, args.duration)
+            line = f"  {label:<26} {len(turns):>4} true turns"
+            for vad_on in [False, True]:
+                options = interface.AnalysisOptions(paths, args.u_length, 0, args.duration, {'volume': True}, False,
+                                                    {'p2r': True, 'r2r': True}, cache_on=False, vad_on=vad_on)
+                utterances = analyse_volume(options)
+                spurious, coverage = score_turns(utterances, truth)
+                line += f" | {'activity' if vad_on else 'threshold'}: {len(utterances):>4} turns, {spurious:>3} spurious, coverage {coverage:.2f}"
+            print(line)
+
+def bench_get_conversations(args):
+    print("get_conversations: window-by-window comparison vs argmax over the speakers x windows matrix")
+    for n_speakers, n_windows in [(3, 1000), (3, 100000), (20, 100000)]:
+        # Coarse values make exact ties, and one short speaker exercises the ragged end
+        feature_matrix = [np.round(synthetic_frames(n_windows - 7*(i == 1), seed=i), 1) for i in range(n_speakers)]
+        options = argparse.Namespace(u_length=1, min_turn_length=1)
+        matrices = {'volume': UtteranceMatrix(feature_matrix, 1)}
+        expected = get_conversations_loop(options, matrices)[0].utterances
+        actual = pre_processing.get_conversations(options, matrices)[0].utterances
+        identical = all(np.array_equal(getattr(expected, c), getattr(actual, c))
+                        for c in ['speaker_ids', 'values', 'start_times', 'end_times'])
+        loop_time = time_call(get_conversations_loop, options, matrices, repeat=1)
+        vector_time = time_call(pre_processing.get_conversations, options, matrices)
+        print(f"  {n_speakers:>2} speakers x {n_windows:>6} windows: loop {1000*loop_time:9.2f} ms, "
+              f"vectorized {1000*vector_time:6.2f} ms, {loop_time/vector_time:6.1f}x, identical: {identical}")
+    feature_matrix = [synthetic_frames(100000, seed=i) for i in range(3)]
+    matrices = {'volume': UtteranceMatrix(feature_matrix, 1)}
+    for min_turn_length in [1, 2, 3, 5]:
+        options = argparse.Namespace(u_length=1, min_turn_length=min_turn_length)
+        turns = len(pre_processing.get_conversations(options, matrices)[0].utterances)
+        print(f"  min_turn {min_turn_length}: {turns} turns over 100000 windows")
+
+def bench_joint(args):
+    print("volume + pitch + cadence with p2r + r2r: one conversation per feature vs joint segmentation")
+    for n_windows in [10000, 100000]:
+        matrices = {feature: UtteranceMatrix([synthetic_frames(n_windows, seed=10*f + i) for i in range(3)], 1)
+                    for f, feature in enumerate(['volume', 'pitch', 'cadence'])}
+        options = argparse.Namespace(u_length=1, min_turn_length=1, requested_analyses={'p2r': True, 'r2r': True})
+        def separate():
+            with contextlib.redirect_stdout(io.StringIO()):
+                conversations = pre_processing.enrich_conversations(pre_processing.get_conversations(options, matrices))
+                return processing.extract_analyses(options, conversations)
+        def joint():
+            with contextlib.redirect_stdout(io.StringIO()):
+                return processing.analyse_joint(options, pre_processing.get_joint_conversation(options, matrices))
+        volume = separate()[0].utterances
+        joint_volume = joint().conversation('volume').utterances
+        identical = all(np.array_equal(getattr(volume, c), getattr(joint_volume, c), equal_nan=True)
+                        for c in ['speaker_ids', 'values', 'p2r', 'r2r'])
+        separate_time = time_call(separate)
+        joint_time = time_call(joint)
+        print(f"  {n_windows:>6} windows: separate {1000*separate_time:7.2f} ms, joint {1000*joint_time:7.2f} ms, "
+              f"volume identical: {identical}")
+
+def bench_rolling(args):
+    print("rolling p2r statistics over the last 50 turns of each speaker pair: refit per turn vs running sums")
+    for n_turns in [1000, 10000, 100000]:
+        rng = np.random.default_rng(0)
+        speaker_ids = rng.integers(0, 3, n_turns)
+        start_times = np.cumsum(rng.uniform(1, 6, n_turns))
+        values = rng.lognormal(0, 0.3, n_turns)
+        running_time = time_call(rolling.rolling_statistics, speaker_ids, start_times, {'p2r': values}, 50, repeat=1)
+        columns = rolling.rolling_statistics(speaker_ids, start_times, {'p2r': values}, 50)
+        line = f"  {n_turns:>6} turns: running sums {1000*running_time:8.2f} ms ({1e6*running_time/n_turns:.1f} us/turn)"
+        if n_turns <= 10000:
+            refit_time = time_call(rolling_refit, speaker_ids, start_times, values, 50, repeat=1)
+            expected = np.array(rolling_refit(speaker_ids, start_times, values, 50))
+            actual = np.column_stack([columns[f"p2r_{s}"] for s in rolling.ROLLING_STATISTICS])
+            error = np.nanmax(np.abs(expected - actual))
+            line += f", refit {1000*refit_time:9.2f} ms, {refit_time/running_time:6.1f}x, max abs error {error:.1e}"
+        print(line)
+
+def bench_pairwise(args):
+    print("mean p2r per prompter and responder: a mask per pair vs one bincount pass")
+    for n_speakers in [3, 10, 30]:
+        rng = np.random.default_rng(n_speakers)
+        speaker_ids = rng.integers(0, n_speakers, 200000)
+        values = rng.uniform(0.1, 1, 200000)
+        expected = pairwise_loop(speaker_ids, values)
+        means = processing.pairwise_prompt_to_response(speaker_ids, values)[2]
+        loop_time = time_call(pairwise_loop, speaker_ids, values, repeat=1)
+        grouped_time = time_call(processing.pairwise_prompt_to_response, speaker_ids, values)
+        print(f"  {n_speakers:>2} speakers x 200000 turns: loop {1000*loop_time:8.2f} ms, bincount {1000*grouped_time:6.2f} ms, "
+              f"{loop_time/grouped_time:6.1f}x, max abs error {np.nanmax(np.abs(expected - means)):.1e}")
+
+def bench_sweep(args):
+    print("downsampling 3 one-hour tracks to u_length 1..10s: downsample per u_length vs prefix sums")
+    frame_rate = 22050/pre_processing.HOP_LENGTH
+    frames = [synthetic_frames(int(3600*frame_rate), seed=i) for i in range(3)]
+    u_lengths = list(range(1, 11))
+    def per_u_length():
+        return [[pre_processing.downsample(data, int(u_length*frame_rate)) for data in frames] for u_length in u_lengths]
+    def prefix():
+        sums = [pre_processing.non_zero_prefix_sums(data) for data in frames]
+        return [[pre_processing.downsample_prefix_sums(s, c, int(u_length*frame_rate)) for s, c in sums] for u_length in u_lengths]
+    error = max(np.max(np.abs(a - b)) for expected, actual in zip(per_u_length(), prefix()) for a, b in zip(expected, actual))
+    separate_time = time_call(per_u_length)
+    prefix_time = time_call(prefix)
+    sums = [pre_processing.non_zero_prefix_sums(data) for data in frames]
+    extra_time = time_call(lambda: [pre_processing.downsample_prefix_sums(s, c, int(frame_rate)) for s, c in sums])
+    print(f"  10 u_lengths: downsample {1000*separate_time:7.2f} ms, prefix sums {1000*prefix_time:7.2f} ms "
+          f"({separate_time/prefix_time:.1f}x), each extra u_length {1000*extra_time:.2f} ms, max abs error {error:.1e}")
+
+def checksum(arrays):
+    return float(sum(np.sum(a, dtype=np.float64) for a in arrays))
+
+def attached_checksum(handles):
+    return checksum(shared_store.attach(handles))
+
+def bench_shared_store(args):
+    print(f"{args.speakers} speakers x 1 hour at {pre_processing.SAMPLING_RATE} Hz, read in full by 4 tasks on 2 workers: "
+          "pickled arrays vs a shared memory-mapped store")
+    rng = np.random.default_rng(0)
+    n_samples = 3600*pre_processing.SAMPLING_RATE
+    audio = [rng.standard_normal(n_samples, dtype=np.float32) for _ in range(args.speakers)]
+    n_frames = n_samples//pre_processing.HOP_LENGTH + 1
+    features = [synthetic_frames(n_frames, seed=i) for i in range(3*args.speakers)]
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        executor.submit(checksum, [np.zeros(1)]).result() # start the workers before timing
+        for label, arrays in [('decoded audio', audio), ('frame features', features)]:
+            expected = checksum(arrays)
+            n_bytes = sum(a.nbytes for a in arrays)
+            def pickled():
+                return [f.result() for f in [executor.submit(checksum, arrays) for _ in range(4)]]
+            def shared():
+                with shared_store.SharedFeatureStore() as store:
+                    handles = store.share(arrays)
+                    return [f.result() for f in [executor.submit(attached_checksum, handles) for _ in range(4)]]
+            identical = all(abs(r - expected) <= 1e-9*abs(expected) for r in pickled() + shared())
+            pickled_time = time_call(pickled, repeat=2)
+            shared_time = time_call(shared, repeat=2)
+            with shared_store.SharedFeatureStore() as store:
+                handle_bytes = len(pickle.dumps(store.share(arrays)))
+            print(f"  {label:<14} {n_bytes/1024/1024:7.1f} MiB: pickled {pickled_time:6.2f} s "
+                  f"({4*len(pickle.dumps(arrays, protocol=pickle.HIGHEST_PROTOCOL))/1024/1024:.0f} MiB sent), "
+                  f"shared {shared_time:6.2f} s incl. writing the store once ({4*handle_bytes} bytes sent), "
+                  f"{pickled_time/shared_time:.1f}x, same results: {identical}")
+
+def run_command(command, repeat=5):
+    '''
+    Median wall-clock time of running 'command' in a fresh interpreter, in seconds.
+    '''
+    times = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+        times.append(timeit.default_timer() - start)
+    return float(np.median(times))
+
+def bench_startup(args):
+    print("startup: fresh `python vmd.py` processes, median of 5")
+    python = sys.executable
+    heavy = "import librosa, scipy.signal, matplotlib.pyplot, seaborn, pandas"
+    print(f"  python -c pass:                           {1000*run_command([python, '-c', 'pass']):7.1f} ms")
+    print(f"  importing the heavy dependencies:         {1000*run_command([python, '-c', heavy]):7.1f} ms")
+    print(f"  vmd.py --help:                            {1000*run_command([python, 'vmd.py', '--help']):7.1f} ms")
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_list, _ = synthetic_conversation_audio(tmp, duration=60)
+        cache_dir = os.path.join(tmp, "cache")
+        minimal = [python, 'vmd.py', audio_list, '--no_plot', '--transcription', '--cache-dir', cache_dir]
+        # The first run fills the feature cache; the timed ones only read it
+        run_command(minimal, repeat=1)
+        print(f"  vmd.py --transcription --no_plot, cached: {1000*run_command(minimal):7.1f} ms")
+
+def bench_profiling(args):
+    print("profiling.stage: cost of a stage marker with profiling off and on")
+    def mark_stages(n):
+        for _ in range(n):
+            with profiling.stage('stage', recording='track.wav'):
+                pass
+    n = 100000
+    profiling.disable()
+    off_time = time_call(mark_stages, n)
+    profiling.enable()
+    on_time = time_call(mark_stages, n, repeat=1)
+    profiling.disable()
+    print(f"  off: {1e9*off_time/n:7.1f} ns per stage, on: {1e6*on_time/n:6.2f} us per stage")
+
+BENCHMARKS = {
+    'downsample': bench_downsample,
+    'p2r_r2r': bench_p2r_r2r,
+    'utterance_matrix': bench_utterance_matrix,
+    'streaming': bench_streaming,
+    'pitch': bench_pitch,
+    'frame_features': bench_frame_features,
+    'mixdown': bench_mixdown,
+    'stages': bench_stages,
+    'get_conversations': bench_get_conversations,
+    'joint': bench_joint,
+    'rolling': bench_rolling,
+    'pairwise': bench_pairwise,
+    'sweep': bench_sweep,
+    'shared_store': bench_shared_store,
+    'native_rate': bench_native_rate,
+    'incremental': bench_incremental,
+    'voice_activity': bench_voice_activity,
+    'profiling': bench_profiling,
+    'startup': bench_startup,
+}
+
+if __name__ == '__main__':
+    args = interface.setup_benchmark_parser()
+    names = args.names if args.names else list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark '{name}', choose from: {', '.join(BENCHMARKS)}")
+            raise SystemExit(1)
+        BENCHMARKS[name](args)
@@ -29,53 +29,177 @@ class Utterance:
     def description(self):
         return f"Speaker {self.speaker_id}: '{self.value}'"
     
+class UtteranceView:
+    '''
+    Utterance-like view of one row of an UtteranceColumns store; reads and writes go straight to its arrays.
+    '''
+    __slots__ = ('_columns', '_index')
+    def __init__(self, columns, index):
+        self._columns = columns
+        self._index = index
+    @property
+    def value(self):
+        return self._columns.values[self._index]
+    @value.setter
+    def value(self, value):
+        self._columns.values[self._index] = value
+    @property
+    def speaker_id(self):
+        return int(self._columns.speaker_ids[self._index])
+    @property
+    def start_time(self):
+        return self._columns.start_times[self._index]
+    @property
+    def end_time(self):
+        return self._columns.end_times[self._index]
+    @property
+    def p2r(self):
+        p2r = self._columns.p2r[self._index]
+        return None if np.isnan(p2r) else p2r
+    @p2r.setter
+    def p2r(self, p2r):
+        self._columns.p2r[self._index] = np.nan if p2r is None else p2r
+    @property
+    def r2r(self):
+        r2r = self._columns.r2r[self._index]
+        return None if np.isnan(r2r) else r2r
+    @r2r.setter
+    def r2r(self, r2r):
+        self._columns.r2r[self._index] = np.nan if r2r is None else r2r
+    @property
+    def length(self):
+        return self.end_time-self.start_time
+    @property
+    def description(self):
+        return f"Speaker {self.speaker_id}: '{self.value}'"
+
+# Structure-of-arrays store for a sequence of utterances; p2r and r2r are NaN until computed
+class UtteranceColumns:
+    def __init__(self, values, speaker_ids, start_times, end_times, p2r=None, r2r=None):
+        self.values = np.asarray(values, dtype=np.float64)
+        self.speaker_ids = np.asarray(speaker_ids, dtype=np.int64)
+        self.start_times = np.asarray(start_times, dtype=np.float64)
+        self.end_times = np.asarray(end_times, dtype=np.float64)
+        self.p2r = np.full(len(self.values), np.nan) if p2r is None else np.asarray(p2r, dtype=np.float64)
+        self.r2r = np.full(len(self.values), np.nan) if r2r is None else np.asarray(r2r, dtype=np.float64)
+    @classmethod
+    def from_utterances(cls, utterances):
+        columns = cls([u.value for u in utterances], [u.speaker_id for u in utterances],
+                      [u.start_time for u in utterances], [u.end_time for u in utterances])
+        for i, u in enumerate(utterances):
+            if u.p2r is not None: columns.p2r[i] = u.p2r
+            if u.r2r is not None: columns.r2r[i] = u.r2r
+        return columns
+    def __len__(self):
+        return len(self.values)
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("utterance index out of range")
+        return UtteranceView(self, index)
+    def __setitem__(self, index, utterance):
+        # Copy the fields of any Utterance-like object into row 'index'
+        view = self[index]
+        self.values[view._index] = utterance.value
+        self.speaker_ids[view._index] = utterance.speaker_id
+        self.start_times[view._index] = utterance.start_time
+        self.end_times[view._index] = utterance.end_time
+        view.p2r = utterance.p2r
+        view.r2r = utterance.r2r
+    def __iter__(self):
+        for i in range(len(self)):
+            yield UtteranceView(self, i)
+    def take(self, index):
+        '''
+        New store holding the rows selected by 'index' (a boolean mask or an integer index array).
+        '''
+        return UtteranceColumns(self.values[index], self.speaker_ids[index], self.start_times[index],
+                                self.end_times[index], self.p2r[index], self.r2r[index])
+    def copy(self):
+        return UtteranceColumns(self.values.copy(), self.speaker_ids.copy(), self.start_times.copy(),
+                                self.end_times.copy(), self.p2r.copy(), self.r2r.copy())
+
 class UtteranceMatrix:
     def __init__(self, feature_matrix, window_size):
         self.window_size = window_size
-        self.utterance_matrix = []
+        # speakers x windows; shorter feature lists are zero padded and their real lengths kept
+        self.lengths = np.array([len(features) for features in feature_matrix], dtype=np.int64)
+        n_windows = int(self.lengths.max()) if len(self.lengths) else 0
+        self.values = np.zeros((len(feature_matrix), n_windows))
         for i, features in enumerate(feature_matrix):
-            utterances = []
-            for j, value in enumerate(features):
-                start_time = j*self.window_size
-                end_time = start_time + self.window_size
-                utterance = Utterance(value, i, start_time, end_time)
-                utterances.append(utterance)
-            self.utterance_matrix.append(utterances)
+            self.values[i, :len(features)] = features
+    def speaker_utterances(self, speaker_id):
+        '''
+        One speaker's windows as an UtteranceColumns store sharing this matrix's values.
+        '''
+        n_windows = self.lengths[speaker_id]
+        start_times = np.arange(n_windows)*self.window_size
+        return UtteranceColumns(self.values[speaker_id, :n_windows], np.full(n_windows, speaker_id),
+                                start_times, start_times + self.window_size)
+    @property
+    def utterance_matrix(self):
+        return [self.speaker_utterances(i) for i in range(len(self.values))]
 
 # Conversation class used to organize utterances
 class Conversation:
     def __init__(self, length, utterances, window_size):
         self.length = length # in seconds
-        self.utterances = utterances # array of utterances
+        self.utterances = utterances # UtteranceColumns, or any list of utterances
         self.window_size = window_size
+    @property
+    def utterances(self):
+        return self._utterances
+    @utterances.setter
+    def utterances(self, utterances):
+        if not isinstance(utterances, UtteranceColumns):
+            utterances = UtteranceColumns.from_utterances(utterances)
+        self._utterances = utterances
     def summarize_speakers(self):
         """
         Treat each consecutive utterance from the same speaker as one long, averaged, utterance
         """
-        summarized_utterances = []
-        s_utterance = self.utterances[0]
-        for utterance in self.utterances[1:]:
-            if utterance.speaker_id != s_utterance.speaker_id:
-                # capture & reset
-                summarized_utterances.append(s_utterance)
-                s_utterance = utterance
-            else:
-                # fold in
-                n = s_utterance.length/self.window_size
-                new_end_time = s_utterance.end_time + self.window_size
-                new_value = (s_utterance.value*n + utterance.value)/(n+1)
-                folded = Utterance(new_value, s_utterance.speaker_id, s_utterance.start_time, new_end_time)
-                s_utterance = folded
-        self.utterances = summarized_utterances
+        u = self.utterances
+        if len(u) == 0: return
+        # Run-length encode the speaker sequence and fold each run in one pass
+        starts = np.flatnonzero(np.concatenate(([True], u.speaker_ids[1:] != u.speaker_ids[:-1])))
+        counts = np.diff(np.append(starts, len(u)))
+        values = np.add.reduceat(u.values, starts)/counts
+        end_times = u.end_times[starts] + (counts-1)*self.window_size
+        # As before, the last run is still open when the fold ends and is not captured
+        runs = slice(0, len(starts)-1)
+        self.utterances = UtteranceColumns(values[runs], u.speaker_ids[starts][runs],
+                                           u.start_times[starts][runs], end_times[runs])
     def unique_speaker_ids(self):
-        unique_speaker_ids = []
-        for u in self.utterances:
-            if not u.speaker_id in unique_speaker_ids:
-                unique_speaker_ids.append(u.speaker_id)
-        return unique_speaker_ids
+        # Distinct ids in order of first appearance, without scanning a list for every utterance
+        ids, first = np.unique(self.utterances.speaker_ids, return_index=True)
+        return [int(id) for id in ids[np.argsort(first)]]
     def print_description(self):
         for u in self.utterances:
             if u.speaker_id != -1:
                 print(f"Speaker {u.speaker_id}: {u.value:.4f} for {u.length}s")
             else:
                 print(f"Silence for {u.length}s")
+
+# Turns segmented once and shared by every feature, with one row of values per feature
+class JointConversation:
+    def __init__(self, length, features, values, speaker_ids, start_times, end_times, window_size):
+        self.length = length # in seconds
+        self.features = list(features)
+        self.values = np.asarray(values, dtype=np.float64).reshape(len(self.features), -1) # features x turns
+        self.speaker_ids = np.asarray(speaker_ids, dtype=np.int64)
+        self.start_times = np.asarray(start_times, dtype=np.float64)
+        self.end_times = np.asarray(end_times, dtype=np.float64)
+        self.window_size = window_size
+        self.p2r = np.full(self.values.shape, np.nan)
+        self.r2r = np.full(self.values.shape, np.nan)
+    def conversation(self, feature):
+        '''
+        One feature's view of the turns as a Conversation, sharing this conversation's arrays.
+        '''
+        i = self.features.index(feature)
+        columns = UtteranceColumns(self.values[i], self.speaker_ids, self.start_times, self.end_times,
+                                   self.p2r[i], self.r2r[i])
+        return Conversation(self.length, columns, self.window_size)
+    def conversations(self):
+        return [self.conversation(feature) for feature in self.features]
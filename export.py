@@ -0,0 +1,237 @@
+import os
+import time
+import importlib.util
+import numpy as np
+
+import processing
+import rolling
+from interface import EXPORT_FORMATS
+
+'''
+Machine-readable export of analysed conversations, for aggregating results across many conversations.
+Two tables are written to an export directory:
+- utterances: one row per utterance (conversation id, feature, speaker, start/end time, value, p2r, r2r)
+- speakers: one row per speaker and analysis, with the line of best fit drawn on the scatter plots
+and, when a rolling window is set (--rolling_turns, --rolling_seconds) or --pairwise is given:
+- rolling: one row per scored utterance and analysis, with the rolling statistics of its speaker pair
+- pairs: one row per (prompter, responder) pair of speakers, with the mean and variance of their p2r
+Tables are built column-wise from the utterance arrays, buffered, and appended to disk in bulk, so a
+batch run can stream results out as conversations finish. CSV needs nothing extra; Parquet needs pyarrow.
+'''
+
+UTTERANCE_COLUMNS = ['conversation_id', 'feature', 'speaker_id', 'start_time', 'end_time', 'value', 'p2r', 'r2r']
+SPEAKER_COLUMNS = ['conversation_id', 'feature', 'analysis', 'speaker_id', 'n_values', 'slope', 'intercept']
+ROLLING_COLUMNS = ['conversation_id', 'feature', 'analysis', 'prompter_id', 'speaker_id', 'start_time',
+                   'n_values', 'mean', 'variance', 'slope']
+PAIR_COLUMNS = ['conversation_id', 'feature', 'prompter_id', 'responder_id', 'n_values', 'mean', 'variance']
+BUFFER_ROWS = 100000 # rows held in memory per table before being written out
+
+def conversation_columns(conversation):
+    '''
+    Utterance columns of an analysed Conversation, in the layout batch workers send back.
+    '''
+    u = conversation.utterances
+    return {'speaker_id': u.speaker_ids, 'start_time': u.start_times, 'end_time': u.end_times,
+            'value': u.values, 'p2r': u.p2r, 'r2r': u.r2r}
+
+def utterance_table(conversation_id, feature, columns):
+    '''
+    One row per utterance of one conversation's feature.
+
+    Args:
+    conversation_id (str): Label of the conversation.
+    feature (str): Feature label, e.g. 'volume'.
+    columns (dict): Utterance columns (see conversation_columns); p2r and r2r may hold None or NaN.
+
+    Returns:
+    table (dict): Column name -> array, in UTTERANCE_COLUMNS order.
+    '''
+    n = len(columns['speaker_id'])
+    return {'conversation_id': np.full(n, conversation_id, dtype=object),
+            'feature': np.full(n, feature, dtype=object),
+            'speaker_id': np.asarray(columns['speaker_id'], dtype=np.int64),
+            'start_time': np.asarray(columns['start_time'], dtype=np.float64),
+            'end_time': np.asarray(columns['end_time'], dtype=np.float64),
+            'value': np.asarray(columns['value'], dtype=np.float64),
+            'p2r': np.array(columns['p2r'], dtype=np.float64),
+            'r2r': np.array(columns['r2r'], dtype=np.float64)}
+
+def speaker_table(conversation_id, feature, columns, analyses):
+    '''
+    One row per speaker and analysis, with the slope and intercept of the speaker's line of best fit.
+
+    Args:
+    conversation_id (str): Label of the conversation.
+    feature (str): Feature label, e.g. 'volume'.
+    columns (dict): Utterance columns (see conversation_columns).
+    analyses (list): Analyses to summarize, e.g. ['p2r', 'r2r'].
+
+    Returns:
+    table (dict): Column name -> array, in SPEAKER_COLUMNS order.
+    '''
+    rows = []
+    for analysis in analyses:
+        trends = processing.speaker_trends(columns['speaker_id'], columns['start_time'], columns[analysis])
+        rows.extend((analysis, id, n, slope, intercept) for id, (n, slope, intercept) in trends.items())
+    n = len(rows)
+    analysis, speaker_id, n_values, slope, intercept = zip(*rows) if rows else ([], [], [], [], [])
+    return {'conversation_id': np.full(n, conversation_id, dtype=object),
+            'feature': np.full(n, feature, dtype=object),
+            'analysis': np.array(analysis, dtype=object),
+            'speaker_id': np.array(speaker_id, dtype=np.int64),
+            'n_values': np.array(n_values, dtype=np.int64),
+            'slope': np.array(slope, dtype=np.float64),
+            'intercept': np.array(intercept, dtype=np.float64)}
+
+def rolling_table(conversation_id, feature, columns, analyses, turns=None, seconds=None):
+    '''
+    One row per utterance and analysis the utterance was scored on, with the rolling mean, variance and
+    slope of its (prompter, responder) pair over the last 'turns' turns and/or 'seconds' seconds.
+
+    Returns:
+    table (dict): Column name -> array, in ROLLING_COLUMNS order.
+    '''
+    ratios = {analysis: np.array(columns[analysis], dtype=np.float64) for analysis in analyses}
+    statistics = rolling.rolling_statistics(columns['speaker_id'], columns['start_time'], ratios, turns, seconds)
+    parts = []
+    for analysis in analyses:
+        scored = ~np.isnan(ratios[analysis])
+        n = int(np.count_nonzero(scored))
+        parts.append({'conversation_id': np.full(n, conversation_id, dtype=object),
+                      'feature': np.full(n, feature, dtype=object),
+                      'analysis': np.full(n, analysis, dtype=object),
+                      'prompter_id': statistics['prompter_id'][scored],
+                      'speaker_id': np.asarray(columns['speaker_id'], dtype=np.int64)[scored],
+                      'start_time': np.asarray(columns['start_time'], dtype=np.float64)[scored],
+                      'n_values': statistics[f"{analysis}_n"][scored].astype(np.int64),
+                      'mean': statistics[f"{analysis}_mean"][scored],
+                      'variance': statistics[f"{analysis}_variance"][scored],
+                      'slope': statistics[f"{analysis}_slope"][scored]})
+    if not parts:
+        return {}
+    return {c: np.concatenate([part[c] for part in parts]) for c in ROLLING_COLUMNS}
+
+def pair_table(conversation_id, feature, columns):
+    '''
+    One row per (prompter, responder) pair of speakers that occurs in the conversation.
+
+    Returns:
+    table (dict): Column name -> array, in PAIR_COLUMNS order.
+    '''
+    ids, counts, means, variances = processing.pairwise_prompt_to_response(
+        np.asarray(columns['speaker_id'], dtype=np.int64), np.asarray(columns['value'], dtype=np.float64))
+    prompters, responders = np.nonzero(counts)
+    n = len(prompters)
+    return {'conversation_id': np.full(n, conversation_id, dtype=object),
+            'feature': np.full(n, feature, dtype=object),
+            'prompter_id': ids[prompters].astype(np.int64),
+            'responder_id': ids[responders].astype(np.int64),
+            'n_values': counts[prompters, responders].astype(np.int64),
+            'mean': means[prompters, responders],
+            'variance': variances[prompters, responders]}
+
+class TableWriter:
+    '''
+    Appends tables with the same columns to one CSV file, or to a directory of Parquet part files.
+    Tables are buffered and written BUFFER_ROWS at a time; close() writes out whatever is left.
+    '''
+    def __init__(self, path, export_format='csv', columns=None):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format '{export_format}', expected one of {EXPORT_FORMATS}")
+        self.path = path
+        self.export_format = export_format
+        self.columns = columns
+        self.buffer = []
+        self.n_buffered = 0
+        if export_format == 'parquet':
+            if importlib.util.find_spec("pyarrow") is None:
+                print("Parquet export needs pyarrow: pip install pyarrow")
+                raise SystemExit(1)
+            os.makedirs(path, exist_ok=True)
+    def write(self, table):
+        n = len(next(iter(table.values()))) if table else 0
+        if n == 0: return
+        self.buffer.append(table)
+        self.n_buffered += n
+        if self.n_buffered >= BUFFER_ROWS:
+            self.flush()
+    def flush(self):
+        if not self.buffer: return
+        # pandas is slow to import, so it is only loaded once there is something to write
+        import pandas as pd
+        frame = pd.DataFrame({c: np.concatenate([t[c] for t in self.buffer]) for c in self.buffer[0]},
+                             columns=self.columns)
+        if self.export_format == 'csv':
+            # Only a new (or empty) file gets a header, so successive runs append to the same table
+            header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            frame.to_csv(self.path, mode='a', header=header, index=False)
+        else:
+            # Parquet files cannot be appended to; each flush adds a part file to the dataset directory
+            part = os.path.join(self.path, f"part-{time.time_ns()}-{os.getpid()}.parquet")
+            frame.to_parquet(part, engine='pyarrow', index=False)
+        self.buffer = []
+        self.n_buffered = 0
+    def close(self):
+        self.flush()
+
+class ResultsExporter:
+    '''
+    Writes the utterance and speaker tables of analysed conversations to 'export_dir', the rolling
+    table too when a rolling window ('rolling_turns' and/or 'rolling_seconds') is given, and the pairs
+    table when 'pairwise_on'.
+    '''
+    def __init__(self, export_dir, export_format='csv', rolling_turns=None, rolling_seconds=None, pairwise_on=False):
+        os.makedirs(export_dir, exist_ok=True)
+        extension = '.csv' if export_format == 'csv' else ''
+        self.utterances = TableWriter(os.path.join(export_dir, f"utterances{extension}"), export_format, UTTERANCE_COLUMNS)
+        self.speakers = TableWriter(os.path.join(export_dir, f"speakers{extension}"), export_format, SPEAKER_COLUMNS)
+        self.rolling_turns = rolling_turns
+        self.rolling_seconds = rolling_seconds
+        self.rolling = None
+        if rolling_turns or rolling_seconds:
+            self.rolling = TableWriter(os.path.join(export_dir, f"rolling{extension}"), export_format, ROLLING_COLUMNS)
+        self.pairs = None
+        if pairwise_on:
+            self.pairs = TableWriter(os.path.join(export_dir, f"pairs{extension}"), export_format, PAIR_COLUMNS)
+    def add(self, conversation_id, feature, columns, analyses):
+        '''
+        Queue one conversation's feature for export.
+
+        Args:
+        conversation_id (str): Label of the conversation.
+        feature (str): Feature label, e.g. 'volume'.
+        columns (dict): Utterance columns (see conversation_columns).
+        analyses (list): Analyses that were performed, e.g. ['p2r', 'r2r'].
+        '''
+        self.utterances.write(utterance_table(conversation_id, feature, columns))
+        self.speakers.write(speaker_table(conversation_id, feature, columns, analyses))
+        if self.rolling is not None:
+            self.rolling.write(rolling_table(conversation_id, feature, columns, analyses,
+                                             self.rolling_turns, self.rolling_seconds))
+        if self.pairs is not None:
+            self.pairs.write(pair_table(conversation_id, feature, columns))
+    def close(self):
+        self.utterances.close()
+        self.speakers.close()
+        if self.rolling is not None:
+            self.rolling.close()
+        if self.pairs is not None:
+            self.pairs.close()
+
+def export_conversations(options, conversation_id, conversations, labels):
+    '''
+    Export analysed conversations, one per feature, to options.export_dir.
+
+    Args:
+    options: An AnalysisOptions object.
+    conversation_id (str): Label of the conversation the recordings belong to.
+    conversations (list): Analysed Conversation objects, one per feature.
+    labels (list): Feature label of each conversation.
+    '''
+    analyses = [a for a, is_on in options.requested_analyses.items() if is_on]
+    exporter = ResultsExporter(options.export_dir, options.export_format, options.rolling_turns, options.rolling_seconds,
+                               options.pairwise_on)
+    for feature, c in zip(labels, conversations):
+        exporter.add(conversation_id, feature, conversation_columns(c), analyses)
+    exporter.close()
+    print(f"Exported results to {options.export_dir}")
@@ -0,0 +1,84 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+'''
+Persistent cache of frame-level feature arrays. Each entry is a .npy file named after a hash of the
+audio content and every parameter that affects extraction, so changing any of them is a cache miss
+rather than a stale hit. Entries are memory-mapped on read and evicted least-recently-used first
+once the cache grows past its size limit.
+'''
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "vmd")
+DEFAULT_CACHE_SIZE = 2048 # MB
+
+def file_digest(path, block_size=1 << 20):
+    '''
+    Content hash of a file, read in blocks so large recordings are never held in memory.
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class FeatureCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_size*1024*1024
+        os.makedirs(self.cache_dir, exist_ok=True)
+    def key(self, digest, feature, parameters):
+        '''
+        Cache key for one feature of one recording.
+
+        Args:
+        digest (str): Content hash of the audio file.
+        feature (str): Feature label, e.g. 'volume'.
+        parameters (dict): Every extraction parameter the feature depends on.
+        '''
+        description = json.dumps({'digest': digest, 'feature': feature, **parameters}, sort_keys=True)
+        return hashlib.blake2b(description.encode(), digest_size=16).hexdigest()
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+    def get(self, key):
+        '''
+        Memory-mapped cached array for 'key', or None on a miss.
+        '''
+        path = self.path(key)
+        try:
+            data = np.load(path, mmap_mode='r')
+        except (FileNotFoundError, ValueError):
+            return None
+        # Bump the modification time so eviction sees this entry as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Another worker evicted the entry since it was mapped; the mapping stays readable
+            pass
+        return data
+    def put(self, key, data):
+        path = self.path(key)
+        # Write then rename, so concurrent workers never read a half-written entry
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(data))
+        os.replace(tmp_path, path)
+        self.evict()
+    def evict(self):
+        '''
+        Delete least-recently-used entries until the cache fits within its size limit.
+        '''
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npy"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes: break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
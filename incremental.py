@@ -0,0 +1,365 @@
+import os
+import copy
+import pickle
+import numpy as np
+import soundfile as sf
+
+import pre_processing
+import processing
+from conversation_model import Conversation, UtteranceColumns
+from streaming import FrameStream
+
+'''
+Incremental re-analysis of conversations whose recordings keep growing, e.g. as segments of audio are
+appended to each speaker's track. Running vmd.py again after every segment decodes and analyses the
+whole history; with a state directory (vmd.py --state_dir) everything the pipeline needs to pick up where
+it stopped is kept between runs, so an update only decodes and frames the new tail of each track:
+- per track, the samples read so far and the frame streams' carried samples (see streaming.FrameStream)
+- per track and feature, the frame features computed so far, appended to a file
+- per feature, the windows not yet folded into a closed turn (the open turn and anything after it), the
+  p2r/r2r scoring state (see processing.TurnScorer), and the closed turns, appended to a file
+The end of the audio so far is analysed as it stands, on copies of that state: the last frames are zero
+padded and the last window is ragged, as in a full run, but neither is kept until more audio arrives.
+
+Results match a full run of vmd.py --native_rate over the same recordings. Recordings are not resampled,
+because resampling a prefix of a recording does not give a prefix of the resampled recording; their rate
+must put frames on whole samples (22050 Hz, 44100 Hz, ...). If the window sizes, which follow the
+number of frames, or the speaker that breaks ties change as the tracks grow, windows and turns are
+rebuilt from the stored frame features, without decoding anything again.
+'''
+
+INCREMENTAL_FEATURES = ['volume', 'pitch']
+TURN_COLUMNS = ['speaker_id', 'start_time', 'end_time', 'value', 'p2r', 'r2r']
+STATE_FILE = "state.pkl"
+
+class AppendOnlyArray:
+    '''
+    Rows of a fixed dtype and width, appended to a raw binary file and read back from any row on.
+    '''
+    def __init__(self, path, dtype, n_columns=1):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.n_columns = n_columns
+        self.row_bytes = self.dtype.itemsize*n_columns
+    def __len__(self):
+        return os.path.getsize(self.path)//self.row_bytes if os.path.exists(self.path) else 0
+    def append(self, rows):
+        with open(self.path, "ab") as f:
+            np.ascontiguousarray(rows, dtype=self.dtype).tofile(f)
+    def read(self, start=0, stop=None):
+        stop = len(self) if stop is None else stop
+        count = max(stop - start, 0)*self.n_columns
+        data = np.fromfile(self.path, dtype=self.dtype, count=count, offset=start*self.row_bytes) if count else np.zeros(0, dtype=self.dtype)
+        return data.reshape(-1, self.n_columns) if self.n_columns > 1 else data
+    def truncate(self, n_rows):
+        # Rows written by an update that did not get to save its state are dropped
+        if len(self) > n_rows:
+            os.truncate(self.path, n_rows*self.row_bytes)
+
+class TrackFrames:
+    '''
+    Frame features of one track, computed block after block as its samples are read, exactly as
+    pre_processing.extract_frame_features computes them over the whole track.
+    '''
+    def __init__(self, sampling_rate, features, pitch_backend):
+        sr = sampling_rate
+        self.sampling_rate = sr
+        self.features = features
+        self.pitch_backend = pitch_backend
+        self.n_samples = 0
+        self.shared_pitch = 'pitch' in features and pitch_backend == 'autocorrelation'
+        self.streams = {}
+        if 'volume' in features or self.shared_pitch:
+            frame_length = pre_processing.PITCH_FRAME_LENGTH if self.shared_pitch else pre_processing.FRAME_LENGTH
+            self.streams['shared'] = FrameStream(pre_processing.scaled_length(frame_length, sr),
+                                                 pre_processing.scaled_length(pre_processing.HOP_LENGTH, sr),
+                                                 frame_multiple=pre_processing.PITCH_STRIDE if self.shared_pitch else 1)
+        if 'pitch' in features and not self.shared_pitch:
+            frame_length, hop_length = pre_processing.PITCH_FRAMING[pitch_backend]
+            self.streams['pitch'] = FrameStream(pre_processing.scaled_length(frame_length, sr),
+                                                pre_processing.scaled_length(hop_length, sr))
+    def compute(self, name, span):
+        sr = self.sampling_rate
+        if name == 'pitch':
+            return {'pitch': pre_processing.PITCH_BACKENDS[self.pitch_backend](span, sr, center=False)}
+        rms, pitch = pre_processing.frame_pass(span, sr, self.shared_pitch, center=False)
+        frames = {}
+        if 'volume' in self.features:
+            frames['volume'] = pre_processing.gate_silence(rms)
+        if pitch is not None:
+            frames['pitch'] = pitch
+        return frames
+    def push(self, y):
+        '''
+        Add the next samples of the track.
+
+        Returns:
+        frames (dict): feature -> frames completed by these samples (features without any are left out).
+        '''
+        self.n_samples += len(y)
+        frames = {}
+        for name, stream in self.streams.items():
+            span = stream.push(y)
+            if len(span):
+                frames.update(self.compute(name, span))
+        return frames
+    def provisional(self):
+        '''
+        Frames still open at the end of the track as it stands, completed with zero padding as at the end
+        of a recording, without closing the streams.
+        '''
+        frames = {}
+        for name, stream in self.streams.items():
+            span = copy.deepcopy(stream).flush()
+            if len(span):
+                frames.update(self.compute(name, span))
+        return frames
+
+class TurnFold:
+    '''
+    Windows of one feature folded into analysed turns as they become final, as get_conversations,
+    Conversation.summarize_speakers, enrich_conversations and the p2r/r2r analyses would over the
+    whole conversation. Only the windows of the open turn, and any after it, are held on to.
+    '''
+    def __init__(self, n_speakers, u_length, min_turn_length):
+        self.u_length = u_length
+        self.min_turn_length = min_turn_length
+        self.window_sizes = None
+        self.longest = None
+        self.n_windows = 0 # windows added so far
+        self.start = 0 # first window still held
+        self.speaker_ids = np.zeros(0, dtype=np.int64) # loudest speaker of each held window
+        self.values = np.zeros((n_speakers, 0)) # speakers x held windows
+        self.scorer = processing.TurnScorer()
+    def add_windows(self, values, lengths):
+        '''
+        Add windows (speakers x windows values), given the number of windows of each speaker in the whole
+        conversation so far, whose longest speaker breaks ties as in pre_processing.loudest_speakers.
+        '''
+        self.speaker_ids = np.concatenate((self.speaker_ids, pre_processing.loudest_speakers(values, lengths)))
+        self.values = np.concatenate((self.values, values), axis=1)
+        self.n_windows += values.shape[1]
+    def fold(self, end=False):
+        '''
+        Close and score every turn that can no longer change.
+
+        Args:
+        end (bool): Treat the windows held as the end of the conversation, as a full run does.
+
+        Returns:
+        turns (dict): TURN_COLUMNS -> arrays, one entry per closed turn that is not silence.
+        '''
+        ids = self.speaker_ids
+        if len(ids) == 0:
+            return turn_columns([])
+        certain = len(ids)
+        if self.min_turn_length > 1 and not end:
+            runs = np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1])))
+            # A short last run may still grow long enough to take the turn, so it is not merged yet
+            if len(runs) > 1 and len(ids) - runs[-1] < self.min_turn_length:
+                certain = runs[-1]
+        merged = ids[:certain]
+        if self.min_turn_length > 1:
+            merged = pre_processing.merge_short_turns(merged, self.min_turn_length)
+        n = len(merged)
+        window_values = np.where(merged != -1, self.values[np.maximum(merged, 0), np.arange(n)], 0)
+        starts = np.flatnonzero(np.concatenate(([True], merged[1:] != merged[:-1])))
+        counts = np.diff(np.append(starts, n))
+        values = np.add.reduceat(window_values, starts)/counts
+        # The last run is still open, and a full run does not capture it either
+        closed = slice(0, len(starts) - 1)
+        start_times = ((self.start + starts[closed])*self.u_length).astype(np.float64)
+        end_times = (start_times + self.u_length) + (counts[closed] - 1)*self.u_length
+        rows = []
+        for speaker_id, start_time, end_time, value in zip(merged[starts][closed], start_times, end_times, values[closed]):
+            if speaker_id == -1: continue
+            p2r, r2r = self.scorer.score(int(speaker_id), value)
+            rows.append((speaker_id, start_time, end_time, value, p2r, r2r))
+        keep = starts[-1]
+        self.start += keep
+        self.speaker_ids = self.speaker_ids[keep:]
+        self.values = self.values[:, keep:]
+        return turn_columns(rows)
+
+def turn_columns(rows):
+    columns = list(zip(*rows)) if rows else [[] for _ in TURN_COLUMNS]
+    turns = {c: np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+             for c, values in zip(TURN_COLUMNS, columns)}
+    turns['speaker_id'] = turns['speaker_id'].astype(np.int64)
+    return turns
+
+class IncrementalAnalysis:
+    '''
+    State of one conversation between updates, kept in 'state_dir'.
+    '''
+    def __init__(self, state_dir, options, parameters, sampling_rates):
+        self.state_dir = state_dir
+        self.parameters = parameters
+        self.features = [f for f in INCREMENTAL_FEATURES if options.requested_features.get(f)]
+        self.analyses = [a for a, is_on in options.requested_analyses.items() if is_on]
+        self.tracks = [TrackFrames(sr, self.features, options.pitch_backend) for sr in sampling_rates]
+        self.frame_dtypes = {}
+        self.n_frames = {feature: [0]*len(self.tracks) for feature in self.features}
+        self.folds = {feature: TurnFold(len(self.tracks), options.u_length, options.min_turn_length)
+                      for feature in self.features}
+        self.n_turns = {feature: 0 for feature in self.features}
+    def frame_file(self, feature, speaker_id):
+        return AppendOnlyArray(os.path.join(self.state_dir, f"{feature}_{speaker_id}.frames"),
+                               self.frame_dtypes.get(feature, np.float64))
+    def turn_file(self, feature):
+        return AppendOnlyArray(os.path.join(self.state_dir, f"{feature}.turns"), np.float64, len(TURN_COLUMNS))
+    def save(self):
+        path = os.path.join(self.state_dir, STATE_FILE)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(self, f)
+        os.replace(path + ".tmp", path)
+    def discard_unsaved(self):
+        for feature in self.features:
+            for i in range(len(self.tracks)):
+                self.frame_file(feature, i).truncate(self.n_frames[feature][i])
+            self.turn_file(feature).truncate(self.n_turns[feature])
+    def read_tails(self, paths, duration):
+        '''
+        Decode what was added to each recording since the last update and extend its frame features.
+
+        Returns:
+        provisional (dict): feature -> per track, the frames still open at the end of the track.
+        '''
+        for i, (path, track) in enumerate(zip(paths, self.tracks)):
+            # As many samples as load_native reads for 'duration' seconds of the recording
+            with sf.SoundFile(path) as f:
+                n_samples = min(f.frames, int(duration*f.samplerate))
+                if n_samples < track.n_samples:
+                    print(f"{path} is shorter than when it was last analysed; start again with a new --state_dir")
+                    raise SystemExit(1)
+                f.seek(track.n_samples)
+                block = f.read(n_samples - track.n_samples, dtype='float32', always_2d=True)
+            y = block.mean(axis=1, dtype=np.float32) if block.shape[1] > 1 else np.ascontiguousarray(block[:, 0])
+            for feature, frames in track.push(y).items():
+                self.frame_dtypes.setdefault(feature, frames.dtype.str)
+                self.frame_file(feature, i).append(frames)
+                self.n_frames[feature][i] += len(frames)
+        provisional = {feature: [] for feature in self.features}
+        for track in self.tracks:
+            frames = track.provisional()
+            for feature in self.features:
+                provisional[feature].append(frames.get(feature, np.zeros(0, dtype=self.frame_dtypes.get(feature, np.float64))))
+        return provisional
+    def update_feature(self, feature, provisional, duration):
+        '''
+        Fold the windows of one feature that became final, then analyse the end of the conversation as it
+        stands on a copy of the fold.
+
+        Returns:
+        turns (dict): TURN_COLUMNS -> arrays of every turn of the conversation so far.
+        '''
+        n_final = self.n_frames[feature]
+        n_total = [n + len(p) for n, p in zip(n_final, provisional)]
+        # As clean_up sizes the windows of each track
+        window_sizes = [int(n*self.folds[feature].u_length/duration) for n in n_total]
+        if min(window_sizes) <= 0:
+            return turn_columns([])
+        lengths = np.array([-(-n // size) for n, size in zip(n_total, window_sizes)], dtype=np.int64)
+        fold = self.folds[feature]
+        longest = int(np.argmax(lengths))
+        if fold.n_windows and (fold.window_sizes != window_sizes or fold.longest != longest):
+            print(f"Window sizes of {feature} changed, rebuilding its turns from the stored frames...")
+            fold = self.folds[feature] = TurnFold(len(self.tracks), fold.u_length, fold.min_turn_length)
+            self.turn_file(feature).truncate(0)
+            self.n_turns[feature] = 0
+        fold.window_sizes = window_sizes
+        fold.longest = longest
+        n_windows = min(n//size for n, size in zip(n_final, window_sizes))
+        if n_windows > fold.n_windows:
+            values = np.array([pre_processing.downsample(self.frame_file(feature, i).read(fold.n_windows*size, n_windows*size), size)
+                               for i, size in enumerate(window_sizes)])
+            fold.add_windows(values, lengths)
+            turns = fold.fold()
+            self.turn_file(feature).append(np.column_stack([turns[c] for c in TURN_COLUMNS]))
+            self.n_turns[feature] += len(turns['speaker_id'])
+        # The rest of each track, up to its ragged last window, zero padded like UtteranceMatrix
+        end = np.zeros((len(self.tracks), int(lengths.max()) - n_windows))
+        for i, size in enumerate(window_sizes):
+            frames = np.concatenate((self.frame_file(feature, i).read(n_windows*size), provisional[i]))
+            if len(frames):
+                end[i, :lengths[i] - n_windows] = pre_processing.downsample(frames, size)
+        end_fold = copy.deepcopy(fold)
+        end_fold.add_windows(end, lengths)
+        end_turns = end_fold.fold(end=True)
+        stored = self.turn_file(feature).read()
+        return {c: np.concatenate((stored[:, j].astype(end_turns[c].dtype), end_turns[c])) for j, c in enumerate(TURN_COLUMNS)}
+    def conversation(self, turns):
+        columns = UtteranceColumns(turns['value'], turns['speaker_id'], turns['start_time'], turns['end_time'],
+                                   turns['p2r'] if 'p2r' in self.analyses else None,
+                                   turns['r2r'] if 'r2r' in self.analyses else None)
+        u_length = self.folds[self.features[0]].u_length
+        return Conversation(len(columns)*u_length, columns, u_length)
+
+def unsupported_options(options):
+    unsupported = [f"--{f}" for f, is_on in options.requested_features.items() if is_on and f not in INCREMENTAL_FEATURES]
+    for flag, is_on in [('--joint', options.joint_on), ('--vad', options.vad_on), ('--denoise', options.denoise_on),
+                        ('--stream', options.stream_on), ('--start_time', options.start_time)]:
+        if is_on:
+            unsupported.append(flag)
+    return unsupported
+
+def load_analysis(state_dir, options, paths, fixed_duration=None):
+    '''
+    The state kept in 'state_dir', or a new one if there is none yet.
+    '''
+    # Unless fixed, the duration grows with the recordings; the audio is always decoded at its own rate, unstreamed
+    extraction = {k: v for k, v in pre_processing.extraction_parameters(options).items()
+                  if k not in ('duration', 'streamed', 'native_rate')}
+    parameters = {'paths': [os.path.abspath(path) for path in paths], 'u_length': options.u_length,
+                  'min_turn_length': options.min_turn_length, 'features': options.requested_features,
+                  'analyses': options.requested_analyses, 'extraction': extraction, 'duration': fixed_duration}
+    path = os.path.join(state_dir, STATE_FILE)
+    if not os.path.exists(path):
+        os.makedirs(state_dir, exist_ok=True)
+        sampling_rates = [sf.info(path).samplerate for path in paths]
+        for path, sr in zip(paths, sampling_rates):
+            if (pre_processing.HOP_LENGTH*sr) % pre_processing.SAMPLING_RATE != 0:
+                print(f"{path} is sampled at {sr} Hz, on which frames do not fall on whole samples; "
+                      f"incremental analysis needs a multiple of {pre_processing.SAMPLING_RATE//2} Hz")
+                raise SystemExit(1)
+        return IncrementalAnalysis(state_dir, options, parameters, sampling_rates)
+    with open(path, "rb") as f:
+        analysis = pickle.load(f)
+    if analysis.parameters != parameters:
+        print(f"{state_dir} holds the analysis of other recordings or options; use a new --state_dir")
+        raise SystemExit(1)
+    analysis.state_dir = state_dir
+    analysis.discard_unsaved()
+    return analysis
+
+def update(options, state_dir, fixed_duration=None):
+    '''
+    Bring the analysis kept in 'state_dir' up to date with the recordings of options.file_paths, up to
+    options.duration seconds of them.
+
+    Args:
+    options: An AnalysisOptions object.
+    state_dir (str): Directory holding the conversation's state, created on the first update.
+    fixed_duration (int): The duration given on the command line (--duration), which every update of the
+    state must keep to; None when the conversation runs to the end of the first recording as it grows.
+
+    Returns:
+    conversations (list): Analysed Conversation objects without silences, one per feature, as
+    processing.extract_analyses returns them at the end of a full run.
+    labels (list): Feature label of each conversation.
+    '''
+    unsupported = unsupported_options(options)
+    if unsupported:
+        print(f"Incremental analysis does not support {', '.join(unsupported)}")
+        raise SystemExit(1)
+    paths = options.file_paths
+    analysis = load_analysis(state_dir, options, paths, fixed_duration)
+    # Read from the first recording's header on this run (as construct_analysis_options does) unless fixed
+    duration = options.duration
+    print(f"Analysing {', '.join(analysis.features)} of the new audio in {', '.join(paths)}...")
+    provisional = analysis.read_tails(paths, duration)
+    conversations = []
+    for feature in analysis.features:
+        conversations.append(analysis.conversation(analysis.update_feature(feature, provisional[feature], duration)))
+    analysis.save()
+    return conversations, analysis.features
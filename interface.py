@@ -1,9 +1,13 @@
 import os
 import argparse
-import librosa
+
+from feature_cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
 
 AUDIO_EXTENSIONS = ['.mp3', '.wav', '.ogg', '.flac']
 SUPPORTED_FEATURES = ["volume", "pitch", "cadence"]
+PITCH_BACKENDS = ["piptrack", "autocorrelation"]
+PLOT_FORMATS = ["png", "svg"]
+EXPORT_FORMATS = ["csv", "parquet"]
 
 DEFAULT_U_LENGTH = 3 # 3-second utterances
 DEFAULT_START_TIME = 0
@@ -11,7 +15,13 @@ DEFAULT_DURATION = 240 # 4 minutes
 
 class AnalysisOptions:
     def __init__(self, file_paths, u_length, start_time, duration, 
-                 requested_features, transcription_on, requested_analyses):
+                 requested_features, transcription_on, requested_analyses,
+                 cache_on=True, cache_dir=DEFAULT_CACHE_DIR, cache_size=DEFAULT_CACHE_SIZE, stream_on=False,
+                 pitch_backend=PITCH_BACKENDS[0], plot_dir=None, plot_format=PLOT_FORMATS[0],
+                 export_dir=None, export_format=EXPORT_FORMATS[0], denoise_on=False,
+                 profile_on=False, profile_json=None, profile_trace=None, profile_cprofile_dir=None,
+                 min_turn_length=1, joint_on=False, plot_on=True, rolling_turns=None, rolling_seconds=None,
+                 pairwise_on=False, native_rate_on=False, vad_on=False):
         self.file_paths = file_paths
         self.u_length = u_length
         self.start_time = start_time
@@ -19,6 +29,28 @@ class AnalysisOptions:
         self.requested_features = requested_features
         self.transcription_on = transcription_on
         self.requested_analyses = requested_analyses
+        self.cache_on = cache_on
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.stream_on = stream_on
+        self.pitch_backend = pitch_backend
+        self.plot_dir = plot_dir
+        self.plot_format = plot_format
+        self.export_dir = export_dir
+        self.export_format = export_format
+        self.denoise_on = denoise_on
+        self.profile_on = profile_on
+        self.profile_json = profile_json
+        self.profile_trace = profile_trace
+        self.profile_cprofile_dir = profile_cprofile_dir
+        self.min_turn_length = min_turn_length
+        self.joint_on = joint_on
+        self.plot_on = plot_on
+        self.rolling_turns = rolling_turns
+        self.rolling_seconds = rolling_seconds
+        self.pairwise_on = pairwise_on
+        self.native_rate_on = native_rate_on
+        self.vad_on = vad_on
 
 def setup_interface_parser():
     '''
@@ -33,15 +65,151 @@ def setup_interface_parser():
     # set up command line arguments
     parser = argparse.ArgumentParser(description='Analyze some recordings.')
     parser.add_argument("audio_list", help="path to file containing list of audio file paths")
+    parser.add_argument("--state_dir", help="keep the analysis in this directory between runs, and only analyse audio added to the recordings since the last run (recordings that keep growing)")
+    add_analysis_arguments(parser)
+    return parser.parse_args()
+
+def setup_batch_parser():
+    '''
+    Set up argument parser for a command-line interface to analyze many conversations in parallel.
+
+    Returns:
+    parser.parse_args(): Parsed command-line arguments.
+    '''
+    parser = argparse.ArgumentParser(description='Analyze a batch of recorded conversations.')
+    parser.add_argument("manifest", help="path to file listing one audio list (conversation) per line")
+    parser.add_argument("--jobs", type=int, help="number of worker processes (default all cores)")
+    parser.add_argument("--output", help="path to write compact JSON results to")
+    add_analysis_arguments(parser)
+    return parser.parse_args()
+
+def setup_online_parser():
+    '''
+    Set up argument parser for replaying recordings through the online mirroring detector.
+
+    Returns:
+    parser.parse_args(): Parsed command-line arguments.
+    '''
+    parser = argparse.ArgumentParser(description='Score mirroring live while replaying some recordings.')
+    parser.add_argument("audio_list", help="path to file containing list of audio file paths, one per speaker")
+    parser.add_argument("--u_length", type=int, help=f"length of utterance in sec (default {DEFAULT_U_LENGTH}s)")
+    parser.add_argument("--speed", type=float, help="playback speed relative to real time, 0 for as fast as possible (default 1)")
+    parser.add_argument("--block", type=float, help="seconds of audio delivered per step (default 0.1s)")
+    add_rolling_arguments(parser)
+    return parser.parse_args()
+
+def setup_sweep_parser():
+    '''
+    Set up argument parser for analysing one conversation over a grid of utterance lengths and silence thresholds.
+
+    Returns:
+    parser.parse_args(): Parsed command-line arguments.
+    '''
+    parser = argparse.ArgumentParser(description='Analyze some recordings over a range of parameters.')
+    parser.add_argument("audio_list", help="path to file containing list of audio file paths")
+    parser.add_argument("--u_lengths", type=int, nargs='+', help="lengths of utterance in sec to sweep, e.g. 1 2 3 5 10")
+    parser.add_argument("--rms_thresholds", type=float, nargs='+', help="volume silence thresholds to sweep (default only 0.1)")
+    parser.add_argument("--jobs", type=int, help="number of worker processes analysing parameter sets (default all cores)")
+    parser.add_argument("--output", help="path to write compact JSON results, keyed by parameter set, to")
+    add_analysis_arguments(parser)
+    return parser.parse_args()
+
+def setup_denoise_parser():
+    '''
+    Set up argument parser for denoising recordings ahead of analysis.
+
+    Returns:
+    parser.parse_args(): Parsed command-line arguments.
+    '''
+    parser = argparse.ArgumentParser(description='Reduce noise in some recordings.')
+    parser.add_argument("inputs", nargs='+', help="audio lists (.txt, one audio path per line) or glob patterns of audio files")
+    parser.add_argument("--output_dir", help="directory to write '<name>_clean.wav' files to (default next to each input)")
+    parser.add_argument("--jobs", type=int, help="number of worker processes (default all cores)")
+    parser.add_argument("--chunk", type=float, help="seconds of audio denoised at a time (default 60s)")
+    parser.add_argument("--stationary", help="assume the noise is stationary", action='store_true')
+    parser.add_argument("--prop_decrease", type=float, help="proportion to reduce the noise by, between 0 and 1 (default 1)")
+    parser.add_argument("--force", help="denoise again even if the output is up to date", action='store_true')
+    return parser.parse_args()
+
+def setup_overlay_parser():
+    '''
+    Set up argument parser for mixing each conversation's tracks down to one.
+
+    Returns:
+    parser.parse_args(): Parsed command-line arguments.
+    '''
+    parser = argparse.ArgumentParser(description='Mix down the recordings of some conversations.')
+    parser.add_argument("audio_lists", nargs='+', help="paths to files containing lists of audio file paths, one per conversation")
+    parser.add_argument("--output_dir", help="directory to write '<conversation>_overlay.wav' files to (default current directory)")
+    parser.add_argument("--jobs", type=int, help="number of worker processes (default all cores)")
+    return parser.parse_args()
+
+def setup_benchmark_parser():
+    '''
+    Set up argument parser for the benchmarks, including the synthetic conversation the stages are timed on.
+
+    Returns:
+    parser.parse_args(): Parsed command-line arguments.
+    '''
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline.')
+    parser.add_argument("names", nargs='*', help="benchmarks to run (default all)")
+    parser.add_argument("--speakers", type=int, default=3, help="speakers in the synthetic conversation (default 3)")
+    parser.add_argument("--duration", type=int, default=DEFAULT_DURATION, help=f"length of the synthetic conversation in sec (default {DEFAULT_DURATION}s)")
+    parser.add_argument("--turn", type=float, default=3.0, help="mean length of a turn in sec (default 3s)")
+    parser.add_argument("--silence", type=float, default=0.3, help="share of the conversation where nobody speaks (default 0.3)")
+    parser.add_argument("--turn_taking", choices=["random", "round_robin"], default="random", help="who speaks next (default random)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the synthetic conversation (default 0)")
+    parser.add_argument("--u_length", type=int, default=DEFAULT_U_LENGTH, help=f"length of utterance in sec (default {DEFAULT_U_LENGTH}s)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the best is kept (default 3)")
+    parser.add_argument("--json", help="path to write the stage results to")
+    return parser.parse_args()
+
+def add_analysis_arguments(parser):
+    '''
+    Add the options shared by every entry point that analyzes conversations.
+
+    Args:
+    parser (argparse.ArgumentParser): The parser to extend.
+    '''
     parser.add_argument("--u_length", type=int, help="length of utterance in sec, adjusts analysis fidelity (default 2s)")
+    parser.add_argument("--min_turn", type=int, help="utterances a speaker must hold the floor for to take a turn, shorter runs are merged into the previous turn (default 1)")
     parser.add_argument("--start_time", type=int, help="start time in seconds (default min)")
     parser.add_argument("--duration", type=int, help="duration in seconds (default max)")
     for label in SUPPORTED_FEATURES:
         parser.add_argument(f"--{label}", help=f"analyze {label} mirroring in the conversation", action='store_true')
+    parser.add_argument("--joint", help="segment turns once by volume and analyze every feature over the same turns", action='store_true')
+    parser.add_argument("--pitch_backend", choices=PITCH_BACKENDS, help=f"pitch estimator (default {PITCH_BACKENDS[0]})")
     parser.add_argument("--transcription", help="print a transcription of speaker, value, length for each utterance in conversation", action='store_true')
     parser.add_argument("--r2r", help="score speakers on response to response", action='store_true')
     parser.add_argument("--p2r", help="score speakers on prompt to response", action='store_true')
-    return parser.parse_args()
+    parser.add_argument("--pairwise", help="print (and export) mean prompt to response per prompter and responder pair", action='store_true')
+    parser.add_argument("--vad", help="gate volume by speaker activity (adaptive noise floors, bleed suppression, pause bridging) instead of a fixed silence threshold", action='store_true')
+    parser.add_argument("--denoise", help="reduce noise in recordings as they are decoded (needs noisereduce)", action='store_true')
+    parser.add_argument("--native_rate", help="decode recordings at their own rate and scale frame lengths to it, instead of resampling to 22050 Hz (whole-file decoding only)", action='store_true')
+    parser.add_argument("--stream", help="read recordings block by block to keep memory bounded on long recordings", action='store_true')
+    parser.add_argument("--no-cache", help="always decode recordings and extract features again", action='store_true')
+    parser.add_argument("--cache-dir", help=f"directory for cached features (default {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--cache-size", type=int, help=f"cache size limit in MB (default {DEFAULT_CACHE_SIZE})")
+    parser.add_argument("--no_plot", help="skip plotting, e.g. when only a transcription or an export is wanted", action='store_true')
+    parser.add_argument("--plot_dir", help="save plots to this directory in the background instead of showing them")
+    parser.add_argument("--plot_format", choices=PLOT_FORMATS, help=f"image format of saved plots (default {PLOT_FORMATS[0]})")
+    parser.add_argument("--export_dir", help="append per-utterance and per-speaker result tables to this directory")
+    parser.add_argument("--export_format", choices=EXPORT_FORMATS, help=f"format of exported tables, parquet needs pyarrow (default {EXPORT_FORMATS[0]})")
+    add_rolling_arguments(parser)
+    parser.add_argument("--profile", help="print wall time, CPU time and peak memory of each stage", action='store_true')
+    parser.add_argument("--profile_json", help="also write the stage timings to this JSON file (implies --profile)")
+    parser.add_argument("--profile_trace", help="also write the stages as a Chrome trace to this file (implies --profile)")
+    parser.add_argument("--profile_cprofile", help="dump a cProfile .prof file per stage to this directory (implies --profile)")
+
+def add_rolling_arguments(parser):
+    '''
+    Add the window options of rolling mirroring statistics (see rolling.py).
+
+    Args:
+    parser (argparse.ArgumentParser): The parser to extend.
+    '''
+    parser.add_argument("--rolling_turns", type=int, help="follow p2r/r2r per speaker pair over the last N scored turns (exported as a rolling table)")
+    parser.add_argument("--rolling_seconds", type=float, help="follow p2r/r2r per speaker pair over the last T seconds (exported as a rolling table)")
 
 def construct_analysis_options(args):
     audio_paths = []
@@ -51,11 +219,35 @@ def construct_analysis_options(args):
     requested_features = {}
     transcription_on = False
     requested_analyses = {}
+    cache_on = True
+    cache_dir = DEFAULT_CACHE_DIR
+    cache_size = DEFAULT_CACHE_SIZE
+    stream_on = False
+    pitch_backend = PITCH_BACKENDS[0]
+    plot_dir = None
+    plot_format = PLOT_FORMATS[0]
+    export_dir = None
+    export_format = EXPORT_FORMATS[0]
+    denoise_on = False
+    profile_on = False
+    profile_json = None
+    profile_trace = None
+    profile_cprofile_dir = None
+    min_turn_length = 1
+    joint_on = False
+    plot_on = True
+    rolling_turns = None
+    rolling_seconds = None
+    pairwise_on = False
+    native_rate_on = False
+    vad_on = False
     if args.audio_list:
         audio_paths = parse_audio_paths(args.audio_list, AUDIO_EXTENSIONS)
-        duration = librosa.get_duration(filename=audio_paths[0])
+        duration = get_duration(audio_paths[0])
     if args.u_length:
         u_length = args.u_length
+    if args.min_turn:
+        min_turn_length = args.min_turn
     if args.start_time:
         start_time = args.start_time
     if args.duration:
@@ -68,6 +260,10 @@ def construct_analysis_options(args):
         requested_features['cadence'] = True
     if not bool(requested_features):
         requested_features['volume'] = True
+    if args.joint:
+        joint_on = True
+        # Turns are segmented by volume, so it is always extracted in joint mode
+        requested_features = {'volume': True, **requested_features}
     if args.transcription:
         transcription_on = True
     if args.p2r:
@@ -76,11 +272,91 @@ def construct_analysis_options(args):
         requested_analyses['r2r'] = True
     if not bool(requested_analyses):
         requested_analyses['p2r'] = True
+    if args.no_cache:
+        cache_on = False
+    if args.cache_dir:
+        cache_dir = args.cache_dir
+    if args.cache_size:
+        cache_size = args.cache_size
+    if args.stream:
+        stream_on = True
+    if args.native_rate:
+        native_rate_on = True
+    if args.vad:
+        vad_on = True
+    if args.pitch_backend:
+        pitch_backend = args.pitch_backend
+    if args.no_plot:
+        plot_on = False
+    if args.plot_dir:
+        plot_dir = args.plot_dir
+    if args.plot_format:
+        plot_format = args.plot_format
+    if args.export_dir:
+        export_dir = args.export_dir
+    if args.export_format:
+        export_format = args.export_format
+    if args.denoise:
+        denoise_on = True
+    if args.pairwise:
+        pairwise_on = True
+    if args.rolling_turns:
+        rolling_turns = args.rolling_turns
+    if args.rolling_seconds:
+        rolling_seconds = args.rolling_seconds
+    if args.profile_json:
+        profile_json = args.profile_json
+    if args.profile_trace:
+        profile_trace = args.profile_trace
+    if args.profile_cprofile:
+        profile_cprofile_dir = args.profile_cprofile
+    if args.profile or profile_json or profile_trace or profile_cprofile_dir:
+        profile_on = True
     return AnalysisOptions(audio_paths, u_length, start_time, duration, requested_features, 
-                           transcription_on, requested_analyses)
+                           transcription_on, requested_analyses, cache_on, cache_dir, cache_size, stream_on,
+                           pitch_backend, plot_dir, plot_format, export_dir, export_format,
+                           denoise_on, profile_on, profile_json, profile_trace, profile_cprofile_dir,
+                           min_turn_length, joint_on, plot_on, rolling_turns, rolling_seconds,
+                           pairwise_on, native_rate_on, vad_on)
 
 # Helpers
 
+def parse_manifest(manifest):
+    '''
+    Read a batch manifest, skipping blank lines and '#' comments.
+
+    Args:
+    manifest (str): Path to a file listing one audio list per line.
+
+    Returns:
+    list: (conversation_id, audio_list) tuples in manifest order.
+    '''
+    with open(manifest, "r") as f:
+        lines = [line.strip() for line in f.read().splitlines()]
+    entries = []
+    for line in lines:
+        if not line or line.startswith('#'): continue
+        entries.append((conversation_id(line), line))
+    return entries
+
+def conversation_id(audio_list):
+    '''
+    Label of the conversation described by an audio list: the list's file name without extension.
+    '''
+    return os.path.splitext(os.path.basename(audio_list))[0]
+
+def get_duration(path):
+    '''
+    Duration of an audio file in seconds, read from its header rather than by decoding it.
+    '''
+    import soundfile as sf
+    try:
+        return sf.info(path).duration
+    except RuntimeError:
+        # Formats libsndfile cannot open (e.g. mp3 with older versions) go through librosa's decoders
+        import librosa
+        return librosa.get_duration(path=path)
+
 def parse_audio_paths(audio_list, allowed_extensions):
     # Capture audio paths
     with open(audio_list, "r") as f:
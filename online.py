@@ -0,0 +1,208 @@
+import time
+import numpy as np
+
+import interface
+from rolling import RollingMirroring
+from processing import TurnScorer
+from conversation_model import Utterance
+from pre_processing import SAMPLING_RATE, FRAME_LENGTH, HOP_LENGTH, rmse_frames, downsample
+from streaming import FrameStream, read_blocks
+
+'''
+Online mirroring detection. The offline pipeline loads whole recordings, builds a Conversation and then
+analyses it; here the same steps run incrementally on audio as it arrives:
+- RMS frames are computed per speaker as soon as enough samples are buffered (see streaming.FrameStream)
+- every u_length window is assigned to its loudest speaker, as in pre_processing.get_conversations
+- consecutive windows of the same speaker are folded into one turn, as in Conversation.summarize_speakers
+- when a turn closes, its p2r and r2r are scored against carried state (see processing.TurnScorer)
+Turns are therefore reported at most one window after they end. Optionally, each reported turn also
+updates rolling p2r/r2r statistics of its speaker pair (see rolling.RollingMirroring), in O(1) per turn.
+'''
+
+class OnlineMirroringDetector:
+    def __init__(self, n_speakers, u_length, sampling_rate=SAMPLING_RATE):
+        self.n_speakers = n_speakers
+        self.u_length = u_length
+        # Truncated like clean_up's int(len(data)*u_length/duration): a recording has one frame more than its
+        # duration times the frame rate, which only tips the window size over for recordings of a few windows
+        self.frames_per_window = max(1, int(u_length*sampling_rate/HOP_LENGTH))
+        # Audio actually covered by one window, which the truncation above makes slightly short of u_length
+        self.window_duration = self.frames_per_window*HOP_LENGTH/sampling_rate
+        self.streams = [FrameStream(FRAME_LENGTH, HOP_LENGTH) for _ in range(n_speakers)]
+        self.pending = [np.zeros(0) for _ in range(n_speakers)]
+        self.n_windows = 0
+        # Open turn: speaker, first window, and running sum and count of its window values
+        self.turn_speaker = None
+        self.turn_start = 0
+        self.turn_sum = 0.0
+        self.turn_count = 0
+        self.scorer = TurnScorer()
+    def push(self, speaker_id, y):
+        '''
+        Add newly arrived samples for one speaker.
+
+        Args:
+        speaker_id (int): Index of the speaker's track.
+        y (np.ndarray): Mono samples at the detector's sampling rate.
+
+        Returns:
+        turns (list): Utterances, with p2r and r2r filled in, for every turn that closed.
+        '''
+        span = self.streams[speaker_id].push(y)
+        if len(span):
+            self.pending[speaker_id] = np.concatenate((self.pending[speaker_id], rmse_frames(span, center=False)))
+        return self.close_windows()
+    def close_windows(self):
+        turns = []
+        # A window can only be assigned once every speaker has all of its frames
+        n_ready = min(len(p) for p in self.pending)//self.frames_per_window
+        if n_ready == 0:
+            return turns
+        n_frames = n_ready*self.frames_per_window
+        windows = np.array([downsample(p[:n_frames], self.frames_per_window) for p in self.pending])
+        self.pending = [p[n_frames:] for p in self.pending]
+        for values in windows.T:
+            turn = self.add_window(values)
+            if turn is not None:
+                turns.append(turn)
+        return turns
+    def add_window(self, values):
+        '''
+        Assign one window to its loudest speaker (-1 for silence) and fold it into the open turn.
+        Returns the turn it closed, if any.
+        '''
+        speaker_id = int(np.argmax(values)) if values.max() > 0 else -1
+        value = values[speaker_id] if speaker_id != -1 else 0
+        closed = None
+        if speaker_id != self.turn_speaker:
+            closed = self.close_turn()
+            self.turn_speaker = speaker_id
+            self.turn_start = self.n_windows
+            self.turn_sum = 0.0
+            self.turn_count = 0
+        self.turn_sum += value
+        self.turn_count += 1
+        self.n_windows += 1
+        return closed
+    def close_turn(self):
+        '''
+        Score the open turn and return it, unless it is silence (which enrich_conversations drops).
+        '''
+        if self.turn_speaker is None or self.turn_speaker == -1:
+            return None
+        start_time = self.turn_start*self.u_length
+        turn = Utterance(self.turn_sum/self.turn_count, self.turn_speaker, start_time,
+                         start_time + self.turn_count*self.u_length)
+        turn.p2r, turn.r2r = self.scorer.score(turn.speaker_id, turn.value)
+        return turn
+    def close(self):
+        '''
+        End of the session: score whatever is left. Unlike the offline fold, the final turn is reported.
+        '''
+        for speaker_id, stream in enumerate(self.streams):
+            span = stream.flush()
+            if len(span):
+                self.pending[speaker_id] = np.concatenate((self.pending[speaker_id], rmse_frames(span, center=False)))
+        turns = self.close_windows()
+        # Assign the ragged last window too, then close the open turn
+        if max(len(p) for p in self.pending) > 0:
+            n_frames = max(len(p) for p in self.pending)
+            values = np.array([downsample(np.pad(p, (0, n_frames - len(p))), n_frames)[0] for p in self.pending])
+            turn = self.add_window(values)
+            if turn is not None:
+                turns.append(turn)
+        turn = self.close_turn()
+        if turn is not None:
+            turns.append(turn)
+        return turns
+
+def replay(paths, u_length, block_duration=0.1, speed=1.0, rolling=None):
+    '''
+    Simulated live source: replay one recording per speaker at real-time speed through an online detector.
+
+    Args:
+    paths (list): One audio file per speaker.
+    u_length (int): Utterance window length in seconds.
+    block_duration (float): Seconds of audio delivered per speaker per step.
+    speed (float): Playback speed relative to real time; 0 replays as fast as possible.
+    rolling (RollingMirroring): Rolling statistics to update and print with each turn (default none).
+
+    Returns:
+    turns (list): Every turn the detector reported, in order.
+    latencies (list): For each turn, seconds between the audio that closed it arriving and it being reported.
+    '''
+    detector = OnlineMirroringDetector(len(paths), u_length)
+    block_length = int(block_duration*SAMPLING_RATE)
+    sources = [read_blocks(path, SAMPLING_RATE, block_length=block_length) for path in paths]
+    buffers = [np.zeros(0, dtype=np.float32) for _ in paths]
+    turns = []
+    latencies = []
+    n_delivered = 0
+    start = time.perf_counter()
+    exhausted = False
+    while not exhausted:
+        # Resampled blocks vary in size, so deliver exactly 'block_length' samples per speaker per step
+        for i, source in enumerate(sources):
+            while len(buffers[i]) < block_length:
+                y = next(source, None)
+                if y is None: break
+                buffers[i] = np.concatenate((buffers[i], y))
+        n_samples = min(block_length, min(len(b) for b in buffers))
+        exhausted = n_samples < block_length
+        n_delivered += n_samples
+        arrival = start + n_delivered/SAMPLING_RATE/speed if speed > 0 else time.perf_counter()
+        if speed > 0:
+            time.sleep(max(0.0, arrival - time.perf_counter()))
+        for i in range(len(paths)):
+            closed = detector.push(i, buffers[i][:n_samples])
+            buffers[i] = buffers[i][n_samples:]
+            for turn in closed:
+                # The window after the turn is the one that closed it; it ended when its last sample arrived
+                window_end = (turn.end_time/u_length + 1)*detector.window_duration
+                available = start + window_end/speed if speed > 0 else arrival
+                turns.append(turn)
+                latencies.append(max(0.0, time.perf_counter() - max(available, start)))
+                report_turn(turn, rolling)
+    for turn in detector.close():
+        turns.append(turn)
+        report_turn(turn, rolling)
+    return turns, latencies
+
+def report_turn(turn, rolling=None):
+    print_turn(turn)
+    if rolling is not None:
+        prompter, statistics = rolling.add_turn(turn.speaker_id, turn.start_time, {'p2r': turn.p2r, 'r2r': turn.r2r})
+        if prompter != -1:
+            print_rolling(prompter, turn.speaker_id, statistics)
+
+def print_turn(turn):
+    p2r = f"{turn.p2r:.3f}" if turn.p2r is not None else "-"
+    r2r = f"{turn.r2r:.3f}" if turn.r2r is not None else "-"
+    print(f"Speaker {turn.speaker_id}: {turn.value:.4f} for {turn.length}s (p2r {p2r}, r2r {r2r})")
+
+def print_rolling(prompter, speaker_id, statistics):
+    for analysis, (n, mean, variance, slope) in statistics.items():
+        if n == 0: continue
+        slope = f"{slope:+.4f}/s" if not np.isnan(slope) else "-"
+        print(f"    {analysis} {prompter}->{speaker_id} over {n} turns: mean {mean:.3f}, sd {np.sqrt(variance):.3f}, slope {slope}")
+
+def print_latencies(latencies, u_length):
+    if not latencies:
+        print("No turns closed during the session")
+        return
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    print(f"Turn latency over {len(latencies)} turns: p50 {1000*p50:.1f} ms, p90 {1000*p90:.1f} ms, "
+          f"p99 {1000*p99:.1f} ms, max {1000*max(latencies):.1f} ms (budget {1000*u_length} ms)")
+
+if __name__ == '__main__':
+    args = interface.setup_online_parser()
+    paths = interface.parse_audio_paths(args.audio_list, interface.AUDIO_EXTENSIONS)
+    u_length = args.u_length if args.u_length else interface.DEFAULT_U_LENGTH
+    speed = args.speed if args.speed is not None else 1.0
+    block_duration = args.block if args.block else 0.1
+    rolling = None
+    if args.rolling_turns or args.rolling_seconds:
+        rolling = RollingMirroring(args.rolling_turns, args.rolling_seconds)
+    print(f"⏳ Replaying {len(paths)} speakers at {speed}x...")
+    turns, latencies = replay(paths, u_length, block_duration, speed, rolling)
+    print_latencies(latencies, u_length)
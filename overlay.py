@@ -1,18 +1,95 @@
-from pydub import AudioSegment
+import os
+import numpy as np
+import soundfile as sf
+from concurrent.futures import ProcessPoolExecutor
 
-audio_path = "./data/audio/clean/conv_0{}_pid{}_clean.wav"
-output_path = "conv_0{}_overlay.wav"
-for i in range(1,7):
-    # Load the three audio files
-    audio_p1 = AudioSegment.from_wav(audio_path.format(i,1))
-    audio_p2 = AudioSegment.from_wav(audio_path.format(i,2))
-    audio_p3 = AudioSegment.from_wav(audio_path.format(i,3))
+import interface
 
-    # Set the length of the output file to the length of the input files
-    length = len(audio_p1)
+'''
+Mix the per-speaker tracks of each conversation down to a single track, e.g. for listening back.
+Tracks are read and summed a block at a time, so memory stays at a few blocks however long the
+conversation is, and any number of speakers can be mixed. As with overlaying onto the first track,
+the mix takes the first track's length, sampling rate, channels and sample format.
+'''
 
-    # Overlay the three audio files into a single file
-    output = audio_p1.overlay(audio_p2).overlay(audio_p3)
+MIX_BLOCK_LENGTH = 1 << 16 # samples per block
 
-    # Save the output file
-    output.export(output_path.format(i), format="wav")
\ No newline at end of file
+def mixdown(paths, output_path, block_length=MIX_BLOCK_LENGTH):
+    '''
+    Sum several tracks into one, clipping the sum to full scale.
+
+    Args:
+    paths (list): Audio files, one per speaker; the first sets the length and format of the mix.
+    output_path (str): Where to write the mix, as WAV.
+    block_length (int): Samples to read from each track at a time.
+
+    Returns:
+    n_clipped (int): Number of output samples that had to be clipped.
+    '''
+    tracks = [sf.SoundFile(path) for path in paths]
+    try:
+        first = tracks[0]
+        for path, track in zip(paths, tracks):
+            if track.samplerate != first.samplerate:
+                raise ValueError(f"{path} is sampled at {track.samplerate} Hz, expected {first.samplerate} Hz like {paths[0]}")
+        n_clipped = 0
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        try:
+            with sf.SoundFile(tmp_path, "w", samplerate=first.samplerate, channels=first.channels,
+                              subtype=first.subtype, format='WAV') as out:
+                for _ in range(0, first.frames, block_length):
+                    mix = first.read(block_length, dtype='float32', always_2d=True)
+                    for track in tracks[1:]:
+                        # Shorter tracks simply stop contributing; longer ones are cut at the first track's end
+                        block = track.read(len(mix), dtype='float32', always_2d=True)
+                        if block.shape[1] != mix.shape[1]:
+                            # Different channel layouts are mixed in as mono
+                            block = block.mean(axis=1, keepdims=True)
+                        mix[:len(block)] += block
+                    n_clipped += int(np.count_nonzero(np.abs(mix) > 1))
+                    out.write(np.clip(mix, -1, 1, out=mix))
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            # Don't leave a half-written mix behind
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    finally:
+        for track in tracks:
+            track.close()
+    return n_clipped
+
+def overlay_path(audio_list, output_dir=None):
+    return os.path.join(output_dir if output_dir else ".", f"{interface.conversation_id(audio_list)}_overlay.wav")
+
+def mixdown_conversations(audio_lists, output_dir, jobs):
+    '''
+    Mix down every conversation, fanning them out over a pool of worker processes.
+
+    Returns:
+    results (list): (audio_list, output_path, n_clipped or error message) tuples, in input order.
+    '''
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = []
+        for audio_list in audio_lists:
+            paths = interface.parse_audio_paths(audio_list, interface.AUDIO_EXTENSIONS)
+            futures.append(executor.submit(mixdown, paths, overlay_path(audio_list, output_dir)))
+        for audio_list, future in zip(audio_lists, futures):
+            try:
+                results.append((audio_list, overlay_path(audio_list, output_dir), future.result()))
+            except Exception as e:
+                results.append((audio_list, None, f"{type(e).__name__}: {e}"))
+    return results
+
+if __name__ == '__main__':
+    args = interface.setup_overlay_parser()
+    jobs = max(1, min(args.jobs if args.jobs else os.cpu_count(), len(args.audio_lists)))
+    print(f"⏳ Mixing down {len(args.audio_lists)} conversations on {jobs} worker(s)...")
+    for audio_list, output_path, n_clipped in mixdown_conversations(args.audio_lists, args.output_dir, jobs):
+        if output_path is None:
+            print(f"❌ {audio_list}: {n_clipped}")
+        else:
+            print(f"✅ {output_path}: {n_clipped} samples clipped")
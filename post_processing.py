@@ -1,176 +1,158 @@
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
+import os
+from concurrent.futures import ProcessPoolExecutor
 
-def visualize(options, conversations):
-    for c in conversations:
-        for analysis, is_on in options.requested_analyses.items():
-            if not is_on: continue
-            print(f"Performing {analysis} analysis of recordings...")
-            if analysis == 'p2r':
-                plot_p2r_scatter(c)
-                plot_p2r_kdeplot(c)
-            if analysis == 'r2r':
-                plot_r2r_scatter(c)
-                plot_r2r_kdeplot(c)
+import processing
 
+# matplotlib and seaborn take seconds to import, so only the functions that draw import them
 
-def plot_p2r_scatter(conversation):
+ANALYSIS_LABELS = {'p2r': 'P2R Ratio', 'r2r': 'R2R Ratio'}
+
+def visualize(options, conversations, labels=None):
     '''
-    Plot a scatter plot with values y being float and x being time.
+    Plot every requested analysis of every conversation, either in windows or, when options.plot_dir
+    is set, to image files rendered by background worker processes.
 
     Args:
-    speaker_ratios: A dictionary containing speaker_id:[ratio]
-
-    Returns:
-    None
+    options: An AnalysisOptions object.
+    conversations (list): Analysed Conversation objects.
+    labels (list): Name of each conversation, used in file names (default its position).
     '''
-    for id in conversation.unique_speaker_ids():
-        time_values = []
-        analysis_values = []
-        for u in conversation.utterances:
-            if u.speaker_id == id:
-                if u.p2r is not None:
-                    analysis_values.append(u.p2r)
-                    time_values.append(u.start_time)
-        time_values = np.array(time_values)
-        analysis_values = np.array(analysis_values)
-        if len(time_values) == 0 or len(analysis_values) == 0:
-            # skip if no valid values found
-            continue
-        try:
-            # find line of best fit
-            a, b = np.polyfit(time_values, analysis_values, 1)
-        except TypeError as e:
-            # print error message and skip if polyfit() fails
-            print(f"Error: {e}")
-            continue
-        # add points to plot
-        plt.scatter(time_values, analysis_values, label=f"Speaker {id}", s=20)
-        # add line of best fit to plot
-        plt.plot(time_values, a*time_values+b)
-    # set the x-axis label, y-axis label, and title
-    plt.xlabel('Time (s)')
-    plt.ylabel('P2R Ratio')
-    plt.title('Speaker Ratios')
-    plt.legend()
-
-    # show the plot
-    plt.show()
+    renderer = PlotRenderer(options.plot_dir, options.plot_format) if options.plot_dir else None
+    for i, c in enumerate(conversations):
+        name = labels[i] if labels is not None else str(i)
+        for analysis, is_on in options.requested_analyses.items():
+            if not is_on: continue
+            print(f"Plotting {analysis} analysis of {name}...")
+            series = speaker_series(c, analysis)
+            if renderer is not None:
+                renderer.submit(series, analysis, name)
+                continue
+            import matplotlib.pyplot as plt
+            draw_scatter(plt.gca(), series, analysis)
+            plt.show()
+            draw_kdeplot(plt.gca(), series, analysis)
+            plt.show()
+    if renderer is not None:
+        for path in renderer.close():
+            print(f"Saved {path}")
+
+def speaker_series(conversation, analysis):
+    '''
+    Per-speaker (time_values, analysis_values) arrays of one analysis of a Conversation.
+    '''
+    u = conversation.utterances
+    return processing.split_by_speaker(u.speaker_ids, u.start_times, getattr(u, analysis))
 
-def plot_r2r_scatter(conversation):
+def draw_scatter(ax, series, analysis):
     '''
-    Plot a scatter plot with values y being float and x being time.
+    Draw a scatter plot with values y being float and x being time, and each speaker's line of best fit.
 
     Args:
-    conversation: A Conversation object
-
-    Returns:
-    None
+    ax: The matplotlib Axes to draw on.
+    series (dict): speaker_id -> (time_values, analysis_values), from speaker_series.
+    analysis (str): 'p2r' or 'r2r'.
     '''
-    # Extract time-relevant data
-    for id in conversation.unique_speaker_ids():
-        time_values = []
-        analysis_values = []
-        for u in conversation.utterances:
-            if u.speaker_id == id:
-                if u.r2r is not None:
-                    analysis_values.append(u.r2r)
-                    time_values.append(u.start_time)
-        time_values = np.array(time_values)
-        analysis_values = np.array(analysis_values)
-        if len(time_values) == 0 or len(analysis_values) == 0:
-            # skip if no valid values found
-            continue
+    for id, (time_values, analysis_values) in series.items():
         try:
             # find line of best fit
-            a, b = np.polyfit(time_values, analysis_values, 1)
+            a, b = processing.fit_line(time_values, analysis_values)
         except TypeError as e:
             # print error message and skip if polyfit() fails
             print(f"Error: {e}")
             continue
         # add points to plot
-        plt.scatter(time_values, analysis_values, label=f"Speaker {id}", s=20)
+        ax.scatter(time_values, analysis_values, label=f"Speaker {id}", s=20)
         # add line of best fit to plot
-        plt.plot(time_values, a*time_values+b)
-
+        ax.plot(time_values, a*time_values+b)
     # set the x-axis label, y-axis label, and title
-    plt.xlabel('Time (s)')
-    plt.ylabel('R2R Ratio')
-    plt.title('Speaker Ratios')
-    plt.legend()
-
-    # show the plot
-    plt.show()
-
+    ax.set_xlabel('Time (s)')
+    ax.set_ylabel(ANALYSIS_LABELS[analysis])
+    ax.set_title('Speaker Ratios')
+    ax.legend()
 
-def plot_p2r_kdeplot(conversation):
+def draw_kdeplot(ax, series, analysis):
     '''
-    Plot a kernel density plot with values y being float and x being time.
+    Draw a kernel density plot of each speaker's analysis values.
 
     Args:
-    conversation: A Conversation object containing utterances.
-
-    Returns:
-    None
+    ax: The matplotlib Axes to draw on.
+    series (dict): speaker_id -> (time_values, analysis_values), from speaker_series.
+    analysis (str): 'p2r' or 'r2r'.
     '''
-    for id in conversation.unique_speaker_ids():
-        time_values = []
-        analysis_values = []
-        for u in conversation.utterances:
-            if u.speaker_id == id:
-                if u.p2r is not None:
-                    analysis_values.append(u.p2r)
-                    time_values.append(u.start_time)
-        time_values = np.array(time_values)
-        analysis_values = np.array(analysis_values)
-        if len(time_values) == 0 or len(analysis_values) == 0:
-            # skip if no valid values found
-            continue
+    import seaborn as sns
+    for id, (_, analysis_values) in series.items():
         # create kernel density plot using Seaborn
-        sns.kdeplot(data=analysis_values, label=f"Speaker {id}")
-        
+        sns.kdeplot(data=analysis_values, label=f"Speaker {id}", ax=ax)
     # set the x-axis label, y-axis label, and title
-    plt.xlabel('P2R Ratio')
-    plt.ylabel('Density')
-    plt.title('Speaker Ratios')
-    plt.legend()
+    ax.set_xlabel(ANALYSIS_LABELS[analysis])
+    ax.set_ylabel('Density')
+    ax.set_title('Speaker Ratios')
+    ax.legend()
 
-    # show the plot
+def plot_p2r_scatter(conversation):
+    import matplotlib.pyplot as plt
+    draw_scatter(plt.gca(), speaker_series(conversation, 'p2r'), 'p2r')
     plt.show()
 
+def plot_r2r_scatter(conversation):
+    import matplotlib.pyplot as plt
+    draw_scatter(plt.gca(), speaker_series(conversation, 'r2r'), 'r2r')
+    plt.show()
+
+def plot_p2r_kdeplot(conversation):
+    import matplotlib.pyplot as plt
+    draw_kdeplot(plt.gca(), speaker_series(conversation, 'p2r'), 'p2r')
+    plt.show()
 
 def plot_r2r_kdeplot(conversation):
-    '''
-    Plot a kernel density plot with values y being float and x being time.
+    import matplotlib.pyplot as plt
+    draw_kdeplot(plt.gca(), speaker_series(conversation, 'r2r'), 'r2r')
+    plt.show()
 
-    Args:
-    conversation: A Conversation object containing utterances.
+# Headless rendering
 
-    Returns:
-    None
+def render_plots(series, analysis, path_prefix, plot_format='png'):
     '''
-    for id in conversation.unique_speaker_ids():
-        time_values = []
-        analysis_values = []
-        for u in conversation.utterances:
-            if u.speaker_id == id:
-                if u.p2r is not None:
-                    analysis_values.append(u.r2r)
-                    time_values.append(u.start_time)
-        time_values = np.array(time_values)
-        analysis_values = np.array(analysis_values)
-        if len(time_values) == 0 or len(analysis_values) == 0:
-            # skip if no valid values found
-            continue
-        # create kernel density plot using Seaborn
-        sns.kdeplot(data=analysis_values, label=f"Speaker {id}")
-        
-    # set the x-axis label, y-axis label, and title
-    plt.xlabel('R2R Ratio')
-    plt.ylabel('Density')
-    plt.title('Speaker Ratios')
-    plt.legend()
+    Render the scatter and kernel density plots of one analysis to files. Uses bare Figures on the Agg
+    canvas rather than pyplot, so it needs no display and is safe to run in worker processes.
 
-    # show the plot
-    plt.show()
\ No newline at end of file
+    Returns:
+    paths (list): The files written.
+    '''
+    from matplotlib.figure import Figure
+    paths = []
+    for kind, draw in [('scatter', draw_scatter), ('kdeplot', draw_kdeplot)]:
+        fig = Figure()
+        draw(fig.subplots(), series, analysis)
+        path = f"{path_prefix}_{analysis}_{kind}.{plot_format}"
+        fig.savefig(path, format=plot_format)
+        paths.append(path)
+    return paths
+
+class PlotRenderer:
+    '''
+    Pool of worker processes rendering plots to 'plot_dir' in the background, so the caller can go on
+    analysing the next conversation while earlier ones are drawn.
+    '''
+    def __init__(self, plot_dir, plot_format='png', jobs=None):
+        self.plot_dir = plot_dir
+        self.plot_format = plot_format
+        os.makedirs(plot_dir, exist_ok=True)
+        self.executor = ProcessPoolExecutor(max_workers=jobs if jobs else min(4, os.cpu_count()))
+        self.futures = []
+    def submit(self, series, analysis, name):
+        path_prefix = os.path.join(self.plot_dir, name)
+        self.futures.append(self.executor.submit(render_plots, series, analysis, path_prefix, self.plot_format))
+    def close(self):
+        '''
+        Wait for every submitted plot and return the paths written.
+        '''
+        paths = []
+        for future in self.futures:
+            try:
+                paths.extend(future.result())
+            except Exception as e:
+                print(f"Error: {e}")
+        self.executor.shutdown()
+        self.futures = []
+        return paths
@@ -1,8 +1,15 @@
 import os
 import numpy as np
-import librosa
+import soundfile as sf
 
 from conversation_model import *
+from feature_cache import FeatureCache, file_digest
+from streaming import StreamingFeature, read_blocks
+from reduce_noise import denoise, denoise_blocks, denoise_parameters
+from voice_activity import gate_activity
+import profiling
+
+# librosa and scipy take seconds to import, so only the functions that use them import them
 
 '''
 Pre-processing in data analysis is the process of cleaning and transforming raw data into a format that is suitable for analysis. It involves several steps, including:
@@ -19,39 +26,172 @@ HOP_LENGTH = 256
 # Number of audio samples that are included in each analysis frame. Determines the frequency resolution
 # of the analysis and affects the level of detail that can be captured in the audio signal.
 FRAME_LENGTH = 512
+# STFT size and hop used for pitch tracking with piptrack (librosa's defaults).
+PITCH_N_FFT = 2048
+PITCH_HOP_LENGTH = 512
+# Frame length of the autocorrelation pitch backend, long enough to hold two periods at PITCH_FMIN.
+PITCH_FRAME_LENGTH = 1024
+# The autocorrelation backend frames with the RMS, but only estimates pitch once per PITCH_HOP_LENGTH, on
+# every PITCH_STRIDE-th frame; each estimate stands for the frames up to the next one.
+PITCH_STRIDE = PITCH_HOP_LENGTH//HOP_LENGTH
+# Range of fundamental frequencies, in Hz, the autocorrelation backend searches.
+PITCH_FMIN = 65
+PITCH_FMAX = 500
+# Normalized difference below which a lag is taken as the period (YIN's absolute threshold).
+YIN_THRESHOLD = 0.1
+# Cadence (syllable rate) is measured from peaks of the RMS envelope smoothed over CADENCE_SMOOTHING seconds,
+# at least CADENCE_MIN_GAP seconds apart and CADENCE_PROMINENCE above their surroundings, counted over
+# CADENCE_SPAN seconds around each frame.
+CADENCE_SMOOTHING = 0.05
+CADENCE_MIN_GAP = 0.1
+CADENCE_PROMINENCE = 0.02
+CADENCE_SPAN = 1.0
+# Rate, in Hz, that recordings are resampled to when decoded. Frame and hop lengths above are in samples at
+# this rate; recordings analysed at their native rate (--native_rate) use lengths scaled to the same durations.
+SAMPLING_RATE = 22050
+# RMS values below this are treated as silence.
+RMS_THRESHOLD = 0.1
 
 def get_recordings(options):
     recordings = []
     for path in options.file_paths:
-        # y: amplitude at a specific point in time
-        # sr: # of samples of y that are taken per second (Hz)
-        y, sr = librosa.core.load(path, offset=options.start_time, duration=options.duration)
-        recordings.append(Recording(path, y, sr, options.duration))
+        recordings.append(load_recording(path, options))
     return recordings
 
+def load_recording(path, options):
+    # y: amplitude at a specific point in time
+    # sr: # of samples of y that are taken per second (Hz)
+    with profiling.stage('decode', recording=os.path.basename(path)):
+        if options.native_rate_on:
+            y, sr = load_native(path, options.start_time, options.duration)
+        else:
+            import librosa
+            y, sr = librosa.core.load(path, sr=SAMPLING_RATE, offset=options.start_time, duration=options.duration)
+    if options.denoise_on:
+        # Clean the decoded signal in memory rather than going through a '_clean.wav' file
+        with profiling.stage('denoise', recording=os.path.basename(path)):
+            y = denoise(y, sr)
+    return Recording(path, y, sr, options.duration)
+
+def load_native(path, offset=0, duration=None):
+    '''
+    Decode a recording at its own rate, without resampling. Frame-based extraction then scales its frame
+    and hop lengths to that rate (see scaled_length and align_frames).
+
+    Returns:
+    y (np.ndarray): Mono float32 samples.
+    sr (int): Their sampling rate.
+    '''
+    sr = sf.info(path).samplerate
+    blocks = list(read_blocks(path, None, offset, duration))
+    return (np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)), sr
+
 def extract_features(options, recordings):
-    feature_matrices = {}
-    for feature, is_on in options.requested_features.items():
-        if not is_on: continue
-        print(f"Analysing {feature} of recordings...")
-        if feature == 'volume':
-            feature_matrices['volume'] = extract_rmse(recordings)
-        if feature == 'pitch':
-            feature_matrices['pitch'] = extract_pitch(recordings)
-        if feature == 'cadence':
-            print('To-do: Extract cadence')
+    features = requested_frame_features(options)
+    print(f"Analysing {', '.join(features)} of recordings...")
+    feature_matrices = {feature: [] for feature in features}
+    for r in recordings:
+        frame_features = extract_frame_features(r.y, r.sampling_rate, features, options.pitch_backend)
+        for feature, matrix in feature_matrices.items():
+            matrix.append(frame_features[feature])
+    return feature_matrices
+
+def requested_frame_features(options):
+    return [feature for feature, is_on in options.requested_features.items() if is_on and feature in FRAME_FEATURES]
+
+def get_features(options):
+    '''
+    Frame-level feature matrices for the requested features, going through the feature cache when it is on.
+    Recordings are only decoded when at least one of their features is missing from the cache.
+
+    Args:
+    options: An AnalysisOptions object.
+
+    Returns:
+    feature_matrices (dict): feature label -> list of frame-level arrays, one per recording.
+    '''
+    cache = FeatureCache(options.cache_dir, options.cache_size) if options.cache_on else None
+    parameters = extraction_parameters(options)
+    requested = requested_frame_features(options)
+    # Speaker activity gates volume looking at every track at once, so each track's RMS is extracted ungated
+    vad_on = options.vad_on and 'volume' in requested
+    feature_matrices = {('rms' if vad_on and feature == 'volume' else feature): [] for feature in requested}
+    for path in options.file_paths:
+        features = {}
+        if cache is not None:
+            digest = file_digest(path)
+            keys = {feature: cache.key(digest, feature, parameters) for feature in feature_matrices}
+            for feature, key in keys.items():
+                data = cache.get(key)
+                if data is not None:
+                    features[feature] = data
+        missing = [feature for feature in feature_matrices if feature not in features]
+        if missing:
+            print(f"Analysing {', '.join(missing)} of {path}...")
+            with profiling.stage('compute_features', recording=os.path.basename(path)):
+                computed = compute_features(options, path, missing)
+            if cache is not None:
+                for feature, data in computed.items():
+                    cache.put(keys[feature], data)
+            features.update(computed)
+        for feature, matrix in feature_matrices.items():
+            matrix.append(features[feature])
+    if vad_on:
+        with profiling.stage('voice_activity'):
+            feature_matrices = {('volume' if feature == 'rms' else feature):
+                                (gate_activity(matrix, SAMPLING_RATE/HOP_LENGTH) if feature == 'rms' else matrix)
+                                for feature, matrix in feature_matrices.items()}
     return feature_matrices
 
+def compute_features(options, path, features):
+    '''
+    Extract the given features from one recording, either after decoding it whole or block by block.
+    '''
+    if options.stream_on:
+        with profiling.stage('stream', recording=os.path.basename(path)):
+            return stream_features(options, path, features)
+    recording = load_recording(path, options)
+    with profiling.stage('extract', recording=os.path.basename(path)):
+        return extract_frame_features(recording.y, recording.sampling_rate, features, options.pitch_backend)
+
+def stream_features(options, path, features):
+    '''
+    Extract the given features from one recording while reading it block by block, so memory stays
+    bounded by the block size rather than the length of the recording.
+    '''
+    shared_pitch = 'pitch' in features and options.pitch_backend == 'autocorrelation'
+    streams = {}
+    if 'volume' in features or 'rms' in features or 'cadence' in features or shared_pitch:
+        frame_length = PITCH_FRAME_LENGTH if shared_pitch else FRAME_LENGTH
+        streams['shared'] = StreamingFeature(frame_length, HOP_LENGTH,
+            lambda y: np.vstack([f for f in frame_pass(y, SAMPLING_RATE, shared_pitch, center=False) if f is not None]),
+            PITCH_STRIDE if shared_pitch else 1)
+    if 'pitch' in features and not shared_pitch:
+        frame_length, hop_length = PITCH_FRAMING[options.pitch_backend]
+        pitch_frames = PITCH_BACKENDS[options.pitch_backend]
+        streams['pitch'] = StreamingFeature(frame_length, hop_length,
+                                            lambda y: pitch_frames(y, SAMPLING_RATE, center=False))
+    # Streams are always resampled block by block: frames of a fixed hop cannot follow a fractional one
+    blocks = read_blocks(path, SAMPLING_RATE, options.start_time, options.duration)
+    if options.denoise_on:
+        blocks = denoise_blocks(blocks, SAMPLING_RATE)
+    for y in blocks:
+        for stream in streams.values():
+            stream.push(y)
+    frame_features = {}
+    if 'pitch' in streams:
+        frame_features['pitch'] = streams['pitch'].finish()
+    if 'shared' in streams:
+        shared = streams['shared'].finish()
+        frame_features.update(shared_features(shared[0], shared[1] if shared_pitch else None, SAMPLING_RATE, features))
+    return frame_features
+
 def clean_up(options, feature_matrices):
     for key, matrix in feature_matrices.items():
-        for i, data in enumerate(matrix):
-            rounded_data = []
-            for x in data:
-                rounded = round(x, 6)
-                rounded_data.append(rounded)
-            window_size = int(len(data)*options.u_length/options.duration)
-            downsampled = downsample(data, window_size)
-            feature_matrices[key][i] = downsampled
+        with profiling.stage('downsample', feature=key):
+            for i, data in enumerate(matrix):
+                window_size = int(len(data)*options.u_length/options.duration)
+                feature_matrices[key][i] = downsample(data, window_size)
     return feature_matrices
 
 def get_utterance_matrices(options, feature_matrices):
@@ -63,36 +203,65 @@ def get_utterance_matrices(options, feature_matrices):
 def get_conversations(options, utterance_matrices):
     conversations = []
     for key, matrix_object in utterance_matrices.items():
-        matrix = matrix_object.utterance_matrix
-        # find the list in matrix with the largest number of elements
-        max_length = max(len(list) for list in matrix)
-        # create a new utterance list with the elements of the largest list
-        for list in matrix:
-            if len(list) == max_length:
-                loudest_utterances = list
-                break
-        for list in matrix:
-            for i, u in enumerate(list):
-                # replace utterance with that of 'loudest' utterance in matrix
-                if loudest_utterances[i].value < u.value:
-                    loudest_utterances[i] = u
-                elif loudest_utterances[i].value == u.value == 0:
-                    # capture silence
-                    # TODO: What utterance prompts or responds to silence? Is this useful? <---
-                    loudest_utterances[i] = Utterance(0, -1, loudest_utterances[i].start_time, loudest_utterances[i].end_time)
-        conversation_length = len(loudest_utterances)*options.u_length
-        conversation = Conversation(conversation_length, loudest_utterances, options.u_length)
-        conversation.summarize_speakers()
+        with profiling.stage('assign_turns', feature=key):
+            # Every window goes to its loudest speaker, in one pass over the speakers x windows matrix
+            speaker_ids = loudest_speakers(matrix_object.values, matrix_object.lengths)
+            if options.min_turn_length > 1:
+                speaker_ids = merge_short_turns(speaker_ids, options.min_turn_length)
+            n_windows = len(speaker_ids)
+            window_values = np.where(speaker_ids != -1,
+                                     matrix_object.values[np.maximum(speaker_ids, 0), np.arange(n_windows)], 0)
+            start_times = np.arange(n_windows)*options.u_length
+            loudest_utterances = UtteranceColumns(window_values, speaker_ids, start_times, start_times + options.u_length)
+            conversation_length = n_windows*options.u_length
+            conversation = Conversation(conversation_length, loudest_utterances, options.u_length)
+            conversation.summarize_speakers()
         conversations.append(conversation)
     return conversations
 
+def get_joint_conversation(options, utterance_matrices, segment_feature='volume'):
+    """
+    Segment turns once, from 'segment_feature', and average every feature over each turn. Each turn
+    takes its speaker's own values of the other features, so all features describe the same turns.
+
+    Args:
+    options: An AnalysisOptions object.
+    utterance_matrices (dict): feature label -> UtteranceMatrix, including 'segment_feature'.
+    segment_feature (str): Feature whose loudest speaker decides who holds each window.
+
+    Returns:
+    joint_conversation: A JointConversation, without silences, like enrich_conversations returns.
+    """
+    segments = utterance_matrices[segment_feature]
+    with profiling.stage('assign_turns', feature=segment_feature):
+        speaker_ids = loudest_speakers(segments.values, segments.lengths)
+        if options.min_turn_length > 1:
+            speaker_ids = merge_short_turns(speaker_ids, options.min_turn_length)
+    n_windows = len(speaker_ids)
+    holder = np.maximum(speaker_ids, 0)
+    features = list(utterance_matrices.keys())
+    window_values = np.zeros((len(features), n_windows))
+    for f, key in enumerate(features):
+        values = utterance_matrices[key].values
+        # Window counts can differ by one between features framed with different hops
+        n = min(n_windows, values.shape[1])
+        window_values[f, :n] = np.where(speaker_ids[:n] != -1, values[holder[:n], np.arange(n)], 0)
+    # Fold runs of windows into turns, as Conversation.summarize_speakers does, dropping the open last run
+    starts = np.flatnonzero(np.concatenate(([True], speaker_ids[1:] != speaker_ids[:-1]))) if n_windows else np.zeros(0, dtype=np.int64)
+    counts = np.diff(np.append(starts, n_windows))
+    turn_values = np.add.reduceat(window_values, starts, axis=1)/counts if n_windows else window_values
+    start_times = starts*options.u_length
+    end_times = start_times + counts*options.u_length
+    turns = slice(0, max(len(starts) - 1, 0))
+    spoken = speaker_ids[starts][turns] != -1
+    return JointConversation(int(spoken.sum())*options.u_length, features, turn_values[:, turns][:, spoken],
+                             speaker_ids[starts][turns][spoken], start_times[turns][spoken], end_times[turns][spoken],
+                             options.u_length)
+
 def enrich_conversations(conversations):
     rich_conversations = []
     for c in conversations:
-        rich_utterances = []
-        for u in c.utterances:
-            if u.speaker_id != -1:
-                rich_utterances.append(u)   
+        rich_utterances = c.utterances.take(c.utterances.speaker_ids != -1)
         new_length = len(rich_utterances)*c.window_size
         rich_conversation = Conversation(new_length, rich_utterances, c.window_size)
         rich_conversations.append(rich_conversation)
@@ -100,18 +269,91 @@ def enrich_conversations(conversations):
 
 # Helper
 
+def loudest_speakers(values, lengths):
+    """
+    Loudest speaker of every window of a speakers x windows matrix, or -1 where every speaker is silent.
+    Ties go to the speaker with the most windows, then to the lowest speaker id, as when windows were
+    compared one by one against the longest speaker's list.
+
+    Args:
+    values (np.ndarray): speakers x windows feature values, zero padded past each speaker's length.
+    lengths (np.ndarray): Number of windows of each speaker.
+
+    Returns:
+    speaker_ids (np.ndarray): One speaker id per window.
+    """
+    if values.size == 0:
+        return np.zeros(values.shape[1] if values.ndim == 2 else 0, dtype=np.int64)
+    loudest = np.argmax(values, axis=0)
+    max_values = values[loudest, np.arange(values.shape[1])]
+    longest = int(np.argmax(lengths))
+    speaker_ids = np.where(values[longest] == max_values, longest, loudest)
+    speaker_ids[max_values == 0] = -1
+    return speaker_ids
+
+def merge_short_turns(speaker_ids, min_turn_length):
+    """
+    Hysteresis on turn-taking: a run of windows shorter than 'min_turn_length' does not change the turn,
+    and is handed to whoever (speaker or silence) held the turn before it.
+    """
+    if len(speaker_ids) == 0:
+        return speaker_ids
+    starts = np.flatnonzero(np.concatenate(([True], speaker_ids[1:] != speaker_ids[:-1])))
+    counts = np.diff(np.append(starts, len(speaker_ids)))
+    # The first run always stands, there is nothing before it to hand it to
+    kept = (counts >= min_turn_length) | (np.arange(len(starts)) == 0)
+    holder = np.maximum.accumulate(np.where(kept, np.arange(len(starts)), 0))
+    return np.repeat(speaker_ids[starts][holder], counts)
+
 def downsample(data, window_size):
     """
-    Downsample data by taking the mean of consecutive groups of 'window_size' non-zero elements.
+    Downsample data by taking the mean of the non-zero elements in consecutive groups of 'window_size' elements.
+    The last group holds whatever is left over and may be shorter than 'window_size'.
     """
-    downsampled = []
-    for i in range(0, len(data), window_size):
-        chunk = data[i:i+window_size]
-        non_zero_chunk = [i for i in chunk if i > 0]
-        if len(non_zero_chunk) > 0:
-            downsampled.append(sum(non_zero_chunk) / len(non_zero_chunk))
-        else:
-            downsampled.append(0)
+    if window_size <= 0:
+        raise ValueError(f"window_size must be positive, got {window_size}")
+    data = np.asarray(data)
+    if not np.issubdtype(data.dtype, np.floating):
+        data = data.astype(np.float64)
+    # Pad the ragged last window with zeros, which are ignored like any other zero
+    n_windows = -(-len(data) // window_size)
+    windows = np.zeros(n_windows*window_size, dtype=data.dtype)
+    windows[:len(data)] = data
+    windows = windows.reshape(n_windows, window_size)
+    non_zero = windows > 0
+    # cumsum adds strictly left to right, so the sums match a running Python sum() bit for bit
+    sums = np.cumsum(np.where(non_zero, windows, 0), axis=1)[:, -1]
+    counts = np.count_nonzero(non_zero, axis=1).astype(data.dtype)
+    downsampled = np.zeros(n_windows, dtype=data.dtype)
+    np.divide(sums, counts, out=downsampled, where=counts > 0)
+    return downsampled
+
+def non_zero_prefix_sums(data):
+    """
+    Running sum and running count of the non-zero elements of 'data', each starting with a 0, so that any
+    window size can then be downsampled from them in O(windows) (see downsample_prefix_sums).
+    """
+    data = np.asarray(data, dtype=np.float64)
+    non_zero = data > 0
+    sums = np.zeros(len(data) + 1)
+    np.cumsum(np.where(non_zero, data, 0), out=sums[1:])
+    counts = np.zeros(len(data) + 1, dtype=np.int64)
+    np.cumsum(non_zero, out=counts[1:])
+    return sums, counts
+
+def downsample_prefix_sums(sums, counts, window_size):
+    """
+    Same windows as downsample, from the prefix sums of non_zero_prefix_sums: each window's sum and count
+    is the difference of two running totals. Values agree with downsample up to floating-point rounding.
+    """
+    if window_size <= 0:
+        raise ValueError(f"window_size must be positive, got {window_size}")
+    n = len(sums) - 1
+    edges = np.minimum(np.arange(0, n + window_size, window_size), n)[:-(-n // window_size) + 1]
+    window_sums = np.diff(sums[edges])
+    window_counts = np.diff(counts[edges])
+    downsampled = np.zeros(len(window_sums))
+    np.divide(window_sums, window_counts, out=downsampled, where=window_counts > 0)
     return downsampled
 
 def normalize(data):
@@ -129,29 +371,266 @@ def normalize(data):
 def extract_rmse(recordings):
     rmse_matrix = []
     for r in recordings:
-        data = librosa.feature.rms(y=r.y, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH, center=True)[0]
-        data =  np.array([x if x >= 0.1 else 0 for x in data])
-        # data =  np.array([x if x <= 1 else 0 for x in data]) # upper limit?
-        rmse_matrix.append(data)
+        rmse_matrix.append(rmse_frames(r.y, sr=r.sampling_rate))
     return rmse_matrix
 
-def extract_pitch(recordings):
+def rmse_frames(y, center=True, sr=SAMPLING_RATE):
+    return gate_silence(frame_pass(y, sr, center=center)[0])
+
+def gate_silence(data):
+    # float64, as the values of the list comprehension this replaces were, so downsampled values are unchanged
+    return np.where(np.asarray(data) >= RMS_THRESHOLD, data, 0).astype(np.float64)
+
+def extract_frame_features(y, sr, features, pitch_backend='piptrack', center=True):
+    '''
+    Compute every requested frame-level feature of one signal. Volume, cadence and autocorrelation pitch
+    all come out of a single framing pass; only piptrack, with its own STFT framing, needs a second one.
+
+    Args:
+    y (np.ndarray): The signal.
+    sr (int): Its sampling rate.
+    features (list): Feature labels, any of FRAME_FEATURES.
+    pitch_backend (str): Key of PITCH_BACKENDS used for pitch.
+
+    Returns:
+    frame_features (dict): feature label -> one value per frame.
+    '''
+    shared_pitch = 'pitch' in features and pitch_backend == 'autocorrelation'
+    frame_features = {}
+    if 'volume' in features or 'rms' in features or 'cadence' in features or shared_pitch:
+        with profiling.stage('frame_pass', features='+'.join(f for f in features if f != 'pitch' or shared_pitch)):
+            rms, pitch = frame_pass(y, sr, shared_pitch, center)
+            frame_features.update(shared_features(rms, pitch, sr, features))
+    if 'pitch' in features and not shared_pitch:
+        with profiling.stage('pitch', backend=pitch_backend):
+            pitch = PITCH_BACKENDS[pitch_backend](y, sr, center)
+            if pitch_backend == 'piptrack':
+                pitch = align_frames(pitch, sr, len(y), PITCH_HOP_LENGTH, PITCH_N_FFT, center)
+            frame_features['pitch'] = pitch
+    return frame_features
+
+def shared_features(rms, pitch, sr, features):
+    '''
+    Turn the outputs of frame_pass into the requested features.
+    '''
+    frame_features = {}
+    if 'volume' in features:
+        frame_features['volume'] = gate_silence(rms)
+    if 'rms' in features:
+        frame_features['rms'] = rms
+    if 'cadence' in features:
+        frame_features['cadence'] = cadence_frames(rms, sr)
+    if pitch is not None:
+        frame_features['pitch'] = pitch
+    return frame_features
+
+def frame_pass(y, sr=SAMPLING_RATE, pitch_on=False, center=True, batch_size=1024):
+    '''
+    Frame a signal once, HOP_LENGTH samples apart, and compute everything that can share that framing:
+    the RMS of each FRAME_LENGTH frame (identical to librosa.feature.rms) and, if 'pitch_on', an
+    autocorrelation pitch estimate over the PITCH_FRAME_LENGTH samples centred on every PITCH_STRIDE-th frame.
+    Streams must hand over spans starting on such a frame (see streaming.FrameStream's frame_multiple).
+    At rates other than SAMPLING_RATE, frame lengths are scaled to cover the same duration, and frames
+    start at the samples nearest to where they start at SAMPLING_RATE, so that they fall on the same grid.
+
+    Returns:
+    rms (np.ndarray): RMS per frame, before silence gating.
+    pitch (np.ndarray): Pitch per frame in Hz, 0 where silent or aperiodic; None unless 'pitch_on'.
+    '''
+    rms_length = scaled_length(FRAME_LENGTH, sr)
+    frame_length = scaled_length(PITCH_FRAME_LENGTH, sr) if pitch_on else rms_length
+    starts = frame_starts(len(y), sr, PITCH_FRAME_LENGTH if pitch_on else FRAME_LENGTH, center)
+    if center:
+        y = np.pad(y, frame_length//2)
+    if len(y) < frame_length:
+        return np.zeros(0, dtype=np.float32), np.zeros(0) if pitch_on else None
+    # Strided view, no copy: row k holds the samples of frame k
+    frames = np.lib.stride_tricks.sliding_window_view(y, frame_length)
+    if starts is None:
+        frames = frames[::scaled_length(HOP_LENGTH, sr)]
+        starts = np.arange(len(frames))
+    # Frame k is row starts[k] of 'frames'
+    offset = (frame_length - rms_length)//2
+    rms = np.empty(len(starts), dtype=y.dtype)
+    for start in range(0, len(starts), batch_size):
+        middle = frames[starts[start:start + batch_size], offset:offset + rms_length]
+        rms[start:start + batch_size] = np.sqrt(np.mean(np.square(middle), axis=1))
+    if not pitch_on:
+        return rms, None
+    # Only frames loud enough to count as speech are worth a pitch estimate, made on the first frame of
+    # each group of PITCH_STRIDE frames that holds any
+    voiced = rms >= RMS_THRESHOLD
+    n_groups = -(-len(starts) // PITCH_STRIDE)
+    grouped = np.zeros(n_groups*PITCH_STRIDE, dtype=bool)
+    grouped[:len(starts)] = voiced
+    estimated = np.flatnonzero(grouped.reshape(n_groups, PITCH_STRIDE).any(axis=1))*PITCH_STRIDE
+    estimates = np.zeros(len(starts))
+    for start in range(0, len(estimated), batch_size):
+        batch = estimated[start:start + batch_size]
+        estimates[batch] = yin(frames[starts[batch]], sr)
+    # Every voiced frame takes the estimate of its group
+    groups = np.arange(len(starts))//PITCH_STRIDE*PITCH_STRIDE
+    return rms, np.where(voiced, estimates[groups], 0)
+
+def cadence_frames(rms, sr):
+    '''
+    Syllable rate, in syllable nuclei per second, around each frame. Nuclei are peaks of the smoothed RMS
+    envelope; silent frames are 0 so that downsample averages the rate over speech only.
+    '''
+    # Frames fall on the SAMPLING_RATE grid whatever 'sr' is (see frame_starts), even where the scaled hop
+    # is fractional and sr/scaled_length(HOP_LENGTH, sr) would be off
+    frame_rate = SAMPLING_RATE/HOP_LENGTH
+    smoothing = max(1, int(round(CADENCE_SMOOTHING*frame_rate)))
+    envelope = np.convolve(rms, np.ones(smoothing)/smoothing, mode='same')
+    from scipy.signal import find_peaks
+    peaks, _ = find_peaks(envelope, height=RMS_THRESHOLD, distance=max(1, int(round(CADENCE_MIN_GAP*frame_rate))),
+                          prominence=CADENCE_PROMINENCE)
+    nuclei = np.zeros(len(rms))
+    nuclei[peaks] = 1
+    span = max(1, int(round(CADENCE_SPAN*frame_rate)))
+    rate = np.convolve(nuclei, np.ones(span), mode='same')*frame_rate/span
+    return np.where(rms >= RMS_THRESHOLD, rate, 0)
+
+def extract_pitch(recordings, backend='piptrack'):
     pitch_matrix = []
     for r in recordings:
-        freqs, magnitudes = librosa.piptrack(y=r.y, sr=r.sampling_rate)
-        max_magnitudes = magnitudes.argmax(axis=0)
-        pitch_matrix.append(freqs[max_magnitudes])
+        pitch_matrix.append(PITCH_BACKENDS[backend](r.y, r.sampling_rate))
     return pitch_matrix
 
+def piptrack_frames(y, sr, center=True):
+    import librosa
+    freqs, magnitudes = librosa.piptrack(y=y, sr=sr, n_fft=scaled_length(PITCH_N_FFT, sr),
+                                         hop_length=scaled_length(PITCH_HOP_LENGTH, sr), center=center)
+    max_magnitudes = magnitudes.argmax(axis=0)
+    # Frequency of the strongest bin in each frame (column)
+    return freqs[max_magnitudes, np.arange(freqs.shape[1])]
+
+def autocorrelation_pitch_frames(y, sr, center=True):
+    '''
+    Estimate the fundamental frequency of each frame with a YIN-style normalized difference function.
+    Only frames loud enough to count as speech in extract_rmse are analysed; every other frame is 0.
+    Frames are PITCH_FRAME_LENGTH long, HOP_LENGTH apart and centred like the RMS frames; pitch is
+    estimated PITCH_HOP_LENGTH apart, like piptrack, and held over the frames in between.
+    '''
+    return frame_pass(y, sr, pitch_on=True, center=center)[1]
+
+def yin(frames, sr):
+    '''
+    Fundamental frequency of each row of 'frames', or 0 where no period stands out.
+    '''
+    x = frames.astype(np.float64)
+    tau_min = int(sr/PITCH_FMAX)
+    tau_max = min(int(sr/PITCH_FMIN), x.shape[1]//2)
+    window = x.shape[1] - tau_max - 1
+    # Difference function d(tau) = sum (x[j] - x[j+tau])^2 over j < window, from energies and one FFT correlation.
+    # Only lags up to tau_max + 1 are needed, and j + tau then stays below window + tau_max + 1 = len(frame),
+    # so a circular correlation over the frame length does not wrap around
+    n_fft = 1 << int(np.ceil(np.log2(x.shape[1])))
+    correlation = np.fft.irfft(np.fft.rfft(x, n_fft)*np.conj(np.fft.rfft(x[:, :window], n_fft)), n_fft)[:, :tau_max + 2]
+    energy = np.concatenate((np.zeros((len(x), 1)), np.cumsum(x**2, axis=1)), axis=1)
+    taus = np.arange(tau_max + 2)
+    shifted_energy = energy[:, taus + window] - energy[:, taus]
+    difference = np.maximum(energy[:, [window]] + shifted_energy - 2*correlation, 0)
+    # Cumulative mean normalized difference
+    cumulative = np.cumsum(difference[:, 1:], axis=1)
+    normalized = np.ones_like(difference)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized[:, 1:] = np.where(cumulative > 0, difference[:, 1:]*taus[1:]/cumulative, 1)
+    # First local minimum under the threshold within the search range
+    candidates = normalized[:, tau_min:tau_max + 1]
+    local_minimum = (candidates <= normalized[:, tau_min - 1:tau_max]) & (candidates < normalized[:, tau_min + 1:tau_max + 2])
+    accepted = local_minimum & (candidates < YIN_THRESHOLD)
+    found = accepted.any(axis=1)
+    tau = tau_min + accepted.argmax(axis=1)
+    # Refine the period between samples with a parabola through the neighbouring lags
+    rows = np.arange(len(x))
+    before, at, after = normalized[rows, tau - 1], normalized[rows, tau], normalized[rows, tau + 1]
+    curvature = before - 2*at + after
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = np.where(curvature > 0, (before - after)/(2*curvature), 0)
+    return np.where(found, sr/(tau + shift), 0)
+
 def extract_cadence(recordings):
-    # Pending work
-    rmse_matrix = []
+    cadence_matrix = []
     for r in recordings:
-        data = librosa.feature.rms(y=r.y, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH, center=True)[0]
-        data =  np.array([x if x >= 0.1 else 0 for x in data])
-        # data =  np.array([x if x <= 1 else 0 for x in data]) # upper limit?
-        rmse_matrix.append(data)
-    return rmse_matrix
+        cadence_matrix.append(cadence_frames(frame_pass(r.y, r.sampling_rate)[0], r.sampling_rate))
+    return cadence_matrix
+
+# Features computed frame by frame from the audio; 'rms' is volume before silence gating, e.g. for threshold sweeps
+FRAME_FEATURES = ['volume', 'pitch', 'cadence', 'rms']
+
+# Pitch estimators, and the (frame length, hop length) each one frames the signal with
+PITCH_BACKENDS = {
+    'piptrack': piptrack_frames,
+    'autocorrelation': autocorrelation_pitch_frames,
+}
+PITCH_FRAMING = {
+    'piptrack': (PITCH_N_FFT, PITCH_HOP_LENGTH),
+    'autocorrelation': (PITCH_FRAME_LENGTH, HOP_LENGTH),
+}
+
+def scaled_length(length, sr):
+    '''
+    A frame or hop length, given in samples at SAMPLING_RATE, as the number of samples at 'sr' that
+    covers the same duration.
+    '''
+    return length if sr == SAMPLING_RATE else max(1, int(round(length*sr/SAMPLING_RATE)))
+
+def reference_frame_count(n_samples, sr, hop_length, frame_length, center=True):
+    '''
+    Number of frames, 'hop_length' apart, in a signal of 'n_samples' at 'sr' once resampled to SAMPLING_RATE.
+    '''
+    # librosa.load resamples to ceil(n*SAMPLING_RATE/sr) samples
+    n_resampled = int(np.ceil(n_samples*SAMPLING_RATE/sr))
+    return max(0, 1 + (n_resampled + (2*(frame_length//2) if center else 0) - frame_length)//hop_length)
+
+def frame_starts(n_samples, sr, frame_length, center=True):
+    '''
+    Where, in samples at 'sr', each HOP_LENGTH frame of the SAMPLING_RATE grid starts, or None when the
+    scaled hop is a whole number of samples and the frames simply start every scaled_length(HOP_LENGTH, sr).
+    A rounded hop would drift away from the grid, so each start is rounded on its own instead.
+    '''
+    if (HOP_LENGTH*sr) % SAMPLING_RATE == 0:
+        return None
+    n_frames = reference_frame_count(n_samples, sr, HOP_LENGTH, frame_length, center)
+    native_length = scaled_length(frame_length, sr)
+    n_rows = n_samples + (2*(native_length//2) if center else 0) - native_length + 1
+    starts = np.round(np.arange(n_frames)*HOP_LENGTH*sr/SAMPLING_RATE).astype(np.int64)
+    return np.minimum(starts, max(n_rows - 1, 0))
+
+def align_frames(frames, sr, n_samples, hop_length, frame_length, center=True):
+    '''
+    Put frames computed at rate 'sr' by a library with a fixed hop (piptrack) on the frame grid of the same
+    signal resampled to SAMPLING_RATE: when the scaled hop is not a whole number of samples it is rounded
+    and drifts, so each frame of the grid takes the frame nearest to it in time.
+
+    Args:
+    frames (np.ndarray): One value per frame at 'sr', framed with lengths scaled by scaled_length.
+    sr (int): Sampling rate the frames were computed at.
+    n_samples (int): Length of the signal at 'sr'.
+    hop_length, frame_length (int): Hop and frame length at SAMPLING_RATE.
+    center (bool): Whether the frames were centred (padded by half a frame at both ends).
+    '''
+    if (hop_length*sr) % SAMPLING_RATE == 0:
+        return frames
+    n_frames = reference_frame_count(n_samples, sr, hop_length, frame_length, center)
+    if len(frames) == 0 or n_frames == 0:
+        return frames[:0]
+    native_hop = scaled_length(hop_length, sr)
+    nearest = np.round(np.arange(n_frames)*hop_length*sr/(SAMPLING_RATE*native_hop)).astype(np.int64)
+    return frames[np.minimum(nearest, len(frames) - 1)]
+
+def extraction_parameters(options):
+    '''
+    Every parameter that frame-level features depend on, besides the audio itself.
+    '''
+    return {'start_time': options.start_time, 'duration': options.duration, 'sampling_rate': SAMPLING_RATE,
+            'frame_length': FRAME_LENGTH, 'hop_length': HOP_LENGTH, 'rms_threshold': RMS_THRESHOLD,
+            'pitch_backend': options.pitch_backend, 'pitch_framing': PITCH_FRAMING[options.pitch_backend],
+            'pitch_stride': PITCH_STRIDE, 'pitch_range': (PITCH_FMIN, PITCH_FMAX), 'yin_threshold': YIN_THRESHOLD,
+            'streamed': options.stream_on,
+            'cadence': (CADENCE_SMOOTHING, CADENCE_MIN_GAP, CADENCE_PROMINENCE, CADENCE_SPAN),
+            'denoise': denoise_parameters() if options.denoise_on else None, 'native_rate': options.native_rate_on}
 
 def replace_outliers_zscore(data, threshold):
     """
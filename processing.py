@@ -1,17 +1,44 @@
+import numpy as np
+
+import profiling
+
 def extract_analyses(options, conversations):
     analysed_conversations = []
     for c in conversations:
         for analysis, is_on in options.requested_analyses.items():
             if not is_on: continue
             print(f"Performing {analysis} analysis of recordings...")
-            if analysis == 'p2r':
-                p2r_conversation = prompt_to_response(c)
-                analysed_conversations.append(p2r_conversation)
-            if analysis == 'r2r':
-                r2r_conversation = response_to_response(c)
-                analysed_conversations.append(r2r_conversation)
+            with profiling.stage(analysis):
+                if analysis == 'p2r':
+                    prompt_to_response(c)
+                if analysis == 'r2r':
+                    response_to_response(c)
+        # Both analyses are stored in the same conversation, so it is listed once
+        analysed_conversations.append(c)
     return analysed_conversations
 
+def analyse_joint(options, joint_conversation):
+    '''
+    Perform every requested analysis on every feature of a JointConversation in one sweep: the turn
+    structure is shared, so the prompt and previous-response lookups are done once for all features.
+
+    Args:
+    options: An AnalysisOptions object.
+    joint_conversation: A JointConversation, whose p2r and r2r matrices are filled in.
+
+    Returns:
+    joint_conversation: The same JointConversation.
+    '''
+    j = joint_conversation
+    analyses = [analysis for analysis, is_on in options.requested_analyses.items() if is_on]
+    print(f"Performing {', '.join(analyses)} analysis of {', '.join(j.features)} jointly...")
+    with profiling.stage('joint_analysis'):
+        if 'p2r' in analyses:
+            j.p2r[:] = prompt_to_response_ratios(j.speaker_ids, j.values)
+        if 'r2r' in analyses:
+            j.r2r[:] = response_to_response_ratios(j.speaker_ids, j.values)
+    return j
+
 def prompt_to_response(conversation):
     '''
     For each speaker in a conversation, calculates a feature's ratio of prompt to response.
@@ -23,22 +50,11 @@ def prompt_to_response(conversation):
     Returns:
     p2r_conversation: A Conversation object containing prompt:repsonse ratio value
     '''
-    # Calculate average feature ratio of prompt:response for each utterance
     p2r_conversation = conversation
-    # For each utterance
-    for i, u in enumerate(conversation.utterances):
-        # Ignore silence or first utterance
-        if (u.speaker_id == -1) or (i == 0): continue
-        # Find previous non-zero utterance
-        prev_nz_value = -1
-        for j in range(i-1, 0, -1):
-            jth_value = conversation.utterances[j].value
-            if (jth_value > 0):
-                prev_nz_value = jth_value
-                break
-        if (prev_nz_value == -1): continue
-        # Calculate average feature ratio for prompt:response non-zero utterance
-        p2r_conversation.utterances[i].p2r = prev_nz_value/u.value
+    speaker_ids, values, _, _ = utterance_arrays(conversation)
+    p2r = prompt_to_response_ratios(speaker_ids, values)
+    valid = ~np.isnan(p2r)
+    p2r_conversation.utterances.p2r[valid] = p2r[valid]
     return p2r_conversation
 
 def response_to_response(conversation):
@@ -50,40 +66,237 @@ def response_to_response(conversation):
     conversation: A Conversation object containing a 2D matrix of utterances.
 
     Returns:
-    None
+    r2r_conversation: A Conversation object containing response:response ratio values
     '''
-    # Calculate relative change in average feature value for same speaker's responses
-    # compared to the prompter's relative change
     r2r_conversation = conversation
-    # For each significant utterance
-    for i, u in enumerate(conversation.utterances):
-        # Ignore first and second utterances
-        if (i < 3): continue
-        # Find same speaker's previous utterance
-        sid = u.speaker_id
-        curr_value_0 = u.value
-        prev_value_0 = -1 # this could be u.prev.value
-        for j in range(i-1, 0, -1):
-            jth_value = conversation.utterances[j].value
-            jth_id = conversation.utterances[j].speaker_id
-            if (jth_id == sid):
-                prev_value_0 = jth_value
-                break
-        if (prev_value_0 == -1.0): continue
-        # Find different speaker's previous utterance
-        prompt_utterance = conversation.utterances[i-1]
-        sid = prompt_utterance.speaker_id
-        curr_value_1 = prompt_utterance.value
-        prev_value_1 = -1 # this could be u.prev.value
-        for j in range(i-2, 0, -1):
-            jth_value = conversation.utterances[j].value
-            jth_id = conversation.utterances[j].speaker_id
-            if (jth_id == sid):
-                prev_value_1 = jth_value
-                break
-        if (prev_value_1 == -1.0): continue
-        # Calculate r2r
-        speaker_change = curr_value_0/prev_value_0
-        prompter_change = curr_value_1/prev_value_1
-        r2r_conversation.utterances[i].r2r = speaker_change/prompter_change
-    return r2r_conversation
\ No newline at end of file
+    speaker_ids, values, _, _ = utterance_arrays(conversation)
+    r2r = response_to_response_ratios(speaker_ids, values)
+    valid = ~np.isnan(r2r)
+    r2r_conversation.utterances.r2r[valid] = r2r[valid]
+    return r2r_conversation
+
+def prompt_to_response_ratios(speaker_ids, values):
+    '''
+    Ratio of the previous non-zero value (the prompt) to each utterance's value, in a single pass.
+
+    Args:
+    speaker_ids (np.ndarray): Speaker of each utterance, -1 for silence.
+    values (np.ndarray): Feature value of each utterance, or one row of them per feature.
+
+    Returns:
+    p2r (np.ndarray): prompt:response ratio per utterance, shaped like 'values', NaN where there is no prompt.
+    '''
+    prompt = prompt_indices(values)
+    valid = (prompt != -1) & (speaker_ids != -1)
+    p2r = np.full(values.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p2r[valid] = np.take_along_axis(values, np.maximum(prompt, 0), axis=-1)[valid]/values[valid]
+    return p2r
+
+def response_to_response_ratios(speaker_ids, values):
+    '''
+    Relative change in each speaker's value compared to the prompter's relative change, in a single pass.
+
+    Args:
+    speaker_ids (np.ndarray): Speaker of each utterance, -1 for silence.
+    values (np.ndarray): Feature value of each utterance, or one row of them per feature.
+
+    Returns:
+    r2r (np.ndarray): response:response ratio per utterance, shaped like 'values', NaN where it cannot be computed.
+    '''
+    n = values.shape[-1]
+    index = np.arange(n)
+    # Same speaker's previous utterance, for the response and for the prompt before it
+    previous = previous_same_speaker(speaker_ids)
+    prompt_previous = np.full(n, -1)
+    prompt_previous[1:] = previous[:-1]
+    # Ignore first and second utterances
+    valid = (index >= 3) & (previous != -1) & (prompt_previous != -1)
+    i = index[valid]
+    r2r = np.full(values.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speaker_change = values[..., i]/values[..., previous[i]]
+        prompter_change = values[..., i-1]/values[..., prompt_previous[i]]
+        r2r[..., valid] = speaker_change/prompter_change
+    return r2r
+
+class TurnScorer:
+    '''
+    p2r and r2r of turns scored one at a time, as they close. The state carried from turn to turn is
+    what prompt_to_response_ratios and response_to_response_ratios look back for, so the ratios are
+    the ones those functions give over the whole conversation, bit for bit.
+    '''
+    def __init__(self):
+        self.n_turns = 0
+        self.last_non_zero_value = None
+        self.last_value_by_speaker = {}
+        self.previous_turn = None # (value, that speaker's previous value)
+    def score(self, speaker_id, value):
+        '''
+        Score the next turn of a conversation without silences.
+
+        Returns:
+        p2r (float): Its prompt:response ratio, None for the first turn.
+        r2r (float): Its response:response ratio, None where it cannot be computed.
+        '''
+        p2r = r2r = None
+        previous_value = self.last_value_by_speaker.get(speaker_id)
+        if self.last_non_zero_value is not None:
+            p2r = self.last_non_zero_value/value
+        if self.n_turns >= 3 and previous_value is not None and self.previous_turn[1] is not None:
+            speaker_change = value/previous_value
+            prompter_change = self.previous_turn[0]/self.previous_turn[1]
+            r2r = speaker_change/prompter_change
+        # The first turn never acts as a prompt or as a previous response
+        if self.n_turns > 0:
+            self.last_value_by_speaker[speaker_id] = value
+            if value > 0:
+                self.last_non_zero_value = value
+        self.previous_turn = (value, previous_value)
+        self.n_turns += 1
+        return p2r, r2r
+
+def pairwise_prompt_to_response(speaker_ids, values):
+    '''
+    Prompt:response statistics for every (prompter, responder) pair of speakers, in one grouped pass:
+    each utterance's p2r is binned by the speaker of its prompt and its own speaker with np.bincount.
+
+    Args:
+    speaker_ids (np.ndarray): Speaker of each utterance, -1 for silence.
+    values (np.ndarray): Feature value of each utterance, or one row of them per feature.
+
+    Returns:
+    ids (np.ndarray): The N speakers, sorted; rows and columns follow this order.
+    counts (np.ndarray): Number of ratios per pair, shaped (N, N), or (features, N, N) for 2D 'values'.
+    means (np.ndarray): Mean p2r per pair (row prompts, column responds), NaN where a pair never occurs.
+    variances (np.ndarray): Variance of p2r per pair, NaN where a pair never occurs.
+    '''
+    speaker_ids = np.asarray(speaker_ids)
+    values = np.asarray(values, dtype=np.float64)
+    # Speaker index of each utterance, -1 for silence
+    speaking = speaker_ids != -1
+    ids, inverse = np.unique(speaker_ids[speaking], return_inverse=True)
+    n_speakers = len(ids)
+    speaker_index = np.full(len(speaker_ids), -1)
+    speaker_index[speaking] = inverse
+    p2r = prompt_to_response_ratios(speaker_ids, values)
+    prompter = speaker_index[np.maximum(prompt_indices(values), 0)]
+    valid = np.isfinite(p2r) & (prompter != -1)
+    rows = values.reshape(-1, values.shape[-1]) if values.ndim > 1 else values[np.newaxis]
+    n_pairs = n_speakers*n_speakers
+    # Flattened (feature, prompter, responder) bin of every valid ratio, for all features at once
+    feature = np.broadcast_to(np.arange(len(rows))[:, np.newaxis], rows.shape).reshape(valid.shape)
+    bins = (feature*n_pairs + prompter*n_speakers + speaker_index)[valid]
+    ratios = p2r[valid]
+    length = len(rows)*n_pairs
+    counts = np.bincount(bins, minlength=length)
+    sums = np.bincount(bins, weights=ratios, minlength=length)
+    sums_of_squares = np.bincount(bins, weights=ratios*ratios, minlength=length)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = sums/counts
+        variances = np.maximum(sums_of_squares/counts - means*means, 0)
+    variances[counts == 0] = np.nan
+    shape = values.shape[:-1] + (n_speakers, n_speakers)
+    return ids, counts.reshape(shape), means.reshape(shape), variances.reshape(shape)
+
+def print_pairwise(label, ids, counts, means):
+    '''
+    Print one feature's pairwise p2r matrix, prompters down the side and responders across the top.
+    '''
+    print(f"Mean {label} p2r by prompter (rows) and responder (columns), with the number of ratios:")
+    print(" "*12 + "".join(f"{id:>16}" for id in ids))
+    for i, id in enumerate(ids):
+        cells = "".join(f"{'-':>16}" if counts[i, j] == 0 else f"{means[i, j]:>10.3f} ({counts[i, j]:>3})"
+                        for j in range(len(ids)))
+        print(f"{id:>12}{cells}")
+
+def speaker_trends(speaker_ids, start_times, analysis_values):
+    '''
+    Line of best fit of each speaker's analysis values over time, as drawn on the scatter plots.
+
+    Args:
+    speaker_ids (array-like): Speaker of each utterance.
+    start_times (array-like): Start time of each utterance, in seconds.
+    analysis_values (array-like): Analysis value of each utterance, None or NaN where missing.
+
+    Returns:
+    trends (dict): speaker_id -> (n_values, slope, intercept); slope and intercept are NaN below two values.
+    '''
+    trends = {}
+    for id, (time_values, values) in split_by_speaker(speaker_ids, start_times, analysis_values).items():
+        slope, intercept = fit_line(time_values, values) if len(values) > 1 else (np.nan, np.nan)
+        trends[id] = (len(values), slope, intercept)
+    return trends
+
+# Helpers
+
+def split_by_speaker(speaker_ids, start_times, analysis_values):
+    '''
+    Split one analysis into per-speaker arrays, skipping utterances without a value.
+
+    Args:
+    speaker_ids (array-like): Speaker of each utterance.
+    start_times (array-like): Start time of each utterance, in seconds.
+    analysis_values (array-like): Analysis value of each utterance, None or NaN where missing.
+
+    Returns:
+    series (dict): speaker_id -> (time_values, analysis_values), in order of first appearance.
+    '''
+    speaker_ids = np.asarray(speaker_ids)
+    start_times = np.asarray(start_times, dtype=np.float64)
+    analysis_values = np.array(analysis_values, dtype=np.float64)
+    valid = ~np.isnan(analysis_values)
+    series = {}
+    for id in ordered_unique(speaker_ids):
+        mask = valid & (speaker_ids == id)
+        if mask.any():
+            series[int(id)] = (start_times[mask], analysis_values[mask])
+    return series
+
+def fit_line(time_values, analysis_values):
+    '''
+    Slope and intercept of the least-squares line through (time, value) points.
+    '''
+    a, b = np.polyfit(time_values, analysis_values, 1)
+    return a, b
+
+def utterance_arrays(conversation):
+    '''
+    Columns of a conversation's utterances: (speaker_ids, values, start_times, end_times).
+    '''
+    u = conversation.utterances
+    return u.speaker_ids, u.values, u.start_times, u.end_times
+
+def ordered_unique(speaker_ids):
+    '''
+    Distinct speaker ids in order of first appearance.
+    '''
+    ids, first = np.unique(speaker_ids, return_index=True)
+    return ids[np.argsort(first)]
+
+def prompt_indices(values):
+    '''
+    Index of each utterance's prompt, the latest earlier non-zero utterance, or -1 if there is none.
+    Shaped like 'values', which may hold one row of utterance values per feature.
+    '''
+    n = values.shape[-1]
+    index = np.arange(n)
+    # Carry the index of the latest non-zero utterance forward; the first utterance never acts as a prompt
+    last_non_zero = np.maximum.accumulate(np.where((values > 0) & (index > 0), index, -1), axis=-1)
+    prompt = np.full(values.shape, -1)
+    prompt[..., 1:] = last_non_zero[..., :-1]
+    return prompt
+
+def previous_same_speaker(speaker_ids):
+    '''
+    Index of each utterance's latest earlier utterance by the same speaker, or -1 if there is none.
+    The first utterance is never returned, matching the backward scans this replaces.
+    '''
+    n = len(speaker_ids)
+    # A stable sort groups each speaker's utterances while keeping them in time order
+    order = np.argsort(speaker_ids, kind='stable')
+    same = speaker_ids[order[1:]] == speaker_ids[order[:-1]]
+    previous = np.full(n, -1)
+    previous[order[1:][same]] = order[:-1][same]
+    previous[previous == 0] = -1
+    return previous
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import cProfile
+import contextlib
+
+'''
+Per-stage instrumentation. Pipeline code marks its stages with
+
+    with profiling.stage('decode', recording=path):
+        ...
+
+and, once profiling is enabled (vmd.py --profile), each stage records its wall time, CPU time and its own
+peak RSS: the most memory the process held while the stage ran, including any stages nested in it. Peaks
+are measured on Linux, by resetting the kernel's RSS high-water mark as stages start (/proc/self/clear_refs)
+and reading it back (VmHWM); elsewhere they are left out. Stages can be nested, e.g. per-recording work
+inside a pipeline stage. When profiling is off, stage() hands back one shared no-op context, so the
+instrumentation costs next to nothing.
+'''
+
+CLEAR_REFS = "/proc/self/clear_refs"
+STATUS = "/proc/self/status"
+
+class Profiler:
+    def __init__(self, cprofile_dir=None):
+        self.records = []
+        self.depth = 0
+        self.cprofile_dir = cprofile_dir
+        self.origin = time.perf_counter()
+        # Peak RSS of every open stage so far, innermost last
+        self.open_peaks = []
+        self.clear_refs, self.status = open_peak_rss()
+        self.peaks_on = self.clear_refs is not None
+        if cprofile_dir:
+            os.makedirs(cprofile_dir, exist_ok=True)
+    @contextlib.contextmanager
+    def stage(self, name, **labels):
+        # Only one cProfile profiler can be active at a time, so only top-level stages are profiled
+        profile = cProfile.Profile() if self.cprofile_dir and self.depth == 0 else None
+        self.depth += 1
+        if self.peaks_on:
+            # The high-water mark since the last reset belongs to every stage already open; then start afresh
+            self.fold_peak()
+            os.write(self.clear_refs, b"5")
+            self.open_peaks.append(0)
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            wall_time = time.perf_counter() - start_wall
+            cpu_time = time.process_time() - start_cpu
+            self.depth -= 1
+            stage_peak = None
+            if self.peaks_on:
+                self.fold_peak()
+                stage_peak = self.open_peaks.pop()
+            self.records.append({'stage': name, 'labels': labels, 'depth': self.depth,
+                                 'start': start_wall - self.origin, 'wall_time': wall_time,
+                                 'cpu_time': cpu_time, 'peak_rss': stage_peak})
+            if profile is not None:
+                profile.dump_stats(os.path.join(self.cprofile_dir, f"{len(self.records):03d}_{name}.prof"))
+    def fold_peak(self):
+        peak = peak_rss(self.status)
+        self.open_peaks = [max(open_peak, peak) for open_peak in self.open_peaks]
+    def summary(self):
+        '''
+        Totals per stage and labels, in the order the stages started.
+
+        Returns:
+        rows (list): Dicts with stage, labels, depth, calls, wall_time, cpu_time and peak_rss.
+        '''
+        totals = {}
+        for r in sorted(self.records, key=lambda r: r['start']):
+            key = (r['stage'], tuple(r['labels'].items()))
+            if key not in totals:
+                totals[key] = {'stage': r['stage'], 'labels': r['labels'], 'depth': r['depth'], 'calls': 0,
+                               'wall_time': 0.0, 'cpu_time': 0.0, 'peak_rss': None}
+            total = totals[key]
+            total['calls'] += 1
+            total['wall_time'] += r['wall_time']
+            total['cpu_time'] += r['cpu_time']
+            if r['peak_rss'] is not None:
+                total['peak_rss'] = max(total['peak_rss'] or 0, r['peak_rss'])
+        return list(totals.values())
+    def print_summary(self):
+        print(f"{'stage':<48} {'calls':>5} {'wall (s)':>9} {'cpu (s)':>9} {'peak RSS (MiB)':>15}")
+        for row in self.summary():
+            labels = ', '.join(str(v) for v in row['labels'].values())
+            label = "  "*row['depth'] + row['stage'] + (f" [{labels}]" if labels else "")
+            rss = f"{row['peak_rss']/1024/1024:15.1f}" if row['peak_rss'] is not None else f"{'-':>15}"
+            print(f"{label:<48} {row['calls']:>5} {row['wall_time']:9.3f} {row['cpu_time']:9.3f} {rss}")
+    def close(self):
+        if self.peaks_on:
+            os.close(self.clear_refs)
+            os.close(self.status)
+            self.peaks_on = False
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.records, f, indent=2)
+    def write_trace(self, path):
+        '''
+        Write the stages as a Chrome trace (chrome://tracing, Perfetto), one complete event per stage.
+        '''
+        events = [{'name': r['stage'], 'ph': 'X', 'ts': 1e6*r['start'], 'dur': 1e6*r['wall_time'],
+                   'pid': os.getpid(), 'tid': 0,
+                   'args': {**{k: str(v) for k, v in r['labels'].items()}, 'cpu_time': r['cpu_time'],
+                            'peak_rss': r['peak_rss']}}
+                  for r in self.records]
+        with open(path, "w") as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+class NullProfiler:
+    '''
+    Stand-in used while profiling is off: every stage is the same no-op context.
+    '''
+    records = []
+    null_stage = contextlib.nullcontext()
+    def stage(self, name, **labels):
+        return self.null_stage
+    def close(self):
+        pass
+
+active_profiler = NullProfiler()
+
+def stage(name, **labels):
+    '''
+    Context marking a stage of work, e.g. stage('decode', recording=path); a no-op unless profiling is on.
+    '''
+    return active_profiler.stage(name, **labels)
+
+def enable(cprofile_dir=None):
+    '''
+    Start recording stages, optionally dumping a cProfile .prof file per top-level stage to 'cprofile_dir'.
+    '''
+    global active_profiler
+    active_profiler = Profiler(cprofile_dir)
+    return active_profiler
+
+def disable():
+    global active_profiler
+    profiler = active_profiler
+    active_profiler = NullProfiler()
+    profiler.close()
+    return profiler
+
+def open_peak_rss():
+    '''
+    File descriptors to reset this process's peak resident set size (by writing b"5") and to read it back
+    (see peak_rss), kept open so that each stage costs two short system calls; (None, None) where the
+    peak cannot be reset.
+    '''
+    clear_refs = status = None
+    try:
+        clear_refs = os.open(CLEAR_REFS, os.O_WRONLY)
+        status = os.open(STATUS, os.O_RDONLY)
+        os.write(clear_refs, b"5")
+        return clear_refs, status
+    except OSError:
+        for fd in (clear_refs, status):
+            if fd is not None:
+                os.close(fd)
+        return None, None
+
+def peak_rss(status):
+    '''
+    Peak resident set size of this process since the peak was last reset, in bytes.
+    '''
+    text = os.pread(status, 4096, 0)
+    start = text.index(b"VmHWM:") + len(b"VmHWM:")
+    return int(text[start:text.index(b"kB", start)])*1024
@@ -1,13 +1,157 @@
-# perform noise reduction
-from scipy.io import wavfile
-import noisereduce as nr
-
-# load data
-for i in range(1,7):
-    for j in range (1,4):
-        filepath = "./data/audio/conv_0" + str(i) + "_pid" + str (j) + ".wav"
-        rate, data = wavfile.read(filepath)
-        # perform noise reduction
-        reduced_noise = nr.reduce_noise(y=data, sr=rate)
-        clean_filepath = "./data/audio/conv_0" + str(i) + "_pid" + str (j) + "_clean.wav"
-        wavfile.write(clean_filepath, rate, reduced_noise)
\ No newline at end of file
+import os
+import glob
+import json
+import numpy as np
+import soundfile as sf
+from concurrent.futures import ProcessPoolExecutor
+
+import interface
+from feature_cache import file_digest
+
+'''
+Noise reduction, as a preprocessing stage. Tracks are denoised chunk by chunk, each chunk with some
+audio of context on both sides, so long recordings never have to fit in memory. Used two ways:
+- as a tool, writing '<name>_clean.wav' next to each input (or to --output_dir), in parallel across
+  tracks, and skipping tracks whose output is up to date: every output has a JSON sidecar recording
+  the hash of its input and the parameters it was made with
+- in memory, through the --denoise analysis option, which cleans recordings as they are decoded
+  instead of writing them to disk and decoding them again
+noisereduce is only needed when something is actually denoised.
+'''
+
+DENOISE_CHUNK_DURATION = 60.0 # seconds of audio denoised at a time
+DENOISE_PADDING_DURATION = 1.0 # seconds of context on each side of a chunk, discarded after denoising
+DENOISE_STATIONARY = False
+DENOISE_PROP_DECREASE = 1.0
+
+def denoise_parameters(stationary=DENOISE_STATIONARY, prop_decrease=DENOISE_PROP_DECREASE,
+                       chunk_duration=DENOISE_CHUNK_DURATION, padding_duration=DENOISE_PADDING_DURATION):
+    '''
+    Every parameter that affects the denoised output, e.g. for up-to-date checks and cache keys.
+    '''
+    return {'stationary': stationary, 'prop_decrease': prop_decrease,
+            'chunk_duration': chunk_duration, 'padding_duration': padding_duration}
+
+def denoise(y, sr, parameters=None):
+    '''
+    Denoise a whole signal, chunk by chunk exactly as denoise_blocks does.
+    '''
+    return np.concatenate(list(denoise_blocks([y], sr, parameters)), axis=-1)
+
+def denoise_blocks(blocks, sr, parameters=None):
+    '''
+    Denoise a stream of blocks of any size, one chunk at a time.
+
+    Args:
+    blocks (iterable): Blocks of samples, shaped (samples,) or (channels, samples).
+    sr (int): Sampling rate of the samples.
+    parameters (dict): From denoise_parameters (default its defaults).
+
+    Yields:
+    y (np.ndarray): The next denoised chunk; together the chunks are as long as the input.
+    '''
+    import noisereduce as nr
+    parameters = parameters if parameters is not None else denoise_parameters()
+    chunk_length = max(1, int(parameters['chunk_duration']*sr))
+    padding = min(chunk_length, int(parameters['padding_duration']*sr))
+    reduce = lambda y: nr.reduce_noise(y=y, sr=sr, stationary=parameters['stationary'],
+                                       prop_decrease=parameters['prop_decrease'])
+    buffer = None
+    # Samples at the start of the buffer that were already yielded and are only there as context
+    context = 0
+    for y in blocks:
+        buffer = y if buffer is None else np.concatenate((buffer, y), axis=-1)
+        while buffer.shape[-1] >= context + chunk_length + padding:
+            denoised = reduce(buffer[..., :context + chunk_length + padding])
+            yield denoised[..., context:context + chunk_length]
+            buffer = buffer[..., context + chunk_length - padding:]
+            context = padding
+    if buffer is not None and buffer.shape[-1] > context:
+        yield reduce(buffer)[..., context:]
+
+# Tool
+
+def clean_path(path, output_dir=None):
+    stem, _ = os.path.splitext(os.path.basename(path))
+    return os.path.join(output_dir if output_dir else os.path.dirname(path), f"{stem}_clean.wav")
+
+def is_up_to_date(path, output_path, digest, parameters):
+    '''
+    Whether 'output_path' was made from this exact input with these exact parameters.
+    '''
+    if not os.path.exists(output_path):
+        return False
+    try:
+        with open(f"{output_path}.json", "r") as f:
+            sidecar = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return False
+    return sidecar == {'input': os.path.abspath(path), 'input_digest': digest, 'parameters': parameters}
+
+def reduce_noise_file(path, output_path, parameters, force=False):
+    '''
+    Denoise one track to 'output_path', unless its output is up to date.
+
+    Returns:
+    status (str): 'skipped' or 'denoised'.
+    '''
+    digest = file_digest(path)
+    if not force and is_up_to_date(path, output_path, digest, parameters):
+        return 'skipped'
+    with sf.SoundFile(path) as f:
+        sr = f.samplerate
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        # Write then rename, so an interrupted run never leaves a truncated output that looks finished
+        with sf.SoundFile(tmp_path, "w", samplerate=sr, channels=f.channels, subtype=f.subtype, format='WAV') as out:
+            blocks = (block.T for block in f.blocks(blocksize=1 << 18, dtype='float32', always_2d=True))
+            for y in denoise_blocks(blocks, sr, parameters):
+                out.write(np.clip(y, -1, 1).T)
+    os.replace(tmp_path, output_path)
+    with open(f"{output_path}.json", "w") as f:
+        json.dump({'input': os.path.abspath(path), 'input_digest': digest, 'parameters': parameters}, f)
+    return 'denoised'
+
+def expand_inputs(inputs):
+    '''
+    Audio paths from a mix of audio lists (one path per line) and glob patterns, in order, without duplicates.
+    '''
+    paths = []
+    for pattern in inputs:
+        if os.path.splitext(pattern)[1].lower() == '.txt':
+            found = interface.parse_audio_paths(pattern, interface.AUDIO_EXTENSIONS)
+        else:
+            found = sorted(glob.glob(pattern))
+        for path in found:
+            if path not in paths and os.path.splitext(path)[1].lower() in interface.AUDIO_EXTENSIONS:
+                paths.append(path)
+    return paths
+
+def reduce_noise_files(paths, output_dir, parameters, jobs, force=False):
+    '''
+    Denoise every track, fanning them out over a pool of worker processes.
+
+    Returns:
+    results (list): (path, status) tuples in input order; status is 'skipped', 'denoised' or an error.
+    '''
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    outputs = [clean_path(path, output_dir) for path in paths]
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(reduce_noise_file, path, output, parameters, force) for path, output in zip(paths, outputs)]
+        for path, future in zip(paths, futures):
+            try:
+                results.append((path, future.result()))
+            except Exception as e:
+                results.append((path, f"{type(e).__name__}: {e}"))
+    return results
+
+if __name__ == '__main__':
+    args = interface.setup_denoise_parser()
+    paths = expand_inputs(args.inputs)
+    parameters = denoise_parameters(args.stationary, args.prop_decrease if args.prop_decrease is not None else DENOISE_PROP_DECREASE,
+                                    args.chunk if args.chunk else DENOISE_CHUNK_DURATION)
+    jobs = max(1, min(args.jobs if args.jobs else os.cpu_count(), len(paths)))
+    print(f"⏳ Denoising {len(paths)} tracks on {jobs} worker(s)...")
+    for path, status in reduce_noise_files(paths, args.output_dir, parameters, jobs, args.force):
+        print(f"{'✅' if status in ('skipped', 'denoised') else '❌'} {path}: {status}")
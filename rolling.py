@@ -0,0 +1,142 @@
+import numpy as np
+from collections import deque
+
+'''
+Rolling mirroring scores. Instead of one line of best fit over the whole conversation, p2r and r2r are
+summarized over a sliding window of the last N turns or T seconds, separately for each speaker pair
+(the previous turn's speaker, who prompted, and the current turn's speaker, who responded).
+
+Each window keeps running sums of its (time, ratio) points, so adding a turn and dropping the ones that
+fell out of the window costs O(1) amortized, however long the session is. The same RollingMirroring
+object scores an analysed conversation offline (rolling_statistics) or turns as they arrive online.
+'''
+
+ROLLING_STATISTICS = ['n', 'mean', 'variance', 'slope']
+# Rebuild a window's sums from its points after this many removals, so subtraction errors cannot build up
+RECOMPUTE_INTERVAL = 256
+
+class RollingWindow:
+    '''
+    Running mean, variance and least-squares slope of (time, value) points over the last 'turns' points
+    and/or the last 'seconds' seconds.
+    '''
+    def __init__(self, turns=None, seconds=None):
+        self.turns = turns
+        self.seconds = seconds
+        self.points = deque()
+        self.origin = 0.0
+        self.recompute()
+    def push(self, time, value):
+        if not self.points:
+            self.origin = time
+        self.points.append((time, value))
+        self.add(time - self.origin, value, 1)
+        while self.points and ((self.turns is not None and len(self.points) > self.turns) or
+                               (self.seconds is not None and time - self.points[0][0] > self.seconds)):
+            old_time, old_value = self.points.popleft()
+            self.add(old_time - self.origin, old_value, -1)
+            self.n_removed += 1
+        if self.n_removed >= RECOMPUTE_INTERVAL:
+            self.recompute()
+    def add(self, x, y, sign):
+        self.n += sign
+        self.sum_x += sign*x
+        self.sum_y += sign*y
+        self.sum_xx += sign*x*x
+        self.sum_xy += sign*x*y
+        self.sum_yy += sign*y*y
+    def recompute(self):
+        # Times are summed relative to the oldest point, which keeps the sums of squares well conditioned
+        self.origin = self.points[0][0] if self.points else 0.0
+        self.n = 0
+        self.sum_x = self.sum_y = self.sum_xx = self.sum_xy = self.sum_yy = 0.0
+        for time, value in self.points:
+            self.add(time - self.origin, value, 1)
+        self.n_removed = 0
+    def statistics(self):
+        '''
+        Returns:
+        statistics (tuple): (n, mean, variance, slope) of the window; NaN where there are too few points.
+        '''
+        n = self.n
+        if n == 0:
+            return 0, np.nan, np.nan, np.nan
+        mean = self.sum_y/n
+        variance = max(self.sum_yy/n - mean*mean, 0.0)
+        spread_x = self.sum_xx - self.sum_x*self.sum_x/n
+        slope = (self.sum_xy - self.sum_x*self.sum_y/n)/spread_x if n > 1 and spread_x > 0 else np.nan
+        return n, mean, variance, slope
+
+class RollingMirroring:
+    '''
+    Rolling p2r and r2r statistics per (prompter, responder) speaker pair, fed one turn at a time.
+
+    Args:
+    turns (int): Window length in turns of the pair (default unbounded).
+    seconds (float): Window length in seconds (default unbounded).
+    analyses (list): Ratios to follow.
+    '''
+    def __init__(self, turns=None, seconds=None, analyses=('p2r', 'r2r')):
+        self.turns = turns
+        self.seconds = seconds
+        self.analyses = list(analyses)
+        self.windows = {} # (analysis, prompter, responder) -> RollingWindow
+        self.previous_speaker = -1
+    def add_turn(self, speaker_id, start_time, ratios):
+        '''
+        Add one turn and return the updated statistics of its speaker pair.
+
+        Args:
+        speaker_id (int): Speaker of the turn.
+        start_time (float): When the turn started, in seconds.
+        ratios (dict): analysis -> the turn's ratio, None or NaN where it has none.
+
+        Returns:
+        prompter (int): Speaker of the previous turn, -1 for the first turn.
+        statistics (dict): analysis -> (n, mean, variance, slope) after adding the turn.
+        '''
+        prompter = self.previous_speaker
+        statistics = {}
+        for analysis in self.analyses:
+            key = (analysis, prompter, speaker_id)
+            window = self.windows.get(key)
+            if window is None:
+                window = self.windows[key] = RollingWindow(self.turns, self.seconds)
+            ratio = ratios.get(analysis)
+            if ratio is not None and not np.isnan(ratio):
+                window.push(start_time, ratio)
+            statistics[analysis] = window.statistics()
+        self.previous_speaker = speaker_id
+        return prompter, statistics
+
+def rolling_statistics(speaker_ids, start_times, ratios, turns=None, seconds=None):
+    '''
+    Rolling statistics of an analysed conversation, as they stood after each of its turns.
+
+    Args:
+    speaker_ids (np.ndarray): Speaker of each utterance.
+    start_times (np.ndarray): Start time of each utterance.
+    ratios (dict): analysis -> ratio of each utterance, NaN (or None) where it has none.
+    turns (int): Window length in turns of each speaker pair.
+    seconds (float): Window length in seconds.
+
+    Returns:
+    columns (dict): 'prompter_id' and '<analysis>_<statistic>' for every analysis and ROLLING_STATISTICS,
+    each an array with one entry per utterance.
+    '''
+    analyses = list(ratios)
+    rolling = RollingMirroring(turns, seconds, analyses)
+    n = len(speaker_ids)
+    columns = {'prompter_id': np.full(n, -1, dtype=np.int64)}
+    for analysis in analyses:
+        for statistic in ROLLING_STATISTICS:
+            columns[f"{analysis}_{statistic}"] = np.full(n, np.nan)
+    ratios = {analysis: np.array(values, dtype=np.float64) for analysis, values in ratios.items()}
+    for i in range(n):
+        prompter, statistics = rolling.add_turn(int(speaker_ids[i]), float(start_times[i]),
+                                                {analysis: ratios[analysis][i] for analysis in analyses})
+        columns['prompter_id'][i] = prompter
+        for analysis, values in statistics.items():
+            for statistic, value in zip(ROLLING_STATISTICS, values):
+                columns[f"{analysis}_{statistic}"][i] = value
+    return columns
@@ -0,0 +1,85 @@
+import os
+import atexit
+import shutil
+import tempfile
+import numpy as np
+
+'''
+Shared store of large arrays (decoded audio, frame features) for worker processes. The parent writes each
+array once, as a .npy file in a private directory, and hands workers small picklable handles instead of
+the arrays themselves; workers attach to the files memory-mapped, read-only, so every process reads the
+same pages of the OS page cache rather than its own unpickled copy. On Linux the directory goes on
+/dev/shm, so nothing touches the disk.
+
+The directory belongs to the process that created the store: it is removed by close(), on leaving a
+`with` block, or when that process exits, but never by workers that inherited the store through fork.
+'''
+
+SHARED_MEMORY_DIR = "/dev/shm"
+
+class SharedArray:
+    '''
+    Picklable handle to an array in a SharedFeatureStore.
+    '''
+    def __init__(self, path, shape, dtype):
+        self.path = path
+        self.shape = shape
+        self.dtype = dtype
+    def attach(self):
+        '''
+        The array, memory-mapped read-only; no data is read until it is used.
+        '''
+        return np.load(self.path, mmap_mode='r')
+
+class SharedFeatureStore:
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = SHARED_MEMORY_DIR if os.path.isdir(SHARED_MEMORY_DIR) else None
+        self.directory = tempfile.mkdtemp(prefix="vmd-store-", dir=directory)
+        self.owner = os.getpid()
+        self.n_arrays = 0
+        self.n_bytes = 0
+        atexit.register(self.close)
+    def put(self, data):
+        '''
+        Write an array to the store.
+
+        Returns:
+        handle (SharedArray): What to send to workers in place of 'data'.
+        '''
+        data = np.asarray(data)
+        path = os.path.join(self.directory, f"{self.n_arrays}.npy")
+        with open(path, "wb") as f:
+            np.save(f, data)
+        self.n_arrays += 1
+        self.n_bytes += data.nbytes
+        return SharedArray(path, data.shape, data.dtype)
+    def share(self, arrays):
+        '''
+        Put every array of a nested structure of lists, tuples and dicts, returning the same structure of handles.
+        '''
+        if isinstance(arrays, dict):
+            return {key: self.share(value) for key, value in arrays.items()}
+        if isinstance(arrays, (list, tuple)):
+            return type(arrays)(self.share(value) for value in arrays)
+        return self.put(arrays)
+    def close(self):
+        if os.getpid() != self.owner or self.directory is None:
+            return
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory = None
+        atexit.unregister(self.close)
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+
+def attach(handles):
+    '''
+    Attach to every handle of a nested structure made by SharedFeatureStore.share, returning the arrays.
+    '''
+    if isinstance(handles, dict):
+        return {key: attach(value) for key, value in handles.items()}
+    if isinstance(handles, (list, tuple)):
+        return type(handles)(attach(value) for value in handles)
+    return handles.attach()
@@ -0,0 +1,120 @@
+import numpy as np
+import soxr
+import soundfile as sf
+
+'''
+Block-wise audio ingestion. Recordings are read a block at a time and turned into frame-level features
+as they go, so only the features (and one block of samples) are ever held in memory, however long the
+recording is. Frames that straddle a block boundary are carried over to the next block, and the stream
+is zero padded at both ends exactly like librosa's center=True framing, so streamed features match the
+ones computed over the whole signal.
+'''
+
+# Number of samples read from disk per block, at the file's native rate
+BLOCK_LENGTH = 1 << 18
+
+class FrameStream:
+    '''
+    Turn blocks of samples of any size into spans that hold only whole analysis frames. With a
+    'frame_multiple', spans hold whole groups of that many frames until the stream is flushed, so every
+    span starts on a frame whose index is a multiple of it.
+    '''
+    def __init__(self, frame_length, hop_length, center=True, frame_multiple=1):
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        self.center = center
+        self.frame_multiple = frame_multiple
+        # Samples not yet covered by an emitted frame, starting at the next frame's first sample
+        self.buffer = np.zeros(frame_length//2 if center else 0, dtype=np.float32)
+    def push(self, y):
+        '''
+        Add samples to the stream.
+
+        Returns:
+        span (np.ndarray): Samples covering every frame that is now complete, to be framed with center=False.
+        '''
+        return self.emit(y, self.frame_multiple)
+    def emit(self, y, frame_multiple):
+        buffer = np.concatenate((self.buffer, y)) if len(self.buffer) else np.asarray(y)
+        n_frames = 0 if len(buffer) < self.frame_length else 1 + (len(buffer) - self.frame_length)//self.hop_length
+        n_frames -= n_frames % frame_multiple
+        # The next frame starts n_frames hops in; everything before that is no longer needed
+        self.buffer = buffer[n_frames*self.hop_length:]
+        return buffer[:(n_frames - 1)*self.hop_length + self.frame_length] if n_frames else buffer[:0]
+    def flush(self):
+        '''
+        Close the stream, padding the end when centered, and return the span of the remaining frames.
+        '''
+        padding = np.zeros(self.frame_length//2 if self.center else 0, dtype=np.float32)
+        return self.emit(padding, 1)
+
+class StreamingFeature:
+    '''
+    Frame-level feature computed incrementally from a FrameStream.
+
+    Args:
+    frame_length (int): Samples per analysis frame.
+    hop_length (int): Samples between successive frames.
+    compute (function): Maps a span of whole frames (framed with center=False) to one value per frame,
+    or to several rows of them.
+    frame_multiple (int): Spans start on frames whose index is a multiple of this (see FrameStream).
+    '''
+    def __init__(self, frame_length, hop_length, compute, frame_multiple=1):
+        self.frames = FrameStream(frame_length, hop_length, frame_multiple=frame_multiple)
+        self.compute = compute
+        self.blocks = []
+    def push(self, y):
+        span = self.frames.push(y)
+        if len(span):
+            self.blocks.append(self.compute(span))
+    def finish(self):
+        span = self.frames.flush()
+        if len(span):
+            self.blocks.append(self.compute(span))
+        if not self.blocks:
+            return np.zeros(0)
+        return np.concatenate(self.blocks, axis=-1)
+
+def read_blocks(path, sampling_rate, offset=0, duration=None, block_length=BLOCK_LENGTH):
+    '''
+    Read a recording block by block as mono float32 at 'sampling_rate', like librosa.load does in one go.
+
+    Args:
+    path (str): Path to the audio file.
+    sampling_rate (int): Rate to resample to, or None to keep the file's native rate.
+    offset (float): Start reading after this time, in seconds.
+    duration (float): Only read this much audio, in seconds (default until the end).
+    block_length (int): Samples to read per block, at the native rate.
+
+    Yields:
+    y (np.ndarray): The next block of samples.
+    '''
+    with sf.SoundFile(path) as f:
+        native_rate = f.samplerate
+        if offset:
+            f.seek(int(offset*native_rate))
+        remaining = int(duration*native_rate) if duration is not None else f.frames - f.tell()
+        resampler = None
+        if sampling_rate is not None and sampling_rate != native_rate:
+            resampler = soxr.ResampleStream(native_rate, sampling_rate, 1, dtype='float32', quality='HQ')
+        n_read = 0
+        n_resampled = 0
+        while remaining > 0:
+            block = f.read(min(block_length, remaining), dtype='float32', always_2d=True)
+            if len(block) == 0: break
+            remaining -= len(block)
+            n_read += len(block)
+            y = block.mean(axis=1, dtype=np.float32) if block.shape[1] > 1 else np.ascontiguousarray(block[:, 0])
+            if resampler is not None:
+                y = resampler.resample_chunk(y)
+                n_resampled += len(y)
+            yield y
+        if resampler is not None:
+            tail = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+            # librosa trims or zero pads the resampled signal to exactly this many samples
+            excess = n_resampled + len(tail) - int(np.ceil(n_read*sampling_rate/native_rate))
+            if excess > 0:
+                tail = tail[:max(len(tail) - excess, 0)]
+            else:
+                tail = np.concatenate((tail, np.zeros(-excess, dtype=np.float32)))
+            yield tail
@@ -0,0 +1,197 @@
+import io
+import os
+import copy
+import json
+import time
+import contextlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+import interface
+import pre_processing
+import processing
+import export
+import profiling
+import shared_store
+from batch import summarize_conversation
+
+'''
+Parameter sweeps. Choosing the utterance length (--u_length) and the volume silence threshold is a
+trade-off between fidelity and noise, and sweeping them with vmd.py decodes, extracts and segments the
+recordings again for every value. Here the recordings are decoded and their frame features extracted once:
+- each recording's frame features are reduced to running sums and counts of their non-zero values, once
+  per silence threshold (volume is gated from the ungated RMS, so any threshold can be swept)
+- every utterance length then downsamples from those prefix sums in O(windows) instead of O(frames)
+- each parameter set runs the rest of the pipeline (turns, enrichment, analyses) as vmd.py would
+With --jobs, parameter sets are analysed by a pool of worker processes, which attach to the prefix sums
+through a shared_store.SharedFeatureStore instead of each receiving a pickled copy.
+Results are keyed by parameter set, e.g. 'u_length=3,rms_threshold=0.1'.
+'''
+
+def parameter_grid(u_lengths, rms_thresholds):
+    return [(u_length, rms_threshold) for rms_threshold in rms_thresholds for u_length in u_lengths]
+
+def parameter_label(u_length, rms_threshold):
+    return f"u_length={u_length},rms_threshold={rms_threshold}"
+
+def frame_prefix_sums(options, rms_thresholds=None):
+    '''
+    Extract the requested frame features once and turn them into prefix sums of their non-zero values.
+
+    Args:
+    options: An AnalysisOptions object.
+    rms_thresholds (list): Silence thresholds to gate volume with; None keeps the default gating.
+
+    Returns:
+    prefix_sums (dict): (feature, rms_threshold) -> list of (sums, counts) per recording; rms_threshold
+    is None for features other than volume.
+    n_frames (dict): feature -> list of frame counts per recording.
+    '''
+    extraction_options = copy.copy(options)
+    gate_volume = rms_thresholds is not None and options.requested_features.get('volume')
+    if gate_volume:
+        # Volume is gated below, once per threshold, so extract the RMS before any gating
+        extraction_options.requested_features = {('rms' if f == 'volume' else f): is_on
+                                                 for f, is_on in options.requested_features.items()}
+    feature_matrices = pre_processing.get_features(extraction_options)
+    prefix_sums = {}
+    n_frames = {}
+    for key, matrix in feature_matrices.items():
+        feature = 'volume' if key == 'rms' else key
+        n_frames[feature] = [len(data) for data in matrix]
+        if key == 'rms':
+            for rms_threshold in rms_thresholds:
+                prefix_sums[(feature, rms_threshold)] = [
+                    pre_processing.non_zero_prefix_sums(np.where(data >= rms_threshold, data, 0)) for data in matrix]
+        else:
+            threshold = pre_processing.RMS_THRESHOLD if feature == 'volume' else None
+            prefix_sums[(feature, threshold)] = [pre_processing.non_zero_prefix_sums(data) for data in matrix]
+    return prefix_sums, n_frames
+
+def window_features(options, prefix_sums, n_frames, u_length, rms_threshold):
+    '''
+    Downsampled feature matrices for one utterance length, as clean_up would return them.
+    '''
+    feature_matrices = {}
+    for feature, frame_counts in n_frames.items():
+        sums = prefix_sums[(feature, rms_threshold if feature == 'volume' else None)]
+        feature_matrices[feature] = []
+        for (s, c), n in zip(sums, frame_counts):
+            window_size = int(n*u_length/options.duration)
+            feature_matrices[feature].append(pre_processing.downsample_prefix_sums(s, c, window_size))
+    return feature_matrices
+
+def analyse_windows(options, feature_matrices):
+    '''
+    Run the pipeline from utterance matrices to analysed conversations, one per feature.
+    '''
+    utterance_matrices = pre_processing.get_utterance_matrices(options, feature_matrices)
+    if options.joint_on:
+        joint_conversation = pre_processing.get_joint_conversation(options, utterance_matrices)
+        processing.analyse_joint(options, joint_conversation)
+        return joint_conversation.conversations()
+    conversations = pre_processing.get_conversations(options, utterance_matrices)
+    rich_conversations = pre_processing.enrich_conversations(conversations)
+    return processing.extract_analyses(options, rich_conversations)
+
+def analyse_parameters(options, prefix_sums, n_frames, u_length, rms_threshold):
+    '''
+    Analyse one parameter set from the prefix sums of frame_prefix_sums.
+
+    Returns:
+    conversations (dict): feature label -> analysed Conversation.
+    '''
+    parameter_options = copy.copy(options)
+    parameter_options.u_length = u_length
+    with profiling.stage('parameter_set', u_length=u_length, rms_threshold=rms_threshold):
+        feature_matrices = window_features(parameter_options, prefix_sums, n_frames, u_length, rms_threshold)
+        # Keep the pipeline's per-stage progress messages out of the sweep's own output
+        with contextlib.redirect_stdout(io.StringIO()):
+            conversations = analyse_windows(parameter_options, feature_matrices)
+    return dict(zip(feature_matrices.keys(), conversations))
+
+def analyse_shared_parameters(options, handles, n_frames, u_length, rms_threshold):
+    '''
+    analyse_parameters in a worker process, reading the prefix sums from a SharedFeatureStore.
+    '''
+    return analyse_parameters(options, shared_store.attach(handles), n_frames, u_length, rms_threshold)
+
+def sweep(options, u_lengths, rms_thresholds=None, jobs=1):
+    '''
+    Analyse one conversation for every combination of utterance length and volume silence threshold.
+
+    Args:
+    options: An AnalysisOptions object; its u_length is replaced by each of 'u_lengths'.
+    u_lengths (list): Utterance lengths in seconds.
+    rms_thresholds (list): Volume silence thresholds (default only pre_processing.RMS_THRESHOLD).
+    jobs (int): Number of worker processes; 1 analyses every parameter set in this process.
+
+    Returns:
+    results (dict): (u_length, rms_threshold) -> {feature label: analysed Conversation}.
+    '''
+    with profiling.stage('prefix_sums'):
+        prefix_sums, n_frames = frame_prefix_sums(options, rms_thresholds)
+    thresholds = rms_thresholds if rms_thresholds is not None else [pre_processing.RMS_THRESHOLD]
+    grid = parameter_grid(u_lengths, thresholds)
+    results = {}
+    if jobs == 1:
+        for u_length, rms_threshold in grid:
+            results[(u_length, rms_threshold)] = analyse_parameters(options, prefix_sums, n_frames, u_length, rms_threshold)
+        return results
+    with shared_store.SharedFeatureStore() as store, ProcessPoolExecutor(max_workers=jobs) as executor:
+        handles = store.share(prefix_sums)
+        futures = [executor.submit(analyse_shared_parameters, options, handles, n_frames, *parameters) for parameters in grid]
+        for parameters, future in zip(grid, futures):
+            results[parameters] = future.result()
+    return results
+
+def print_summary(results, analyses):
+    print(f"{'parameters':<32} {'feature':<8} {'turns':>6}" + "".join(f" {'mean ' + a:>10}" for a in analyses))
+    for (u_length, rms_threshold), conversations in results.items():
+        for feature, c in conversations.items():
+            means = []
+            for analysis in analyses:
+                values = getattr(c.utterances, analysis)
+                values = values[np.isfinite(values)]
+                means.append(f" {values.mean():10.3f}" if len(values) else f" {'-':>10}")
+            print(f"{parameter_label(u_length, rms_threshold):<32} {feature:<8} {len(c.utterances):>6}" + "".join(means))
+
+if __name__ == '__main__':
+    args = interface.setup_sweep_parser()
+    options = interface.construct_analysis_options(args)
+    u_lengths = args.u_lengths if args.u_lengths else [options.u_length]
+    if args.rms_thresholds and not options.requested_features.get('volume'):
+        print("Silence thresholds only apply to volume, which was not requested; sweeping utterance lengths only")
+        args.rms_thresholds = None
+    if args.rms_thresholds and options.vad_on:
+        print("Silence thresholds do not apply when volume is gated by speaker activity (--vad); sweeping utterance lengths only")
+        args.rms_thresholds = None
+    if options.profile_on:
+        profiling.enable(options.profile_cprofile_dir)
+    n_sets = len(u_lengths)*(len(args.rms_thresholds) if args.rms_thresholds else 1)
+    print(f"⏳ Sweeping {n_sets} parameter sets...")
+    start = time.perf_counter()
+    jobs = max(1, min(args.jobs if args.jobs else os.cpu_count(), n_sets))
+    results = sweep(options, u_lengths, args.rms_thresholds, jobs)
+    print(f"✅ Analysed {n_sets} parameter sets in {time.perf_counter() - start:.2f}s")
+    analyses = [a for a, is_on in options.requested_analyses.items() if is_on]
+    print_summary(results, analyses)
+    if options.export_dir:
+        # One export per parameter set, in directories named after the parameters (e.g. for partitioned reads)
+        conversation_id = interface.conversation_id(args.audio_list)
+        for (u_length, rms_threshold), conversations in results.items():
+            parameter_options = copy.copy(options)
+            parameter_options.export_dir = os.path.join(options.export_dir, f"u_length={u_length}", f"rms_threshold={rms_threshold}")
+            with contextlib.redirect_stdout(io.StringIO()):
+                export.export_conversations(parameter_options, conversation_id, list(conversations.values()),
+                                            list(conversations.keys()))
+        print(f"Exported results to {options.export_dir}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({parameter_label(*parameters): {'u_length': parameters[0], 'rms_threshold': parameters[1],
+                                                      'analyses': analyses,
+                                                      'features': {feature: summarize_conversation(c) for feature, c in conversations.items()}}
+                       for parameters, conversations in results.items()}, f)
+    if options.profile_on:
+        print("----------------------------")
+        profiling.disable().print_summary()
@@ -0,0 +1,24 @@
+import os
+import numpy as np
+
+import feature_cache
+from feature_cache import FeatureCache
+
+def test_get_survives_eviction_between_load_and_touch(tmp_path, monkeypatch):
+    cache = FeatureCache(str(tmp_path))
+    data = np.arange(10, dtype=np.float64)
+    cache.put("entry", data)
+    load = np.load
+    def load_then_evict(path, *args, **kwargs):
+        # Another worker's evict() removes the entry right after this one mapped it
+        loaded = load(path, *args, **kwargs)
+        os.remove(path)
+        return loaded
+    monkeypatch.setattr(feature_cache.np, "load", load_then_evict)
+    cached = cache.get("entry")
+    assert cached is not None
+    np.testing.assert_array_equal(cached, data)
+    assert not os.path.exists(cache.path("entry"))
+
+def test_get_missing_entry_is_a_miss(tmp_path):
+    assert FeatureCache(str(tmp_path)).get("missing") is None
@@ -0,0 +1,81 @@
+import io
+import copy
+import contextlib
+import numpy as np
+import soundfile as sf
+import pytest
+
+import benchmark
+import incremental
+import interface
+import pre_processing
+import processing
+
+DURATION = 40
+N_SPEAKERS = 3
+# Uneven segments, some shorter than a window and one shorter than a frame
+SEGMENT_ENDS = [0.4, 0.41, 2.7, 3.1, 9.8, 10.2, 17.5, 24.05, 31.7, DURATION]
+
+def recordings(directory, sampling_rate):
+    '''
+    Samples of every track of a synthetic conversation.
+    '''
+    audio_list, _ = benchmark.synthetic_conversation_audio(str(directory), N_SPEAKERS, DURATION, sampling_rate=sampling_rate,
+                                                           seed=2)
+    return [sf.read(path, dtype='int16')[0] for path in interface.parse_audio_paths(audio_list, interface.AUDIO_EXTENSIONS)]
+
+def analysis_options(paths, pitch_backend, min_turn_length):
+    return interface.AnalysisOptions(paths, 1, 0, interface.get_duration(paths[0]), {'volume': True, 'pitch': True}, False,
+                                     {'p2r': True, 'r2r': True}, cache_on=False, pitch_backend=pitch_backend,
+                                     min_turn_length=min_turn_length, native_rate_on=True)
+
+def full_analysis(options):
+    with contextlib.redirect_stdout(io.StringIO()):
+        feature_matrices = pre_processing.clean_up(options, pre_processing.get_features(options))
+        conversations = pre_processing.get_conversations(options, pre_processing.get_utterance_matrices(options, feature_matrices))
+        return processing.extract_analyses(options, pre_processing.enrich_conversations(conversations))
+
+def grow_and_compare(tmp_path, sampling_rate, pitch_backend, min_turn_length, extra_samples):
+    '''
+    Write longer and longer prefixes of the tracks, update the incremental analysis after each and check it
+    against a full analysis of the prefix.
+
+    Args:
+    extra_samples (function): Samples to add to track i at the n-th prefix, to make track lengths ragged.
+
+    Returns:
+    messages (str): What the updates printed.
+    '''
+    (tmp_path/"source").mkdir()
+    data = recordings(tmp_path/"source", sampling_rate)
+    paths = [str(tmp_path/f"speaker_{i}.wav") for i in range(N_SPEAKERS)]
+    state_dir = str(tmp_path/"state")
+    messages = io.StringIO()
+    for n, end in enumerate(SEGMENT_ENDS):
+        for i, (path, samples) in enumerate(zip(paths, data)):
+            sf.write(path, samples[:int(end*sampling_rate) + extra_samples(i, n)], sampling_rate, subtype='PCM_16')
+        options = analysis_options(paths, pitch_backend, min_turn_length)
+        with contextlib.redirect_stdout(messages):
+            conversations, labels = incremental.update(copy.copy(options), state_dir)
+        expected = full_analysis(options)
+        assert labels == ['volume', 'pitch']
+        for label, actual, reference in zip(labels, conversations, expected):
+            actual, reference = actual.utterances, reference.utterances
+            for column in ['speaker_ids', 'start_times', 'end_times', 'values', 'p2r', 'r2r']:
+                assert np.array_equal(getattr(actual, column), getattr(reference, column), equal_nan=True), \
+                    f"{label} {column} differs after {end}s"
+    assert len(conversations[0].utterances) > 2
+    return messages.getvalue()
+
+@pytest.mark.parametrize("sampling_rate, pitch_backend, min_turn_length", [(22050, 'piptrack', 2), (22050, 'autocorrelation', 3),
+                                                                          (44100, 'autocorrelation', 2), (44100, 'piptrack', 3)])
+def test_updates_match_full_analysis(tmp_path, sampling_rate, pitch_backend, min_turn_length):
+    messages = grow_and_compare(tmp_path, sampling_rate, pitch_backend, min_turn_length, lambda i, n: 37*i)
+    assert "rebuilding" not in messages
+
+def test_turns_are_rebuilt_when_window_sizes_change(tmp_path):
+    # One track at a time gets ahead of the others, which changes how windows are sized and which track is longest
+    def extra_samples(i, n):
+        return 20000*sum((i + k) % N_SPEAKERS == 0 for k in range(n + 1))
+    messages = grow_and_compare(tmp_path, 44100, 'autocorrelation', 2, extra_samples)
+    assert "rebuilding" in messages
@@ -0,0 +1,57 @@
+import io
+import contextlib
+import numpy as np
+import soundfile as sf
+import pytest
+
+import interface
+import online
+import pre_processing
+import processing
+
+def write_conversation(directory, n_speakers=3, duration=60, sampling_rate=pre_processing.SAMPLING_RATE, seed=0):
+    '''
+    One track per speaker: turns of a tone on the speaker's own track, a faint copy on the others.
+    '''
+    rng = np.random.default_rng(seed)
+    t = np.arange(duration*sampling_rate)/sampling_rate
+    tracks = rng.normal(0, 0.002, (n_speakers, len(t)))
+    start = 0.0
+    while start < duration:
+        speaker, length = rng.integers(n_speakers), rng.uniform(2, 15)
+        span = (t >= start) & (t < start + length)
+        tone = rng.uniform(0.2, 0.6)*np.sin(2*np.pi*(120 + 40*speaker)*t[span])
+        tracks[:, span] += 0.05*tone
+        tracks[speaker, span] += tone
+        start += length + rng.uniform(0, 3)
+    paths = [str(directory/f"speaker_{i}.wav") for i in range(n_speakers)]
+    for path, y in zip(paths, tracks):
+        sf.write(path, np.clip(y, -1, 1), sampling_rate, subtype='PCM_16')
+    return paths
+
+def offline_turns(paths, u_length):
+    options = interface.AnalysisOptions(paths, u_length, 0, interface.get_duration(paths[0]), {'volume': True}, False,
+                                        {'p2r': True, 'r2r': True}, cache_on=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        feature_matrices = pre_processing.clean_up(options, pre_processing.get_features(options))
+        conversations = pre_processing.get_conversations(options, pre_processing.get_utterance_matrices(options, feature_matrices))
+        return processing.extract_analyses(options, pre_processing.enrich_conversations(conversations))[0].utterances
+
+# At 5 s, rounding u_length*sampling_rate/HOP_LENGTH gives 431 frames per window where clean_up truncates to 430
+@pytest.mark.parametrize("u_length", [3, 5])
+def test_online_turns_match_offline(tmp_path, u_length):
+    paths = write_conversation(tmp_path)
+    expected = offline_turns(paths, u_length)
+    with contextlib.redirect_stdout(io.StringIO()):
+        turns, _ = online.replay(paths, u_length, speed=0)
+    # The offline fold drops the open last turn, which the online detector reports when the session closes
+    assert len(turns) in (len(expected), len(expected) + 1)
+    assert len(expected) > 3
+    turns = turns[:len(expected)]
+    np.testing.assert_array_equal([t.speaker_id for t in turns], expected.speaker_ids)
+    np.testing.assert_array_equal([t.start_time for t in turns], expected.start_times)
+    np.testing.assert_array_equal([t.end_time for t in turns], expected.end_times)
+    np.testing.assert_allclose([t.value for t in turns], expected.values, rtol=1e-12)
+    for analysis in ['p2r', 'r2r']:
+        actual = np.array([np.nan if getattr(t, analysis) is None else getattr(t, analysis) for t in turns])
+        np.testing.assert_allclose(actual, getattr(expected, analysis), rtol=1e-12)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import voice_activity
+
+FRAME_RATE = 100
+
+def runs(*spans, n_frames=40):
+    '''
+    One track active over the given [start, end) frame spans.
+    '''
+    active = np.zeros((1, n_frames), dtype=bool)
+    for start, end in spans:
+        active[0, start:end] = True
+    return active
+
+def test_count_active_clips_windows_to_track():
+    active = runs((0, 3), (5, 6), n_frames=8)
+    np.testing.assert_array_equal(voice_activity.count_active(active, 1, 2), [[3, 3, 2, 2, 1, 1, 1, 0]])
+
+@pytest.mark.parametrize("hangover", [2, 3, 5])
+def test_gaps_up_to_hangover_are_bridged(hangover):
+    # Longer gaps are left whole, with no activity made up inside them
+    for gap, bridged in [(hangover, True), (hangover + 1, False), (2*hangover - 1, False)]:
+        active = runs((5, 10), (10 + gap, 20))
+        expected = runs((5, 20)) if bridged else active
+        np.testing.assert_array_equal(voice_activity.smooth_activity(active, 1, hangover), expected)
+
+def test_bridging_stays_within_the_track():
+    # Runs at either end keep their length, and short stretches before the first run or after the last stay inactive
+    for active in [runs((0, 5), (30, 40)), runs((2, 5), (30, 38))]:
+        np.testing.assert_array_equal(voice_activity.smooth_activity(active, 1, 3), active)
+
+def test_bursts_under_min_speech_are_dropped():
+    min_speech = int(round(voice_activity.MIN_SPEECH*FRAME_RATE))
+    active = runs((2, 2 + min_speech - 1), (50, 50 + min_speech), n_frames=100)
+    np.testing.assert_array_equal(voice_activity.smooth_activity(active, min_speech, 0), runs((50, 50 + min_speech), n_frames=100))
+
+def test_noise_floors_follow_each_track():
+    n_frames = 10*FRAME_RATE
+    rms = np.vstack([np.full(n_frames, 0.001), np.full(n_frames, 0.05)])
+    rms[:, 300:600] = 0.4
+    rms[0, :50] = 0
+    np.testing.assert_allclose(voice_activity.noise_floors(rms, FRAME_RATE), [[0.001]*n_frames, [0.05]*n_frames])
+
+def test_bleed_is_not_speech():
+    n_frames = 10*FRAME_RATE
+    rng = np.random.default_rng(0)
+    rms = rng.uniform(0.001, 0.002, (2, n_frames))
+    # Speaker 0 talks over frames 200-700; track 1 picks them up 12 dB down
+    rms[0, 200:700] = 0.4
+    rms[1, 200:700] = 0.4*10**(-12/20)
+    active = voice_activity.speaker_activity(rms, FRAME_RATE)
+    np.testing.assert_array_equal(active[0], runs((200, 700), n_frames=n_frames)[0])
+    assert not active[1].any()
+
+def test_gate_activity_keeps_track_lengths():
+    rng = np.random.default_rng(0)
+    lengths = [1000, 940, 1000]
+    rms_matrix = [rng.uniform(0.001, 0.002, n) for n in lengths]
+    rms_matrix[1][100:400] = 0.3
+    rms_matrix[2][600:900] = 0.3
+    volume_matrix = voice_activity.gate_activity(rms_matrix, FRAME_RATE)
+    assert [len(volume) for volume in volume_matrix] == lengths
+    assert all(volume.dtype == np.float64 for volume in volume_matrix)
+    assert not volume_matrix[0].any()
+    np.testing.assert_array_equal(np.flatnonzero(volume_matrix[1]), np.arange(100, 400))
+    np.testing.assert_array_equal(np.flatnonzero(volume_matrix[2]), np.arange(600, 900))
+    np.testing.assert_array_equal(volume_matrix[2][600:900], rms_matrix[2][600:900])
@@ -1,7 +1,10 @@
 import interface
+import incremental
 import pre_processing
 import processing
 import post_processing
+import export
+import profiling
 
 # Build Parser object to read in options from command line
 args = interface.setup_interface_parser()
@@ -9,42 +12,110 @@ args = interface.setup_interface_parser()
 # Build AnalysisOptions object to keep track of command line options
 options = interface.construct_analysis_options(args)
 
+# Record time and memory per stage if requested; otherwise the stage markers below cost next to nothing
+if options.profile_on:
+    profiling.enable(options.profile_cprofile_dir)
+
 print("⏳ 1/3 Pre-Processing Data...")
 
-# Build Recording list from arguments passed in command line
-recordings = pre_processing.get_recordings(options)
+if args.state_dir:
+    # Recordings that keep growing: only the audio added since the last run is analysed, and the turns
+    # closed by then are read back from the state directory along with the rest of the state
+    with profiling.stage('incremental'):
+        rich_conversations, labels = incremental.update(options, args.state_dir, args.duration)
+
+    # print transcription if argument was passed
+    if options.transcription_on:
+        for c in rich_conversations:
+            c.print_description()
+else:
+    # Extract requested features from the recordings as matrix [volume, pitch, cadence, etc.] x [values for each],
+    # decoding only the recordings whose features are not cached yet
+    with profiling.stage('get_features'):
+        feature_matrices = pre_processing.get_features(options)
+    labels = list(feature_matrices.keys())
 
-# Extract requested features from Recording list as matrix [volume, pitch, cadence, etc.] x [values for each]
-feature_matrices = pre_processing.extract_features(options, recordings)
+    # Clean up data (round, normalize, and downsample)
+    with profiling.stage('clean_up'):
+        feature_matrices = pre_processing.clean_up(options, feature_matrices)
 
-# Clean up data (round, normalize, and downsample)
-feature_matrices = pre_processing.clean_up(options, feature_matrices)
+    # Build UtteranceMatrix list from feature matrix list
+    with profiling.stage('get_utterance_matrices'):
+        utterance_matrices = pre_processing.get_utterance_matrices(options, feature_matrices)
 
-# Build UtteranceMatrix list from feature matrix list
-utterance_matrices = pre_processing.get_utterance_matrices(options, feature_matrices)
+    if options.joint_on:
+        # Segment turns once and aggregate every feature over them
+        with profiling.stage('get_joint_conversation'):
+            joint_conversation = pre_processing.get_joint_conversation(options, utterance_matrices)
+        rich_conversations = joint_conversation.conversations()
 
-# Build Conversation list from UtteranceMatrix list; each represents a different feature
-conversations = pre_processing.get_conversations(options, utterance_matrices)
+        # print transcription if argument was passed
+        if options.transcription_on:
+            for c in rich_conversations:
+                c.print_description()
+    else:
+        # Build Conversation list from UtteranceMatrix list; each represents a different feature
+        with profiling.stage('get_conversations'):
+            conversations = pre_processing.get_conversations(options, utterance_matrices)
 
-# print transcription if argument was passed
-if options.transcription_on:
-    for c in conversations:
-        c.print_description()
+        # print transcription if argument was passed
+        if options.transcription_on:
+            for c in conversations:
+                c.print_description()
 
-# Enrich each Conversation, removing silences
-rich_conversations = pre_processing.enrich_conversations(conversations)
+        # Enrich each Conversation, removing silences
+        with profiling.stage('enrich_conversations'):
+            rich_conversations = pre_processing.enrich_conversations(conversations)
 
 print("✅ Finished Pre-Processing Data")
 print("----------------------------")
 print("⏳ 2/3 Processing Data...")
 
-# For each conversation, perform the requested analysis
-analysed_conversations = processing.extract_analyses(options, rich_conversations)
+# For each conversation, perform the requested analysis; in joint mode all features are analysed in one sweep
+with profiling.stage('extract_analyses'):
+    if args.state_dir:
+        # Turns were scored as they closed
+        analysed_conversations = rich_conversations
+    elif options.joint_on:
+        processing.analyse_joint(options, joint_conversation)
+        analysed_conversations = rich_conversations
+    else:
+        analysed_conversations = processing.extract_analyses(options, rich_conversations)
+
+# Print who mirrors whom: mean p2r per prompter and responder, for every feature in one grouped pass
+if options.pairwise_on:
+    with profiling.stage('pairwise'):
+        if options.joint_on:
+            j = joint_conversation
+            ids, counts, means, _ = processing.pairwise_prompt_to_response(j.speaker_ids, j.values)
+            pairwise = [(ids, counts[f], means[f]) for f in range(len(j.features))]
+        else:
+            pairwise = [processing.pairwise_prompt_to_response(c.utterances.speaker_ids, c.utterances.values)[:3]
+                        for c in rich_conversations]
+    for label, (ids, counts, means) in zip(labels, pairwise):
+        processing.print_pairwise(label, ids, counts, means)
+
+# Append machine-readable results if an export directory was given
+if options.export_dir:
+    with profiling.stage('export'):
+        export.export_conversations(options, interface.conversation_id(args.audio_list), rich_conversations, labels)
 
 print("✅ Finished Processing Data")
 print("----------------------------")
 print("⏳ 3/3 Post-Processing Data...")
 
-post_processing.visualize(options, analysed_conversations)
+# Plots are shown in windows, or saved to options.plot_dir by background workers
+if options.plot_on:
+    with profiling.stage('visualize'):
+        post_processing.visualize(options, analysed_conversations, labels)
+
+print("✅ Finished Post-Processing Data")
 
-print("✅ Finished Post-Processing Data")
\ No newline at end of file
+if options.profile_on:
+    profiler = profiling.disable()
+    print("----------------------------")
+    profiler.print_summary()
+    if options.profile_json:
+        profiler.write_json(options.profile_json)
+    if options.profile_trace:
+        profiler.write_trace(options.profile_trace)
\ No newline at end of file
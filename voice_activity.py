@@ -0,0 +1,123 @@
+import numpy as np
+
+'''
+Speaker activity detection, in place of a fixed RMS silence threshold. The frame RMS of every track of a
+conversation is looked at together, as one speakers x frames matrix:
+- each track gets its own noise floor, the quietest stretch of the track around each frame, so that a
+  quiet speaker or a noisy microphone is judged against its own background rather than a fixed level
+- a frame only counts as speech on a track when that track is not much quieter than the loudest track
+  at the same frame: close-miked tracks pick up the other speakers (bleed), always well below the
+  speaker's own microphone
+- activity is smoothed over time, dropping bursts too short to be speech (clicks, coughs) and holding a
+  speaker active through pauses no longer than a hangover, such as the dips between syllables
+Every step is an array operation over the whole matrix; nothing loops over frames.
+'''
+
+# Noise floors are the quietest NOISE_BLOCK of the NOISE_SPAN around each frame, in seconds
+NOISE_BLOCK = 1.0
+NOISE_SPAN = 30.0
+# A frame is speech when its RMS is at least SPEECH_RATIO times its track's floor (about 10 dB), and MIN_RMS
+SPEECH_RATIO = 3.0
+MIN_RMS = 0.01
+# A frame is bleed when its RMS is 12 dB or more below the loudest track's at the same frame
+BLEED_RATIO = 10**(-12/20)
+# Speech shorter than MIN_SPEECH is dropped, and pauses up to HANGOVER are bridged, in seconds. Blips
+# shorter than a short word, alone in a pause, would otherwise win their whole window for their speaker.
+MIN_SPEECH = 0.3
+HANGOVER = 0.2
+
+def noise_floors(rms, frame_rate):
+    '''
+    Noise floor of every frame of every track: the lowest RMS over the NOISE_SPAN around it, taken block
+    by block. Digital silence (frames of exactly 0, e.g. padding) is left out.
+
+    Args:
+    rms (np.ndarray): speakers x frames RMS.
+    frame_rate (float): Frames per second.
+
+    Returns:
+    floors (np.ndarray): speakers x frames noise floors, 0 where a track has nothing but digital silence.
+    '''
+    n_speakers, n_frames = rms.shape
+    block = max(1, int(round(NOISE_BLOCK*frame_rate)))
+    n_blocks = -(-n_frames // block)
+    padded = np.full((n_speakers, n_blocks*block), np.inf)
+    padded[:, :n_frames] = np.where(rms > 0, rms, np.inf)
+    block_minima = padded.reshape(n_speakers, n_blocks, block).min(axis=2)
+    half = max(0, int(round(NOISE_SPAN/NOISE_BLOCK))//2)
+    neighbours = np.pad(block_minima, ((0, 0), (half, half)), constant_values=np.inf)
+    floors = np.lib.stride_tricks.sliding_window_view(neighbours, 2*half + 1, axis=1).min(axis=2)
+    floors[np.isinf(floors)] = 0
+    return np.repeat(floors, block, axis=1)[:, :n_frames]
+
+def count_active(active, before, after):
+    '''
+    Number of active frames among the 'before' frames before each frame, the frame itself and the 'after'
+    frames after it, from running counts along each track.
+    '''
+    n_frames = active.shape[1]
+    counts = np.zeros((active.shape[0], n_frames + 1), dtype=np.int32)
+    np.cumsum(active, axis=1, out=counts[:, 1:])
+    # Repeating the first and last counts past the ends clips the windows to the track
+    counts = np.pad(counts, ((0, 0), (before, after)), mode='edge')
+    return counts[:, before + after + 1:before + after + 1 + n_frames] - counts[:, :n_frames]
+
+def smooth_activity(active, min_speech, hangover):
+    '''
+    Drop runs of activity shorter than 'min_speech' frames, then fill gaps of up to 'hangover' frames
+    between runs. Runs are not extended past their ends: trailing frames would be near-silent, and would
+    pull down their speaker's mean over a window.
+    '''
+    if min_speech > 1:
+        # A morphological opening: frames that start a long enough run, grown back over the whole run
+        starts_run = count_active(active, 0, min_speech - 1) == min_speech
+        active = count_active(starts_run, min_speech - 1, 0) > 0
+    if hangover > 0:
+        # A morphological closing: runs grown back by 'hangover' frames, so that they swallow the gaps
+        # before them of up to that length, then shrunk back where nothing was swallowed. Frames past the
+        # start of the track count as grown, not to shrink a run that starts the track.
+        grown = count_active(active, 0, hangover) > 0
+        closed = count_active(~grown, hangover, 0) == 0
+        # Nor is the stretch before a track's first run a gap between runs
+        active = closed & np.logical_or.accumulate(active, axis=1)
+    return active
+
+def speaker_activity(rms, frame_rate):
+    '''
+    Which speaker is speaking in every frame.
+
+    Args:
+    rms (np.ndarray): speakers x frames RMS, ungated, zero padded past the end of shorter tracks.
+    frame_rate (float): Frames per second.
+
+    Returns:
+    active (np.ndarray): speakers x frames booleans.
+    '''
+    rms = np.asarray(rms, dtype=np.float64)
+    if rms.size == 0:
+        return np.zeros(rms.shape, dtype=bool)
+    loudest = rms.max(axis=0)
+    not_bleed = rms > BLEED_RATIO*loudest
+    speech = (rms >= np.maximum(SPEECH_RATIO*noise_floors(rms, frame_rate), MIN_RMS)) & not_bleed
+    active = smooth_activity(speech, int(round(MIN_SPEECH*frame_rate)), int(round(HANGOVER*frame_rate)))
+    # Bridged frames where another speaker has taken over are that speaker's bleed, not this one's speech
+    return active & not_bleed
+
+def gate_activity(rms_matrix, frame_rate):
+    '''
+    Volume of every track of a conversation: its RMS where its speaker is active, 0 elsewhere, as
+    pre_processing.gate_silence would give with a fixed threshold.
+
+    Args:
+    rms_matrix (list): Ungated frame RMS of each track, which may differ in length.
+    frame_rate (float): Frames per second.
+
+    Returns:
+    volume_matrix (list): Gated float64 arrays, one per track.
+    '''
+    lengths = [len(rms) for rms in rms_matrix]
+    rms = np.zeros((len(rms_matrix), max(lengths, default=0)))
+    for i, data in enumerate(rms_matrix):
+        rms[i, :len(data)] = data
+    active = speaker_activity(rms, frame_rate)
+    return [np.where(active[i, :n], rms[i, :n], 0) for i, n in enumerate(lengths)]